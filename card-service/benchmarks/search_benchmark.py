@@ -0,0 +1,216 @@
+"""Compares the trigram name search of the snapshot with the scan fallback of the Search function.
+
+The 30 cards of the integration tests are cloned into a catalog of the requested size, every clone
+gets its own oracle id and a generated name so the catalog has as many distinct names as prints.
+renew_entities ingests the catalog into moto, after which every query runs through both paths.
+
+Read units are estimated the way DynamoDB bills eventually consistent reads: a scan page costs
+0.5 RCU per started 4 KB of scanned data, a BatchGetItem 0.5 RCU per started 4 KB of each item.
+
+Run from the card-service directory, a full catalog takes a few minutes to ingest in moto:
+
+    python -m benchmarks.search_benchmark --cards 90000
+"""
+import argparse
+import importlib
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+import boto3
+import requests_mock
+from moto import mock_dynamodb
+
+# The functions import the shared modules from Lambda layers, the benchmark from the sources of the layers
+SERVICE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(SERVICE_DIRECTORY, "..", "common-service", "layers", "shared"))
+sys.path.append(os.path.join(SERVICE_DIRECTORY, "layers", "cards"))
+
+CARD_TABLE_NAME = "benchmark-card-table"
+CARD_INDEX_TABLE_NAME = "benchmark-card-index-table"
+FIXTURE = "tests/integration/json_test_files/30_cards.json"
+DEFAULT_QUERIES = ["sliver", "arch", "of the", "basil", "urn", "//", "prophet"]
+READ_UNIT_BYTES = 4096
+EVENTUALLY_CONSISTENT_READ_UNIT = 0.5
+SYLLABLES = ["ka", "vor", "eth", "lin", "dra", "mo", "quel", "zan", "tir", "os", "bel", "yth", "gor", "an"]
+
+
+def create_catalog(card_count, seed):
+    with open(FIXTURE, "r", encoding="utf-8") as file:
+        fixture_cards = json.load(file)
+
+    randomizer = random.Random(seed)
+    catalog = []
+    for position in range(card_count):
+        card = json.loads(json.dumps(fixture_cards[position % len(fixture_cards)]))
+        if position >= len(fixture_cards):
+            prefix = "".join(randomizer.choice(SYLLABLES) for _ in range(randomizer.randint(2, 4))).capitalize()
+            card["name"] = f"{prefix} {card['name']}"
+            card["id"] = str(uuid.UUID(int=randomizer.getrandbits(128)))
+            if card.get("layout") == "reversible_card":
+                card["card_faces"][0]["oracle_id"] = str(uuid.UUID(int=randomizer.getrandbits(128)))
+            else:
+                card["oracle_id"] = str(uuid.UUID(int=randomizer.getrandbits(128)))
+        catalog.append(card)
+    return catalog
+
+
+def create_table(dynamodb, table_name):
+    return dynamodb.create_table(
+        TableName=table_name,
+        KeySchema=[
+            {"AttributeName": "PK", "KeyType": "HASH"},
+            {"AttributeName": "SK", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "PK", "AttributeType": "S"},
+            {"AttributeName": "SK", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+def estimate_item_size(item):
+    # Close to the DynamoDB item size, attribute names and values both count
+    return len(json.dumps(item, default=str).encode("utf-8"))
+
+
+def estimate_read_units(size):
+    return math.ceil(size / READ_UNIT_BYTES) * EVENTUALLY_CONSISTENT_READ_UNIT
+
+
+def ingest(catalog):
+    with requests_mock.Mocker() as mocker:
+        mocker.get(
+            "https://api.scryfall.com/bulk-data",
+            json={"data": [{"type": "default_cards", "download_uri": "https://benchmark/default-cards.json"}]},
+        )
+        mocker.get("https://benchmark/default-cards.json", content=json.dumps(catalog).encode("utf-8"))
+
+        import functions.renew_entities.app as renew_entities
+        importlib.reload(renew_entities)
+        renew_entities.lambda_handler(None, None)
+
+
+class MeasuredScanClient:
+    """Passes scans through to the real client and keeps the amount of items they evaluated."""
+
+    def __init__(self, client):
+        self.client = client
+        self.scanned_count = 0
+
+    def scan(self, **kwargs):
+        response = self.client.scan(**kwargs)
+        self.scanned_count += response["ScannedCount"]
+        return response
+
+
+def measure(function, repeats):
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(durations)
+
+
+def run(card_count, queries, limit, repeats, seed):
+    catalog = create_catalog(card_count, seed)
+
+    with tempfile.TemporaryDirectory() as work_directory:
+        os.environ.update({
+            "AWS_ACCESS_KEY_ID": "testing",
+            "AWS_SECRET_ACCESS_KEY": "testing",
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "DISABLE_XRAY": "True",
+            "DYNAMODB_TABLE": CARD_TABLE_NAME,
+            "DYNAMODB_TABLE_NAME": CARD_TABLE_NAME,
+            "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+            "CARDS_UPDATE_FREQUENCY": "1",
+            "CARD_JSON_LOCATION": os.path.join(work_directory, "default-cards.json"),
+            "SEARCH_SNAPSHOT_DIRECTORY": os.path.join(work_directory, "snapshots"),
+            "SEARCH_SCAN_DEADLINE_MS": "600000",
+            # moto ignores scan segments, every segment would read the whole table
+            "SEARCH_SCAN_SEGMENTS": "1",
+        })
+
+        with mock_dynamodb():
+            dynamodb = boto3.resource("dynamodb", "us-east-1")
+            card_table = create_table(dynamodb, CARD_TABLE_NAME)
+            card_index_table = create_table(dynamodb, CARD_INDEX_TABLE_NAME)
+
+            start = time.perf_counter()
+            ingest(catalog)
+            print(f"Ingested {card_count} cards in {time.perf_counter() - start:.1f} s")
+
+            # The prints stand in for every scanned item, the binary manifest shards of ingest have no json size
+            average_item_size = statistics.mean(
+                estimate_item_size(item) for item in scan_all(card_table) if item["SK"].startswith("PrintId#")
+            )
+            # The index search reads one catalog item per oracle instead of the prints
+            catalog_item_sizes = {
+                item["OracleId"]: estimate_item_size(item)
+                for item in scan_all(card_index_table)
+                if item["PK"].startswith("Oracle#")
+            }
+
+            import functions.Search.app as search
+            importlib.reload(search)
+            scan_client = MeasuredScanClient(search.dynamodb_client)
+            search.dynamodb_client = scan_client
+
+            print(f"{'query':<10} {'hits':>5} {'scan ms':>9} {'scan RCU':>9} {'index ms':>9} {'index RCU':>10}")
+            for query in queries:
+                scan_client.scanned_count = 0
+                scan_result, scan_ms = measure(
+                    lambda: search.search_for_querystring(search.collection_table, query, limit=limit), repeats
+                )
+                scanned_size = scan_client.scanned_count / repeats * average_item_size
+                scan_read_units = estimate_read_units(scanned_size)
+
+                index_result, index_ms = measure(
+                    lambda: search.search_card_index(search.card_index_table, query, limit=limit), repeats
+                )
+                # One GetItem for the index meta item, then a BatchGetItem for the page
+                index_read_units = EVENTUALLY_CONSISTENT_READ_UNIT + sum(
+                    estimate_read_units(catalog_item_sizes[item["OracleId"]])
+                    for item in index_result["Items"]
+                )
+
+                print(
+                    f"{query:<10} {len(index_result['Items']):>5} {scan_ms:>9.1f} {scan_read_units:>9.1f} "
+                    f"{index_ms:>9.1f} {index_read_units:>10.1f}"
+                )
+                if len(scan_result["Items"]) > len(index_result["Items"]):
+                    print(f"  the scan found {len(scan_result['Items'])} cards, it also matches the oracle text")
+
+
+def scan_all(table):
+    scan_params = {}
+    while True:
+        response = table.scan(**scan_params)
+        yield from response["Items"]
+        if "LastEvaluatedKey" not in response:
+            return
+        scan_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cards", type=int, default=90000, help="amount of prints in the catalog")
+    parser.add_argument("--limit", type=int, default=40, help="page size of every search")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per query, the median is reported")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("queries", nargs="*", default=DEFAULT_QUERIES)
+    arguments = parser.parse_args()
+    run(arguments.cards, arguments.queries, arguments.limit, arguments.repeats, arguments.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,29 @@
 import boto3
 import logging
 import json
+import math
+import re
+import base64
+import hashlib
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
 
 from jose import jwt
 from aws_xray_sdk.core import patch_all
 from os import environ
 from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key, Attr
+from array import array
+from bisect import bisect_left
+from heapq import nlargest
+from boto3.dynamodb.conditions import Key
+from concurrent.futures import ThreadPoolExecutor
+from http_responses import compress_response
+from card_fields import CARD_FIELDS, KEY_FIELDS, SUMMARY_FIELDS, get_projection, parse_fields, serialize_card
+from card_cache import ResponseCache, SearchIndexMeta, conditional_response, create_cache_headers
 
 if "DISABLE_XRAY" not in environ:
     patch_all()
@@ -16,6 +33,90 @@ logger.setLevel("INFO")
 
 dynamodb = boto3.resource("dynamodb")
 collection_table = dynamodb.Table(environ["DYNAMODB_TABLE"])
+card_index_table = (
+    dynamodb.Table(environ["CARD_INDEX_TABLE_NAME"])
+    if environ.get("CARD_INDEX_TABLE_NAME")
+    else None
+)
+
+s3 = boto3.client("s3")
+SEARCH_SNAPSHOT_BUCKET = environ.get("SEARCH_SNAPSHOT_BUCKET")
+SEARCH_SNAPSHOT_DIRECTORY = environ.get("SEARCH_SNAPSHOT_DIRECTORY")
+SNAPSHOT_DOWNLOAD_DIRECTORY = "/tmp/search-snapshots"
+SNAPSHOT_MAGIC = b"MTGSRCH2"
+SNAPSHOT_HEADER = struct.Struct("<8sI")
+SNAPSHOT_SECTION = struct.Struct("<16sQQ")
+UINT32_ITEMSIZE = array("I").itemsize
+
+# Loaded once per container and kept until renew_entities publishes a new generation
+search_snapshot = None
+# The meta item names the published generation, reading it once in a while is enough to notice a new one
+SEARCH_META_TTL_SECONDS = int(environ.get("SEARCH_META_TTL_SECONDS", "30"))
+search_index_meta = SearchIndexMeta(card_index_table, SEARCH_META_TTL_SECONDS)
+
+# Responses are cached per generation, a new generation makes every cached key unreachable.
+# The in-container cache is an LRU bounded by the size of the cached bodies, the optional shared
+# tier keeps responses in the card index table so other containers can use them as well.
+SEARCH_CACHE_MAX_BYTES = int(environ.get("SEARCH_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+search_cache = ResponseCache("Search", SEARCH_CACHE_MAX_BYTES, body_key="Body")
+SEARCH_SHARED_CACHE = environ.get("SEARCH_SHARED_CACHE", "false").lower() == "true" and card_index_table is not None
+# A DynamoDB item holds at most 400 KB, larger responses are only cached in the container
+SHARED_CACHE_MAX_BYTES = 350_000
+SHARED_CACHE_TTL_SECONDS = 2 * 24 * 60 * 60
+# Responses of the search index carry an ETag of their generation, browsers and a CDN revalidate with it
+CACHE_CONTROL = environ.get("SEARCH_CACHE_CONTROL", "public, max-age=60")
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Scryfall like filters, every filter resolves to filter postings written by renew_entities
+FILTER_PATTERN = re.compile(r"(?<!\S)(c|t|mv|r|s)(<=|>=|:|=|<|>)(\S+)")
+COLOR_BITS = {"w": 1, "u": 2, "b": 4, "r": 8, "g": 16}
+COLOR_MASKS = range(32)
+# Must match renew_entities, higher mana values share the posting list of this one
+MANA_VALUE_LIMIT = 20
+RARITIES = {"c": "common", "u": "uncommon", "r": "rare", "m": "mythic", "s": "special", "b": "bonus"}
+
+# BM25F ranking of snapshot results, a term in the name counts for more than the same term in the oracle text
+BM25_K1 = 1.2
+BM25_B = 0.75
+NAME_WEIGHT = 3.0
+TEXT_WEIGHT = 1.0
+# Added when the name contains the whole query, twice when the name is the query
+NAME_MATCH_BOOST = 2.0
+# "Did you mean" corrections of a search without results, built by renew_entities as a SymSpell deletion dictionary.
+# Short words get a single edit, with two edits they would turn into almost any other short word
+FUZZY_MAX_EDIT_DISTANCE = 2
+FUZZY_PREFIX_LENGTH = 7
+FUZZY_MIN_WORD_LENGTH = 3
+FUZZY_SHORT_WORD_LENGTH = 4
+# Bounds the lookups of a single search, every word costs a few dozen binary searches at most
+FUZZY_MAX_WORDS = 8
+SUGGESTION_LIMIT = 5
+BATCH_GET_ITEM_LIMIT = 100
+DEFAULT_LIMIT = 40
+MAX_LIMIT = BATCH_GET_ITEM_LIMIT
+# Amount of items a single scan call evaluates, keeps the read cost close to the amount of hits needed
+SCAN_PAGE_SIZE = int(environ.get("SEARCH_SCAN_PAGE_SIZE", "1000"))
+# The fallback scan reads the table in parallel segments and gives up on the remaining segments after the deadline
+SCAN_SEGMENTS = int(environ.get("SEARCH_SCAN_SEGMENTS", "4"))
+SCAN_DEADLINE_MS = int(environ.get("SEARCH_SCAN_DEADLINE_MS", "8000"))
+# The pages queue holds a page per segment, a segment waits for the merge before it reads the next page.
+# A waiting segment looks at the stop event this often, it stops once the merge has enough hits.
+SCAN_PUT_POLL_SECONDS = 0.05
+SCAN_FILTER_EXPRESSION = (
+    "contains(LowerCaseOracleName, :search_query) OR contains(CombinedLowercaseOracleText, :search_query)"
+)
+SEGMENT_DONE = "Done"
+
+# Top level attributes that can be requested with fields=. The search index answers with oracle catalog items,
+# the scan fallback with cards. ImageUrl is the image of the most recent print, or of the first face of a card.
+SEARCH_FIELDS = CARD_FIELDS | {"PrintCount", "SetCodes", "Rarities"}
+SEARCH_SUMMARY_FIELDS = [*SUMMARY_FIELDS, "PrintCount"]
+# The snapshot holds these fields, a search that only needs them does not have to read the cards
+SNAPSHOT_FIELDS = {*SEARCH_SUMMARY_FIELDS, *KEY_FIELDS}
+
+# Low level clients are thread safe, so every scan segment shares this one.
+# The client of the resource still converts between python and DynamoDB types.
+dynamodb_client = dynamodb.meta.client
 
 
 def lambda_handler(event, context):
@@ -44,45 +145,912 @@ def lambda_handler(event, context):
     search_query = search_query.casefold()
     logger.info(f"Search_query: {search_query}")
 
-    result = search_for_querystring(
-        table=collection_table,
-        search_query=search_query,
-    )
+    # Filters, limiting and pagination params, a cursor that does not fit the search path is rejected as well
+    try:
+        search_query, filters = parse_filters(search_query)
+        fields = parse_fields(query_string_parameters, SEARCH_FIELDS, SEARCH_SUMMARY_FIELDS)
+        limit_value = parse_limit(query_string_parameters.get("limit"))
+        cursor_value = query_string_parameters.get("cursor")
+        start_key = decode_cursor(cursor_value) if cursor_value else None
+
+        # Results stay valid until renew_entities publishes the next generation of the catalog
+        generation = search_index_meta.get_generation()
+        cache_key = get_cache_key(card_index_table, search_query, filters, fields, limit_value, cursor_value)
+        cached_response = get_cached_response(cache_key)
+        if cached_response is not None:
+            return compress_response(
+                event, conditional_response(event, cached_response, CACHE_CONTROL, "Body", compressed=True), "Body"
+            )
+
+        result = search_card_index(
+            index_table=card_index_table,
+            search_query=search_query,
+            filters=filters,
+            fields=fields,
+            limit=limit_value,
+            start_key=start_key,
+        )
+
+        if result is None:
+            if filters:
+                raise ValueError("filters can only be used once the search index is built")
+            logger.info("Search index not available, falling back to a table scan")
+            # A scan can stop at its deadline, its results are not tied to the generation
+            generation = None
+            result = search_for_querystring(
+                table=collection_table,
+                search_query=search_query,
+                fields=fields,
+                limit=limit_value,
+                start_key=start_key,
+            )
+    except ValueError as e:
+        logger.info(f"Invalid search parameters: {e}")
+        return {
+            "headers": {
+                "Content-Type": "application/json",
+            },
+            "statusCode": 400,
+            "Body": json.dumps({"message": str(e)}),
+        }
 
     logger.info(f"Query success: {result}")
-    items = result["Items"]
+    items = [serialize_result(item, fields) for item in result["Items"]]
     logger.info(f"All of the items returned: {items}")
 
-    if not items:
+    # An empty follow-up page or a scan that ran out of time is a valid answer,
+    # only a complete first page reports that nothing matched
+    if not items and start_key is None and result["LastKey"] is None:
         logger.info("No items found")
-        return {
+        response = {
             "headers": {
                 "Content-Type": "application/json",
             },
             "statusCode": 404,
-            "Body": json.dumps({"message": "Not found"}),
+            "Body": json.dumps(
+                {
+                    "message": "Not found",
+                    "suggestions": get_search_suggestions(card_index_table, search_query, filters),
+                }
+            ),
         }
+    else:
+        response = {
+            "headers": {
+                "Content-Type": "application/json",
+            },
+            "statusCode": 200,
+            "Body": json.dumps(
+                {
+                    "Items": items,
+                    "cursor": encode_cursor(result["LastKey"]) if result["LastKey"] else None,
+                }
+            ),
+        }
+        response["headers"].update(create_cache_headers(generation, response["Body"], CACHE_CONTROL))
 
-    return {
-        "headers": {
-            "Content-Type": "application/json",
-        },
-        "statusCode": 200,
-        "Body": json.dumps({"Items": items}),
-    }
+    # A scan can stop at its deadline, only the results of the index are cached under its generation
+    if generation is not None:
+        cache_response(cache_key, response)
+    return compress_response(
+        event, conditional_response(event, response, CACHE_CONTROL, "Body", compressed=True), "Body"
+    )
+
+
+def serialize_result(item, fields):
+    card = serialize_card(item, fields)
+    if "Score" in item:
+        card["Score"] = item["Score"]
+    return card
+
+
+def parse_limit(limit_value):
+    if limit_value is None:
+        return DEFAULT_LIMIT
+
+    try:
+        limit = int(limit_value)
+    except ValueError:
+        raise ValueError("limit must be a number")
+
+    if limit < 1 or limit > MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+
+def parse_filters(search_query):
+    """Splits the filters off the search query.
+
+    Every filter becomes a group of filter terms, a card passes the filter when it has a posting
+    for any term of the group. Returns the remaining search text and the groups.
+    """
+    filters = []
+    for name, operator, value in FILTER_PATTERN.findall(search_query):
+        if name == "c":
+            filters.append(get_color_terms(operator, value))
+        elif name == "mv":
+            filters.append(get_mana_value_terms(operator, value))
+        elif operator not in (":", "="):
+            raise ValueError(f"{name} filter only supports ':'")
+        elif name == "t":
+            filters.extend([f"t:{type_token}"] for type_token in tokenize(value))
+        elif name == "r":
+            filters.append([f"r:{RARITIES.get(value, value)}"])
+        else:
+            filters.append([f"s:{value}"])
+
+    search_text = " ".join(FILTER_PATTERN.sub("", search_query).split())
+    return search_text, filters
+
+
+def get_color_terms(operator, value):
+    if value == "c":
+        # Colorless, whatever the operator
+        return ["c:0"]
+    if any(color not in COLOR_BITS for color in value):
+        raise ValueError(f"'{value}' is not a combination of the colors wubrg")
+
+    colors = sum(COLOR_BITS[color] for color in set(value))
+    superset = [mask for mask in COLOR_MASKS if mask & colors == colors]
+    subset = [mask for mask in COLOR_MASKS if mask & ~colors == 0]
+    masks = {
+        ":": superset,
+        ">=": superset,
+        ">": [mask for mask in superset if mask != colors],
+        "=": [colors],
+        "<=": subset,
+        "<": [mask for mask in subset if mask != colors],
+    }[operator]
+    return [f"c:{mask}" for mask in masks]
+
+
+def get_mana_value_terms(operator, value):
+    if not value.isdigit():
+        raise ValueError(f"mana value '{value}' must be a number")
+
+    mana_value = min(int(value), MANA_VALUE_LIMIT)
+    mana_values = {
+        ":": [mana_value],
+        "=": [mana_value],
+        "<": range(0, mana_value),
+        "<=": range(0, mana_value + 1),
+        ">": range(mana_value + 1, MANA_VALUE_LIMIT + 1),
+        ">=": range(mana_value, MANA_VALUE_LIMIT + 1),
+    }[operator]
+    return [f"mv:{mana_value}" for mana_value in mana_values]
+
+
+def encode_cursor(last_key):
+    cursor = json.dumps(last_key)
+    return base64.urlsafe_b64encode(cursor.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        last_key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("cursor is invalid")
+
+    if not isinstance(last_key, dict):
+        raise ValueError("cursor is invalid")
+    return last_key
+
+
+def get_segment_states(start_key, total_segments):
+    if start_key is None:
+        return [None] * total_segments
+
+    segment_states = start_key.get("Segments")
+    if not isinstance(segment_states, list) or len(segment_states) != total_segments:
+        raise ValueError("cursor is invalid")
+    return segment_states
 
 
-def search_for_querystring(table, search_query):
+def scan_segment(table_name, search_query, fields, segment, total_segments, start_key, pages, stop_scanning):
+    """Scans one segment page by page and hands every page to the merging thread through the pages queue."""
+    scan_params = {
+        "TableName": table_name,
+        "FilterExpression": SCAN_FILTER_EXPRESSION,
+        "ExpressionAttributeValues": {":search_query": search_query},
+        "Segment": segment,
+        "TotalSegments": total_segments,
+        "Limit": SCAN_PAGE_SIZE,
+        "ReturnConsumedCapacity": "TOTAL",
+    }
+    if fields is not None:
+        scan_params.update(get_projection(fields, KEY_FIELDS))
+    if start_key is not None:
+        scan_params["ExclusiveStartKey"] = start_key
+
+    started_at = time.monotonic()
+    page_count = 0
+    scanned_count = 0
+    consumed_capacity = 0.0
     try:
-        return table.scan(
-            FilterExpression=Attr("LowerCaseOracleName").contains(search_query)
-            | Attr("CombinedLowercaseOracleText").contains(search_query)
-            | Attr("LowerCaseOracleName").contains(search_query)
-            & Attr("CombinedLowercaseOracleText").contains(search_query),
+        while not stop_scanning.is_set():
+            response = dynamodb_client.scan(**scan_params)
+            page_count += 1
+            scanned_count += response.get("ScannedCount", 0)
+            consumed_capacity += response.get("ConsumedCapacity", {}).get("CapacityUnits", 0.0)
+
+            last_evaluated_key = response.get("LastEvaluatedKey")
+            if not put_page(pages, (segment, response.get("Items", []), last_evaluated_key), stop_scanning):
+                break
+
+            if last_evaluated_key is None:
+                break
+            scan_params["ExclusiveStartKey"] = last_evaluated_key
+    except Exception as e:
+        logger.error(f"Error occured while scanning segment {segment}, { e }")
+        put_page(pages, (segment, e, None), stop_scanning)
+    finally:
+        logger.info(
+            f"Scan segment {segment + 1}/{total_segments} read {page_count} pages and {scanned_count} items "
+            f"in {(time.monotonic() - started_at) * 1000:.0f} ms, consumed {consumed_capacity} read capacity units"
         )
+
+
+def put_page(pages, page, stop_scanning):
+    """Waits for room in the pages queue, False when the merge stopped before there was any."""
+    while not stop_scanning.is_set():
+        try:
+            pages.put(page, timeout=SCAN_PUT_POLL_SECONDS)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def search_for_querystring(table, search_query, fields=None, limit=DEFAULT_LIMIT, start_key=None):
+    """Parallel scan fallback for when the search index can not answer the query.
+
+    Every segment runs on its own thread, their pages are merged as they arrive until the limit
+    or the deadline is reached. The cursor keeps the position of each segment.
+    """
+    segment_states = get_segment_states(start_key, SCAN_SEGMENTS)
+    deadline = time.monotonic() + SCAN_DEADLINE_MS / 1000
+    pages = queue.Queue(maxsize=SCAN_SEGMENTS)
+    stop_scanning = threading.Event()
+
+    executor = ThreadPoolExecutor(max_workers=SCAN_SEGMENTS)
+    running_segments = 0
+    for segment, segment_state in enumerate(segment_states):
+        if segment_state != SEGMENT_DONE:
+            executor.submit(
+                scan_segment, table.name, search_query, fields, segment, SCAN_SEGMENTS, segment_state, pages,
+                stop_scanning,
+            )
+            running_segments += 1
+
+    items = []
+    seen_keys = set()
+    try:
+        while running_segments and len(items) < limit:
+            try:
+                segment, page_items, last_evaluated_key = pages.get(timeout=deadline - time.monotonic())
+            except (queue.Empty, ValueError):
+                # A negative timeout raises a ValueError, the deadline already passed in that case
+                logger.info(f"Scan deadline of {SCAN_DEADLINE_MS} ms reached with {running_segments} segments left")
+                break
+
+            if isinstance(page_items, Exception):
+                raise page_items
+
+            for index, item in enumerate(page_items):
+                key = (item["PK"], item["SK"])
+                if key in seen_keys:
+                    continue
+                seen_keys.add(key)
+                item.pop("RemoveAt", None)
+                items.append(item)
+
+                if len(items) == limit and index < len(page_items) - 1:
+                    # The rest of this page is not returned, the segment resumes right after this item
+                    segment_states[segment] = {"PK": item["PK"], "SK": item["SK"]}
+                    break
+            else:
+                segment_states[segment] = last_evaluated_key or SEGMENT_DONE
+                if last_evaluated_key is None:
+                    running_segments -= 1
     except ClientError as e:
         logger.error(f"ClientError occured while scanning, { e }")
         raise
-    except:
-        logger.error(f"Error occured while scanning, { e }")
+    finally:
+        stop_scanning.set()
+        executor.shutdown(wait=False)
+
+    if all(segment_state == SEGMENT_DONE for segment_state in segment_states):
+        return {"Items": items, "LastKey": None}
+    return {"Items": items, "LastKey": {"Segments": segment_states}}
+
+
+def tokenize(text):
+    return set(TOKEN_PATTERN.findall(text.casefold()))
+
+
+def get_cache_key(index_table, search_query, filters, fields, limit, cursor):
+    """Normalized key of a search, None when there is no generation to tie the cached result to."""
+    if index_table is None:
+        return None
+    meta = search_index_meta.get_item()
+    if meta is None:
+        return None
+
+    normalized_filters = sorted(sorted(filter_terms) for filter_terms in filters)
+    normalized_fields = sorted(fields) if fields is not None else None
+    return json.dumps([meta["Generation"], search_query, normalized_filters, normalized_fields, limit, cursor])
+
+
+def get_cached_response(cache_key):
+    if cache_key is None:
+        return None
+
+    response = search_cache.get(cache_key)
+    if response is not None:
+        return response
+
+    response = get_shared_cached_response(cache_key)
+    if response is not None:
+        logger.info(f"Shared search cache hit for {cache_key}")
+        search_cache.put(cache_key, response)
+    return response
+
+
+def cache_response(cache_key, response):
+    if cache_key is None:
+        return
+
+    search_cache.put(cache_key, response)
+    put_shared_cached_response(cache_key, response)
+
+
+def get_shared_cache_item_key(cache_key):
+    generation = json.loads(cache_key)[0]
+    return {
+        "PK": f"SearchCache#{generation}",
+        "SK": hashlib.sha256(cache_key.encode("utf-8")).hexdigest(),
+    }
+
+
+def get_shared_cached_response(cache_key):
+    if not SEARCH_SHARED_CACHE:
+        return None
+
+    try:
+        item = card_index_table.get_item(Key=get_shared_cache_item_key(cache_key)).get("Item")
+    except ClientError as e:
+        # The shared cache is an optimization, the search itself can still answer
+        logger.warning(f"ClientError occured while reading the shared search cache, { e }")
+        return None
+
+    if item is None:
+        return None
+    headers = {"Content-Type": "application/json"}
+    if "ETag" in item:
+        headers.update({"ETag": item["ETag"], "Cache-Control": CACHE_CONTROL})
+    return {
+        "headers": headers,
+        "statusCode": int(item["StatusCode"]),
+        "Body": item["Body"],
+    }
+
+
+def put_shared_cached_response(cache_key, response):
+    if not SEARCH_SHARED_CACHE or len(response["Body"]) > SHARED_CACHE_MAX_BYTES:
+        return
+
+    try:
+        card_index_table.put_item(
+            Item={
+                **get_shared_cache_item_key(cache_key),
+                "StatusCode": response["statusCode"],
+                "Body": response["Body"],
+                **({"ETag": response["headers"]["ETag"]} if "ETag" in response["headers"] else {}),
+                "RemoveAt": int(time.time()) + SHARED_CACHE_TTL_SECONDS,
+            }
+        )
+    except ClientError as e:
+        logger.warning(f"ClientError occured while writing the shared search cache, { e }")
+
+
+def get_snapshot_path(snapshot_key):
+    if SEARCH_SNAPSHOT_BUCKET:
+        snapshot_path = os.path.join(SNAPSHOT_DOWNLOAD_DIRECTORY, os.path.basename(snapshot_key))
+        if not os.path.exists(snapshot_path):
+            os.makedirs(SNAPSHOT_DOWNLOAD_DIRECTORY, exist_ok=True)
+            # Snapshots of older generations are no longer needed, /tmp space is limited
+            for file_name in os.listdir(SNAPSHOT_DOWNLOAD_DIRECTORY):
+                os.remove(os.path.join(SNAPSHOT_DOWNLOAD_DIRECTORY, file_name))
+            s3.download_file(SEARCH_SNAPSHOT_BUCKET, snapshot_key, snapshot_path)
+        return snapshot_path
+    if SEARCH_SNAPSHOT_DIRECTORY:
+        return os.path.join(SEARCH_SNAPSHOT_DIRECTORY, snapshot_key)
+    return None
+
+
+def load_search_snapshot(snapshot_path):
+    with open(snapshot_path, "rb") as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, section_count = SNAPSHOT_HEADER.unpack_from(buffer, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"'{snapshot_path}' is not a search snapshot of this version")
+
+    sections = {}
+    view = memoryview(buffer)
+    for section_number in range(section_count):
+        name, offset, length = SNAPSHOT_SECTION.unpack_from(
+            buffer, SNAPSHOT_HEADER.size + section_number * SNAPSHOT_SECTION.size
+        )
+        name = name.rstrip(b"\0").decode("ascii")
+        section = view[offset:offset + length]
+        # The ".s" sections hold the utf-8 data of string tables, all other sections are arrays
+        sections[name] = section if name.endswith(".s") else section.cast("I")
+
+    return sections
+
+
+def get_search_snapshot(meta):
+    """Returns the in-memory snapshot of the published generation, or None when there is none to load."""
+    global search_snapshot
+
+    snapshot_key = meta.get("SnapshotKey")
+    if snapshot_key is None:
+        return None
+    if search_snapshot is not None and search_snapshot["Generation"] == meta["Generation"]:
+        return search_snapshot
+
+    snapshot_path = get_snapshot_path(snapshot_key)
+    if snapshot_path is None:
+        return None
+
+    started_at = time.monotonic()
+    try:
+        sections = load_search_snapshot(snapshot_path)
+    except ValueError as e:
+        # A snapshot written by an older renew_entities, the index in DynamoDB answers until the next run
+        logger.warning(f"Ignoring search snapshot '{snapshot_key}': {e}")
+        return None
+
+    search_snapshot = {
+        "Generation": meta["Generation"],
+        "Sections": sections,
+        "AverageNameLength": get_average(sections["docs.nlen"]),
+        "AverageTextLength": get_average(sections["docs.tlen"]),
+    }
+    logger.info(
+        f"Loaded search snapshot '{snapshot_key}' in {(time.monotonic() - started_at) * 1000:.0f} ms"
+    )
+    return search_snapshot
+
+
+def get_average(lengths):
+    return sum(lengths) / len(lengths) if len(lengths) and sum(lengths) else 1
+
+
+def get_snapshot_string(sections, table_name, index):
+    offsets = sections[f"{table_name}.o"]
+    return bytes(sections[f"{table_name}.s"][offsets[index]:offsets[index + 1]]).decode("utf-8")
+
+
+def find_snapshot_string(sections, table_name, value, after=False):
+    """Binary search over a sorted string table.
+
+    Returns the position of the first string that is not smaller than the value,
+    or with after=True the position of the first string that is larger.
+    """
+    low = 0
+    high = len(sections[f"{table_name}.o"]) - 1
+    while low < high:
+        middle = (low + high) // 2
+        middle_value = get_snapshot_string(sections, table_name, middle)
+        if middle_value < value or (after and middle_value == value):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def get_snapshot_postings(sections, term):
+    term_index = find_snapshot_string(sections, "terms", term)
+    if term_index == len(sections["terms.o"]) - 1 or get_snapshot_string(sections, "terms", term_index) != term:
+        return None
+
+    offsets = sections["postings.o"]
+    start, end = offsets[term_index], offsets[term_index + 1]
+    return sections["postings.docs"][start:end], sections["postings.tf"][start:end]
+
+
+def get_trigrams(text):
+    return {text[position:position + 3] for position in range(len(text) - 2)}
+
+
+def get_snapshot_trigram_postings(sections, trigram):
+    trigram_index = find_snapshot_string(sections, "trigrams", trigram)
+    if trigram_index == len(sections["trigrams.o"]) - 1 or get_snapshot_string(sections, "trigrams", trigram_index) != trigram:
+        return None
+
+    offsets = sections["trigrams.post.o"]
+    return sections["trigrams.post"][offsets[trigram_index]:offsets[trigram_index + 1]]
+
+
+def search_snapshot_names(sections, search_query):
+    """Finds the documents whose name contains the search query.
+
+    The trigram postings give the candidates, the substring check on the name verifies them.
+    Queries shorter than a trigram have to check every name.
+    """
+    trigram_postings = []
+    for trigram in get_trigrams(search_query):
+        postings = get_snapshot_trigram_postings(sections, trigram)
+        if postings is None:
+            return []
+        trigram_postings.append(postings)
+
+    if trigram_postings:
+        trigram_postings.sort(key=len)
+        shortest, others = trigram_postings[0], trigram_postings[1:]
+        candidates = (
+            document_id for document_id in shortest
+            if all(contains_document(postings, document_id) for postings in others)
+        )
+    else:
+        candidates = range(len(sections["docs.name.o"]) - 1)
+
+    return [
+        document_id for document_id in candidates
+        if search_query in get_snapshot_string(sections, "docs.name", document_id).lower()
+    ]
+
+
+def search_snapshot_terms(term_postings):
+    """Finds the documents that contain every term in their name or oracle text."""
+    if not term_postings or None in term_postings.values():
+        return []
+
+    # Walk the shortest posting list and look the candidates up in the others
+    documents = sorted((postings for postings, _ in term_postings.values()), key=len)
+    shortest, others = documents[0], documents[1:]
+    return [
+        document_id for document_id in shortest
+        if all(contains_document(postings, document_id) for postings in others)
+    ]
+
+
+def contains_document(postings, document_id):
+    position = bisect_left(postings, document_id)
+    return position < len(postings) and postings[position] == document_id
+
+
+def score_document(snapshot, search_query, term_postings, name_matches, document_id):
+    """BM25F score of a document, the name and oracle text frequencies are weighted before saturation."""
+    sections = snapshot["Sections"]
+    document_count = len(sections["docs.nlen"])
+    name_norm = 1 - BM25_B + BM25_B * sections["docs.nlen"][document_id] / snapshot["AverageNameLength"]
+    text_norm = 1 - BM25_B + BM25_B * sections["docs.tlen"][document_id] / snapshot["AverageTextLength"]
+
+    score = 0.0
+    for postings in term_postings.values():
+        if postings is None:
+            continue
+        documents, frequencies = postings
+        position = bisect_left(documents, document_id)
+        if position == len(documents) or documents[position] != document_id:
+            continue
+
+        frequency = frequencies[position]
+        weighted_frequency = NAME_WEIGHT * (frequency >> 16) / name_norm + TEXT_WEIGHT * (frequency & 0xFFFF) / text_norm
+        inverse_document_frequency = math.log(1 + (document_count - len(documents) + 0.5) / (len(documents) + 0.5))
+        score += inverse_document_frequency * weighted_frequency * (BM25_K1 + 1) / (weighted_frequency + BM25_K1)
+
+    if document_id in name_matches:
+        score += NAME_MATCH_BOOST
+        if get_snapshot_string(sections, "docs.name", document_id).lower() == search_query:
+            score += NAME_MATCH_BOOST
+    return score
+
+
+def get_snapshot_filter_postings(sections, filter_terms):
+    # The union of the postings of all terms of the filter
+    postings = [get_snapshot_postings(sections, term) for term in filter_terms]
+    documents = [term_postings[0] for term_postings in postings if term_postings is not None]
+    if len(documents) == 1:
+        return documents[0]
+    return sorted(set().union(*documents))
+
+
+def search_snapshot_filters(sections, filters, candidates):
+    """Keeps the candidates that pass every filter, all documents when there are no candidates to start from."""
+    # Cheapest first, the smallest filter decides how many candidates are left to check
+    filter_postings = sorted((get_snapshot_filter_postings(sections, filter_terms) for filter_terms in filters), key=len)
+    if candidates is None:
+        candidates, filter_postings = filter_postings[0], filter_postings[1:]
+    return [
+        document_id for document_id in candidates
+        if all(contains_document(postings, document_id) for postings in filter_postings)
+    ]
+
+
+def get_snapshot_oracles(sections, document_ids):
+    oracles = []
+    for document_id in document_ids:
+        oracle_id = get_snapshot_string(sections, "docs.posting", document_id)
+        oracles.append({
+            **key_from_posting(oracle_id),
+            "OracleId": oracle_id,
+            "PrintId": get_snapshot_string(sections, "docs.print", document_id),
+            "OracleName": get_snapshot_string(sections, "docs.name", document_id),
+            "SetName": get_snapshot_string(sections, "docs.set", document_id),
+            "Price": get_snapshot_string(sections, "docs.price", document_id),
+            "ImageUrl": get_snapshot_string(sections, "docs.image", document_id),
+            "PrintCount": sections["docs.prints"][document_id],
+        })
+    return oracles
+
+
+def search_snapshot_index(snapshot, search_query, terms, filters, fields, limit, start_key):
+    """Answers the search fully in memory, only the cards of the returned page are read from DynamoDB.
+
+    A card matches when its name contains the search query, like the scan does,
+    or when all terms of the query appear in its name or oracle text. It also has to pass every filter.
+    The matches are ranked by score, a bounded heap keeps only the ones up to the requested page.
+    """
+    sections = snapshot["Sections"]
+    term_postings = {term: get_snapshot_postings(sections, term) for term in terms}
+    name_matches = set(search_snapshot_names(sections, search_query)) if search_query else set()
+    matches = name_matches.union(search_snapshot_terms(term_postings)) if search_query else None
+    if filters:
+        matches = search_snapshot_filters(sections, filters, matches)
+
+    offset = 0
+    if start_key is not None:
+        offset = start_key.get("Offset")
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError("cursor is invalid")
+
+    # Ties are broken on the document id, so every page sees the same order
+    scored = nlargest(
+        offset + limit + 1,
+        ((score_document(snapshot, search_query, term_postings, name_matches, document_id), -document_id)
+         for document_id in matches),
+    )
+    page = scored[offset:offset + limit]
+
+    page_postings = [get_snapshot_string(sections, "docs.posting", -negated_id) for _, negated_id in page]
+    scores = {posting: score for posting, (score, _) in zip(page_postings, page)}
+    if fields is not None and SNAPSHOT_FIELDS.issuperset(fields):
+        items = get_snapshot_oracles(sections, [-negated_id for _, negated_id in page])
+    else:
+        items = get_oracles_by_postings(page_postings, fields)
+    for item in items:
+        item["Score"] = round(scores[posting_from_key(item)], 4)
+    last_key = {"Offset": offset + limit} if len(scored) > offset + limit else None
+
+    return {"Items": items, "LastKey": last_key}
+
+
+def get_deletes(word, max_distance):
+    """Every string that is left after removing up to max_distance characters from the word, the word included."""
+    deletes = {word}
+    edge = {word}
+    for _ in range(max_distance):
+        edge = {value[:position] + value[position + 1:] for value in edge for position in range(len(value))}
+        deletes.update(edge)
+    return deletes
+
+
+def get_edit_distance(source, target, max_distance):
+    """Optimal string alignment distance, a swap of two neighbouring characters counts as a single edit.
+
+    Returns max_distance + 1 as soon as the distance is known to be larger than max_distance.
+    """
+    if abs(len(source) - len(target)) > max_distance:
+        return max_distance + 1
+
+    before_previous_row = None
+    row = list(range(len(target) + 1))
+    for source_position in range(1, len(source) + 1):
+        previous_row, row = row, [source_position] + [0] * len(target)
+        for target_position in range(1, len(target) + 1):
+            cost = source[source_position - 1] != target[target_position - 1]
+            row[target_position] = min(
+                previous_row[target_position] + 1,
+                row[target_position - 1] + 1,
+                previous_row[target_position - 1] + cost,
+            )
+            if (
+                source_position > 1 and target_position > 1
+                and source[source_position - 1] == target[target_position - 2]
+                and source[source_position - 2] == target[target_position - 1]
+            ):
+                row[target_position] = min(row[target_position], before_previous_row[target_position - 2] + 1)
+        if min(row) > max_distance:
+            return max_distance + 1
+        before_previous_row = previous_row
+    return row[-1]
+
+
+def correct_snapshot_word(sections, word):
+    """Returns the name word closest to the word, on a tie the word that most names use. None without one in reach."""
+    max_distance = 1 if len(word) <= FUZZY_SHORT_WORD_LENGTH else FUZZY_MAX_EDIT_DISTANCE
+    offsets = sections["fuzzy.post.o"]
+
+    candidates = set()
+    for delete in get_deletes(word[:FUZZY_PREFIX_LENGTH], max_distance):
+        delete_index = find_snapshot_string(sections, "fuzzy.deletes", delete)
+        if delete_index < len(offsets) - 1 and get_snapshot_string(sections, "fuzzy.deletes", delete_index) == delete:
+            candidates.update(sections["fuzzy.post"][offsets[delete_index]:offsets[delete_index + 1]])
+
+    best = None
+    for word_id in candidates:
+        candidate = get_snapshot_string(sections, "fuzzy.words", word_id)
+        distance = get_edit_distance(word, candidate, max_distance)
+        if distance <= max_distance:
+            ranking = (distance, -sections["fuzzy.counts"][word_id], candidate)
+            best = ranking if best is None else min(best, ranking)
+    return best[2] if best is not None else None
+
+
+def get_snapshot_suggestions(snapshot, search_query, filters):
+    """Replaces the words that no name contains with the closest name word and searches again."""
+    sections = snapshot["Sections"]
+    # Snapshots written before the deletion dictionary existed can not correct anything
+    if "fuzzy.words.o" not in sections:
+        return []
+
+    words = TOKEN_PATTERN.findall(search_query)[:FUZZY_MAX_WORDS]
+    corrected_words = []
+    for word in words:
+        word_index = find_snapshot_string(sections, "fuzzy.words", word)
+        is_name_word = (
+            word_index < len(sections["fuzzy.words.o"]) - 1
+            and get_snapshot_string(sections, "fuzzy.words", word_index) == word
+        )
+        if len(word) < FUZZY_MIN_WORD_LENGTH or is_name_word:
+            corrected_words.append(word)
+        else:
+            corrected_words.append(correct_snapshot_word(sections, word) or word)
+    if corrected_words == words:
+        return []
+
+    corrected_query = " ".join(corrected_words)
+    result = search_snapshot_index(
+        snapshot, corrected_query, set(corrected_words), filters, ["OracleName"], SUGGESTION_LIMIT, None
+    )
+    return [item["OracleName"] for item in result["Items"]]
+
+
+def get_search_suggestions(index_table, search_query, filters):
+    """Did you mean names for a search without results, empty when there is no snapshot to correct the query with."""
+    if index_table is None or not search_query:
+        return []
+    meta = search_index_meta.get_item()
+    snapshot = get_search_snapshot(meta) if meta is not None else None
+    if snapshot is None:
+        return []
+    return get_snapshot_suggestions(snapshot, search_query, filters)
+
+
+def get_postings(index_table, term, generation):
+    query_params = {
+        "KeyConditionExpression": Key("PK").eq(f"Token#{term}")
+        & Key("SK").begins_with(f"Generation#{generation}#"),
+        "ProjectionExpression": "Postings",
+    }
+
+    postings = set()
+    try:
+        while True:
+            response = index_table.query(**query_params)
+            for item in response.get("Items", []):
+                postings.update(item["Postings"].split())
+
+            if "LastEvaluatedKey" not in response:
+                return postings
+            query_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    except ClientError as e:
+        logger.error(f"ClientError occured while querying postings, { e }")
         raise
+
+
+def get_oracles_by_postings(postings, fields=None):
+    """Reads the catalog items of the oracles, the prints of an oracle are available through get_cards."""
+    keys = [key_from_posting(posting) for posting in postings]
+    projection = get_projection(fields, KEY_FIELDS, top_level_image_url=True) if fields is not None else {}
+
+    found_items = {}
+    for chunk_start in range(0, len(keys), BATCH_GET_ITEM_LIMIT):
+        request_items = {
+            card_index_table.name: {"Keys": keys[chunk_start:chunk_start + BATCH_GET_ITEM_LIMIT], **projection}
+        }
+        try:
+            while request_items:
+                response = dynamodb.batch_get_item(RequestItems=request_items)
+                for item in response["Responses"].get(card_index_table.name, []):
+                    found_items[(item["PK"], item["SK"])] = item
+                request_items = response.get("UnprocessedKeys")
+        except ClientError as e:
+            logger.error(f"ClientError occured while fetching oracles, { e }")
+            raise
+
+    # Keep the order of the postings, items that expired in the meantime are skipped
+    items = []
+    for key in keys:
+        item = found_items.get((key["PK"], key["SK"]))
+        if item is not None:
+            item.pop("RemoveAt", None)
+            if "PrintCount" in item:
+                item["PrintCount"] = int(item["PrintCount"])
+            items.append(item)
+    return items
+
+
+def search_card_index(index_table, search_query, filters=(), fields=None, limit=DEFAULT_LIMIT, start_key=None):
+    """Answers the search with the token and filter postings written by renew_entities.
+
+    Returns None when the index can not answer the query, so the caller can fall back to a scan. Without the
+    snapshot the postings only match whole words, a query without any matching word may still be part of one.
+    """
+    if index_table is None:
+        return None
+    if not search_query and not filters:
+        return {"Items": [], "LastKey": None}
+
+    terms = tokenize(search_query)
+
+    meta = search_index_meta.get_item()
+    if meta is None:
+        return None
+
+    generation = meta["Generation"]
+    snapshot = get_search_snapshot(meta)
+    if snapshot is not None:
+        logger.info(f"Searching snapshot of generation {generation} for '{search_query}'")
+        return search_snapshot_index(snapshot, search_query, terms, filters, fields, limit, start_key)
+
+    # Without the snapshot a query needs terms, a name substring can only be found by the scan
+    if not terms and (search_query or not filters):
+        return None
+
+    logger.info(f"Searching index generation {generation} for terms {terms} and filters {filters}")
+
+    matches = None
+    # Longer terms tend to be rarer, starting with them keeps the intersection small
+    for term in sorted(terms, key=len, reverse=True):
+        term_postings = get_postings(index_table, term, generation)
+        matches = term_postings if matches is None else matches & term_postings
+        if not matches:
+            # The scan finds the cards that contain the query as a part of a word, it can not apply filters
+            return None if not filters else {"Items": [], "LastKey": None}
+
+    filter_postings = [
+        set().union(*(get_postings(index_table, term, generation) for term in filter_terms))
+        for filter_terms in filters
+    ]
+    # Cheapest first, every intersection can only shrink the candidates
+    for postings in sorted(filter_postings, key=len):
+        matches = postings if matches is None else matches & postings
+        if not matches:
+            return {"Items": [], "LastKey": None}
+
+    matches = sorted(matches)
+    if start_key is not None:
+        # Postings are sorted, so the next page starts right after the posting of the last returned card
+        if "PK" not in start_key or "SK" not in start_key:
+            raise ValueError("cursor is invalid")
+        last_posting = posting_from_key(start_key)
+        matches = [posting for posting in matches if posting > last_posting]
+
+    page = matches[:limit]
+    items = get_oracles_by_postings(page, fields)
+    last_key = key_from_posting(page[-1]) if len(matches) > limit else None
+
+    return {"Items": items, "LastKey": last_key}
+
+
+def posting_from_key(key):
+    return key["PK"].removeprefix("Oracle#")
+
+
+def key_from_posting(posting):
+    return {"PK": f"Oracle#{posting}", "SK": "Catalog"}
@@ -0,0 +1,74 @@
+import json
+import logging
+import boto3
+from os import environ
+from aws_xray_sdk.core import patch_all
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+if 'DISABLE_XRAY' not in environ:
+    patch_all()
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel("INFO")
+dynamodb = boto3.resource('dynamodb')
+table = dynamodb.Table(environ['CARD_INDEX_TABLE_NAME'])
+
+# Must match the prefix length renew_entities partitions the names by
+NAME_PREFIX_LENGTH = 2
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 25
+
+
+def lambda_handler(event, context):
+    query_string_parameters = event.get("queryStringParameters") or {}
+    prefix = str.lower(query_string_parameters.get("prefix") or "")
+
+    try:
+        limit = parse_limit(query_string_parameters.get("limit"))
+    except ValueError as e:
+        return bad_request(str(e))
+
+    if len(prefix) < NAME_PREFIX_LENGTH:
+        return bad_request(f"prefix must be at least {NAME_PREFIX_LENGTH} characters")
+
+    try:
+        # Names are sorted within their partition, the first items are the top names for this prefix
+        response = table.query(
+            KeyConditionExpression=Key('PK').eq(f"NamePrefix#{prefix[:NAME_PREFIX_LENGTH]}")
+            & Key('SK').begins_with(f"Name#{prefix}"),
+            ProjectionExpression="OracleName, OracleId",
+            Limit=limit,
+        )
+    except ClientError as e:
+        LOGGER.error(f"Error while fetching names: {e}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"Message": "Server error while fetching names."})
+        }
+
+    return {
+        "statusCode": 200,
+        "body": json.dumps({"Items": response["Items"]})
+    }
+
+
+def parse_limit(limit_value):
+    if limit_value is None:
+        return DEFAULT_LIMIT
+
+    try:
+        limit = int(limit_value)
+    except ValueError:
+        raise ValueError("limit must be a number")
+
+    if limit < 1 or limit > MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+
+def bad_request(message):
+    return {
+        "statusCode": 400,
+        "body": json.dumps({"Message": message})
+    }
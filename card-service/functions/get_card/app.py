@@ -4,6 +4,8 @@ import boto3
 from os import environ
 from aws_xray_sdk.core import patch_all
 from botocore.exceptions import ClientError
+from card_fields import get_projection, parse_fields, serialize_card
+from card_cache import ResponseCache, SearchIndexMeta, conditional_response, create_cache_headers
 
 if 'DISABLE_XRAY' not in environ:
     patch_all()
@@ -12,6 +14,22 @@ LOGGER = logging.getLogger()
 LOGGER.setLevel("INFO")
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(environ['DYNAMODB_TABLE_NAME'])
+# The meta item of the search index names the generation of the last ingest
+card_index_table = dynamodb.Table(environ['CARD_INDEX_TABLE_NAME']) if environ.get('CARD_INDEX_TABLE_NAME') else None
+
+# Cards only change when renew_entities runs, responses are cached per generation in an LRU bounded by
+# the size of their bodies. Not found responses expire sooner, the card can show up with the next ingest.
+CATALOG_META_TTL_SECONDS = int(environ.get("CATALOG_META_TTL_SECONDS", "30"))
+CARD_CACHE_MAX_BYTES = int(environ.get("CARD_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+CARD_CACHE_TTL_SECONDS = int(environ.get("CARD_CACHE_TTL_SECONDS", "3600"))
+NOT_FOUND_CACHE_TTL_SECONDS = int(environ.get("NOT_FOUND_CACHE_TTL_SECONDS", "60"))
+# Sent with every card response, browsers and a CDN revalidate with If-None-Match once it runs out
+CACHE_CONTROL = environ.get("CARD_CACHE_CONTROL", "public, max-age=300")
+catalog_meta = SearchIndexMeta(card_index_table, CATALOG_META_TTL_SECONDS)
+card_cache = ResponseCache(
+    "Card", CARD_CACHE_MAX_BYTES, ttl_seconds=CARD_CACHE_TTL_SECONDS,
+    status_ttl_seconds={404: NOT_FOUND_CACHE_TTL_SECONDS}
+)
 
 
 def lambda_handler(event, context):
@@ -20,19 +38,26 @@ def lambda_handler(event, context):
     card_oracle_id = event["pathParameters"]["oracle_id"]
     card_print_id = event["pathParameters"]["print_id"]
 
+    try:
+        fields = parse_fields(event.get("queryStringParameters"))
+    except ValueError as e:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"Message": str(e)})
+        }
+
+    generation = catalog_meta.get_generation()
+    cache_key = get_cache_key(generation, card_oracle_id, card_print_id, fields)
+    cached_response = card_cache.get(cache_key)
+    if cached_response is not None:
+        return conditional_response(event, cached_response, CACHE_CONTROL)
+
+    get_item_params = get_projection(fields) if fields is not None else {}
     try:
         response = table.get_item(Key={
             'PK': f'OracleId#{card_oracle_id}',
             'SK': f'PrintId#{card_print_id}'
-        })
-
-        if "Item" not in response:
-            return {
-                "statusCode": 404,
-                "body": json.dumps({
-                    "Message": "Card not found."
-                })
-            }
+        }, **get_item_params)
 
     except ClientError as e:
         LOGGER.error(f"Error while fetching card: {e}")
@@ -41,12 +66,31 @@ def lambda_handler(event, context):
             "body": json.dumps({"Message": "Server error while fetching card."})
         }
 
+    if "Item" not in response:
+        not_found_response = {
+            "statusCode": 404,
+            "body": json.dumps({
+                "Message": "Card not found."
+            })
+        }
+        card_cache.put(cache_key, not_found_response)
+        return not_found_response
+
     item = response["Item"]
     item.pop('RemoveAt', None)
 
     LOGGER.info(f'items to be returned: {item}')
 
-    return {
+    body = json.dumps(serialize_card(item, fields))
+    card_response = {
         "statusCode": 200,
-        "body": json.dumps(item)
+        "headers": create_cache_headers(generation, body, CACHE_CONTROL),
+        "body": body
     }
+    card_cache.put(cache_key, card_response)
+    return conditional_response(event, card_response, CACHE_CONTROL)
+
+
+def get_cache_key(generation, oracle_id, print_id, fields):
+    # A new generation makes every cached key unreachable, the LRU evicts them over time
+    return json.dumps([generation, oracle_id, print_id, sorted(fields) if fields is not None else None])
@@ -1,10 +1,14 @@
 import json
+import math
 import logging
 import boto3
 from os import environ
 from aws_xray_sdk.core import patch_all
 from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
+from http_responses import compress_response
+from card_fields import get_projection, parse_fields, serialize_card
+from card_cache import ResponseCache, SearchIndexMeta, conditional_response, create_cache_headers
 
 if 'DISABLE_XRAY' not in environ:
     patch_all()
@@ -13,24 +17,55 @@ LOGGER = logging.getLogger()
 LOGGER.setLevel("INFO")
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(environ['DYNAMODB_TABLE_NAME'])
+# The meta item of the search index names the generation of the last ingest
+card_index_table = dynamodb.Table(environ['CARD_INDEX_TABLE_NAME']) if environ.get('CARD_INDEX_TABLE_NAME') else None
+
+# renew_entities keeps a summary item per oracle that points at these prints
+SELECTED_PRINTS = {"latest": "LatestPrintId", "cheapest": "CheapestPrintId"}
+
+# Cards only change when renew_entities runs, responses are cached per generation in an LRU bounded by
+# the size of their bodies. Not found responses expire sooner, the card can show up with the next ingest.
+CATALOG_META_TTL_SECONDS = int(environ.get("CATALOG_META_TTL_SECONDS", "30"))
+CARD_CACHE_MAX_BYTES = int(environ.get("CARD_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+CARD_CACHE_TTL_SECONDS = int(environ.get("CARD_CACHE_TTL_SECONDS", "3600"))
+NOT_FOUND_CACHE_TTL_SECONDS = int(environ.get("NOT_FOUND_CACHE_TTL_SECONDS", "60"))
+# Sent with every card response, browsers and a CDN revalidate with If-None-Match once it runs out
+CACHE_CONTROL = environ.get("CARD_CACHE_CONTROL", "public, max-age=300")
+catalog_meta = SearchIndexMeta(card_index_table, CATALOG_META_TTL_SECONDS)
+card_cache = ResponseCache(
+    "Card", CARD_CACHE_MAX_BYTES, ttl_seconds=CARD_CACHE_TTL_SECONDS,
+    status_ttl_seconds={404: NOT_FOUND_CACHE_TTL_SECONDS}
+)
 
 
 def lambda_handler(event, context):
     oracleId = event["pathParameters"]["oracle_id"]
 
     try:
-        response = table.query(
-            KeyConditionExpression=Key('PK').eq(f"OracleId#{oracleId}"),
-        )
-        items = response["Items"]
+        fields = parse_fields(event.get("queryStringParameters"))
+        select = parse_select(event.get("queryStringParameters"))
+    except ValueError as e:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"Message": str(e)})
+        }
 
-        if len(items) == 0:
-            return {
-                "statusCode": 404,
-                "body": json.dumps({
-                    "Message": "Card not found."
-                })
-            }
+    generation = catalog_meta.get_generation()
+    cache_key = get_cache_key(generation, oracleId, select, fields)
+    cached_response = card_cache.get(cache_key)
+    if cached_response is not None:
+        return compress_response(event, conditional_response(event, cached_response, CACHE_CONTROL, compressed=True))
+
+    query_params = get_projection(fields) if fields is not None else {}
+    try:
+        if select is not None:
+            items = get_selected_print(oracleId, select, query_params)
+        else:
+            response = table.query(
+                KeyConditionExpression=Key('PK').eq(f"OracleId#{oracleId}") & Key('SK').begins_with("PrintId#"),
+                **query_params
+            )
+            items = response["Items"]
 
     except ClientError as e:
         LOGGER.error(f"Error while fetching card: {e}")
@@ -39,12 +74,64 @@ def lambda_handler(event, context):
             "body": json.dumps({"Message": "Server error while fetching card."})
         }
 
+    if len(items) == 0:
+        not_found_response = {
+            "statusCode": 404,
+            "body": json.dumps({
+                "Message": "Card not found."
+            })
+        }
+        card_cache.put(cache_key, not_found_response)
+        return not_found_response
+
     LOGGER.info(f'items to be returned: {items}')
 
     for item in items:
         item.pop('RemoveAt', None)
 
-    return {
+    body = json.dumps({"Items": [serialize_card(item, fields) for item in items]})
+    cards_response = {
         "statusCode": 200,
-        "body": json.dumps({"Items": items})
+        "headers": create_cache_headers(generation, body, CACHE_CONTROL),
+        "body": body
     }
+    card_cache.put(cache_key, cards_response)
+    return compress_response(event, conditional_response(event, cards_response, CACHE_CONTROL, compressed=True))
+
+
+def get_cache_key(generation, oracle_id, select, fields):
+    # A new generation makes every cached key unreachable, the LRU evicts them over time
+    return json.dumps([generation, oracle_id, select, sorted(fields) if fields is not None else None])
+
+
+def parse_select(query_string_parameters):
+    select = (query_string_parameters or {}).get("select")
+    if select is not None and select not in SELECTED_PRINTS:
+        raise ValueError(f"select '{select}' does not exist, use 'latest' or 'cheapest'")
+    return select
+
+
+def get_selected_print(oracle_id, select, get_item_params):
+    """Returns the selected print as the only item, or no items when the oracle does not exist."""
+    summary = table.get_item(
+        Key={'PK': f"OracleId#{oracle_id}", 'SK': "Summary"},
+        ProjectionExpression=SELECTED_PRINTS[select]
+    ).get("Item")
+    if summary is not None:
+        response = table.get_item(
+            Key={'PK': f"OracleId#{oracle_id}", 'SK': f"PrintId#{summary[SELECTED_PRINTS[select]]}"},
+            **get_item_params
+        )
+        return [response["Item"]] if "Item" in response else []
+
+    # Cards written before the summary items existed, the prints are compared here instead
+    response = table.query(
+        KeyConditionExpression=Key('PK').eq(f"OracleId#{oracle_id}") & Key('SK').begins_with("PrintId#")
+    )
+    if not response["Items"]:
+        return []
+    if select == "latest":
+        selected = max(response["Items"], key=lambda item: item["ReleasedAt"])
+    else:
+        selected = min(response["Items"], key=lambda item: float(item["Price"]) or math.inf)
+    return [selected]
@@ -0,0 +1,194 @@
+import json
+import logging
+import random
+import time
+import boto3
+from os import environ
+from concurrent.futures import ThreadPoolExecutor
+from aws_xray_sdk.core import patch_all
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from http_responses import compress_response
+from card_fields import KEY_FIELDS, get_projection, parse_fields, serialize_card
+
+if 'DISABLE_XRAY' not in environ:
+    patch_all()
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel("INFO")
+dynamodb = boto3.resource('dynamodb')
+# The client is thread safe, the chunks of a batch are read in parallel
+dynamodb_client = dynamodb.meta.client
+table = dynamodb.Table(environ['DYNAMODB_TABLE_NAME'])
+
+LATEST_PRINT = "latest"
+MAX_BATCH_KEYS = 300
+BATCH_GET_ITEM_LIMIT = 100
+BATCH_WORKERS = 4
+# UnprocessedKeys are retried with exponential backoff and full jitter, keys left after the last retry are returned
+MAX_BATCH_RETRIES = 5
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_MAX_SECONDS = 1.0
+
+
+def lambda_handler(event, context):
+    LOGGER.info("Starting get cards batch lambda")
+
+    try:
+        fields = parse_fields(event.get("queryStringParameters"))
+        keys = parse_keys(event.get("body"))
+    except ValueError as e:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"Message": str(e)})
+        }
+
+    try:
+        latest_oracle_ids = {oracle_id for oracle_id, print_id in keys if print_id == LATEST_PRINT}
+        latest_prints = get_latest_prints(latest_oracle_ids) if latest_oracle_ids else {}
+        card_keys = [
+            (oracle_id, latest_prints.get(oracle_id) if print_id == LATEST_PRINT else print_id)
+            for oracle_id, print_id in keys
+        ]
+        cards, unprocessed_keys = get_cards_by_keys(
+            [card_key for card_key in dict.fromkeys(card_keys) if card_key[1] is not None], fields
+        )
+    except ClientError as e:
+        LOGGER.error(f"Error while fetching cards: {e}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"Message": "Server error while fetching cards."})
+        }
+
+    # Items follow the order of the requested keys, a key without a card gets null
+    items = [serialize_card(cards[card_key], fields) if card_key in cards else None for card_key in card_keys]
+    LOGGER.info(f"Found {len(cards)} cards for {len(keys)} keys, {len(unprocessed_keys)} keys left unprocessed")
+
+    return compress_response(event, {
+        "statusCode": 200,
+        "body": json.dumps({
+            "Items": items,
+            "UnprocessedKeys": [
+                {"OracleId": oracle_id, "PrintId": print_id}
+                for (oracle_id, print_id), card_key in zip(keys, card_keys)
+                if card_key in unprocessed_keys
+            ]
+        })
+    })
+
+
+def parse_keys(body):
+    """Returns the requested (oracle id, print id) keys in request order, the print id can be 'latest'."""
+    try:
+        request = json.loads(body or "")
+    except json.JSONDecodeError:
+        raise ValueError("body should be a json object with Keys")
+
+    keys = request.get("Keys") if isinstance(request, dict) else None
+    if not isinstance(keys, list) or not keys:
+        raise ValueError("Keys should be a non empty list")
+    if len(keys) > MAX_BATCH_KEYS:
+        raise ValueError(f"at most {MAX_BATCH_KEYS} keys can be requested at once")
+
+    parsed_keys = []
+    for key in keys:
+        if not isinstance(key, dict) or not isinstance(key.get("OracleId"), str) or not key["OracleId"]:
+            raise ValueError("every key needs an OracleId")
+        print_id = key.get("PrintId", LATEST_PRINT)
+        if not isinstance(print_id, str) or not print_id:
+            raise ValueError("PrintId should be a print id or 'latest'")
+        parsed_keys.append((key["OracleId"], print_id))
+    return parsed_keys
+
+
+def get_latest_prints(oracle_ids):
+    """Maps the oracle ids to the print id of their most recent print.
+
+    The summary items that renew_entities writes per oracle point at the most recent print,
+    the prints of oracles without a summary item are queried.
+    """
+    summary_keys = [{"PK": f"OracleId#{oracle_id}", "SK": "Summary"} for oracle_id in oracle_ids]
+    summary_items, _ = batch_get_items(
+        table.name, summary_keys,
+        {"ProjectionExpression": "PK, SK, OracleId, LatestPrintId"}
+    )
+    latest_prints = {item["OracleId"]: item["LatestPrintId"] for item in summary_items.values()}
+
+    missing_oracle_ids = [oracle_id for oracle_id in oracle_ids if oracle_id not in latest_prints]
+    if missing_oracle_ids:
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+            for oracle_id, print_id in zip(missing_oracle_ids, executor.map(query_latest_print, missing_oracle_ids)):
+                if print_id is not None:
+                    latest_prints[oracle_id] = print_id
+    return latest_prints
+
+
+def query_latest_print(oracle_id):
+    query_params = {
+        "TableName": table.name,
+        "KeyConditionExpression": Key('PK').eq(f"OracleId#{oracle_id}") & Key('SK').begins_with("PrintId#"),
+        "ProjectionExpression": "PrintId, ReleasedAt",
+    }
+    latest = None
+    while True:
+        response = dynamodb_client.query(**query_params)
+        for item in response["Items"]:
+            if latest is None or item["ReleasedAt"] > latest["ReleasedAt"]:
+                latest = item
+        if "LastEvaluatedKey" not in response:
+            return latest["PrintId"] if latest is not None else None
+        query_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def get_cards_by_keys(card_keys, fields):
+    """Reads the cards of the (oracle id, print id) keys, returns the found cards and the keys left unprocessed."""
+    projection = get_projection(fields, KEY_FIELDS) if fields is not None else {}
+    items, unprocessed_keys = batch_get_items(
+        table.name,
+        [{"PK": f"OracleId#{oracle_id}", "SK": f"PrintId#{print_id}"} for oracle_id, print_id in card_keys],
+        projection
+    )
+
+    cards = {}
+    for (partition_key, sort_key), item in items.items():
+        item.pop('RemoveAt', None)
+        cards[(partition_key.removeprefix("OracleId#"), sort_key.removeprefix("PrintId#"))] = item
+    return cards, {
+        (key["PK"].removeprefix("OracleId#"), key["SK"].removeprefix("PrintId#")) for key in unprocessed_keys
+    }
+
+
+def batch_get_items(table_name, keys, projection):
+    """BatchGetItem over chunks of at most 100 keys, the chunks are read in parallel.
+
+    Returns the found items by their (PK, SK) and the keys that were still unprocessed after the last retry.
+    """
+    chunks = [keys[start:start + BATCH_GET_ITEM_LIMIT] for start in range(0, len(keys), BATCH_GET_ITEM_LIMIT)]
+    items = {}
+    unprocessed_keys = []
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+        for chunk_items, chunk_unprocessed_keys in executor.map(
+            lambda chunk: batch_get_chunk(table_name, chunk, projection), chunks
+        ):
+            items.update(chunk_items)
+            unprocessed_keys.extend(chunk_unprocessed_keys)
+    return items, unprocessed_keys
+
+
+def batch_get_chunk(table_name, keys, projection):
+    request_items = {table_name: {"Keys": keys, **projection}}
+    items = {}
+    for attempt in range(MAX_BATCH_RETRIES + 1):
+        response = dynamodb_client.batch_get_item(RequestItems=request_items)
+        for item in response["Responses"].get(table_name, []):
+            items[(item["PK"], item["SK"])] = item
+
+        request_items = response.get("UnprocessedKeys")
+        if not request_items:
+            return items, []
+        if attempt < MAX_BATCH_RETRIES:
+            time.sleep(random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)))
+
+    unprocessed_keys = request_items[table_name]["Keys"]
+    LOGGER.warning(f"{len(unprocessed_keys)} keys of {table_name} were still unprocessed after {MAX_BATCH_RETRIES} retries")
+    return items, unprocessed_keys
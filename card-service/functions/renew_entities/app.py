@@ -1,27 +1,172 @@
+import hashlib
+import json
+import math
+import multiprocessing
+import gzip
 import os
+import queue
+import re
+import struct
+import sys
+import threading
 import time
+import tracemalloc
+import uuid
+from array import array
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from itertools import chain, islice
 from os import environ
 from aws_xray_sdk.core import patch_all
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
 import boto3
 import logging
 import requests
 import ijson
+from write_rate import BATCH_WRITE_ITEM_LIMIT, WriteRateController, write_batch
+
+try:
+    # Only on Unix, the peak RSS is left out of the metrics elsewhere
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    # The C backend parses the bulk file several times faster than the pure python one
+    ijson_backend = ijson.get_backend("yajl2_c")
+except ImportError:
+    ijson_backend = ijson
 
 if 'DISABLE_XRAY' not in environ:
     patch_all()
 
 dynamodb = boto3.resource('dynamodb', 'us-east-1')
+# The client is thread safe, the writer threads of the pipeline share it
+dynamodb_client = dynamodb.meta.client
+write_controllers = {}
 DYNAMODB_TABLE_NAME = os.getenv("DYNAMODB_TABLE_NAME")
 update_frequency_days = os.getenv("CARDS_UPDATE_FREQUENCY")
 
 table = dynamodb.Table(DYNAMODB_TABLE_NAME)
 
+CARD_INDEX_TABLE_NAME = os.getenv("CARD_INDEX_TABLE_NAME")
+card_index_table = dynamodb.Table(CARD_INDEX_TABLE_NAME) if CARD_INDEX_TABLE_NAME else None
+
 event_bus = boto3.client('events')
+s3 = boto3.client('s3')
+lambda_client = boto3.client('lambda')
+SEARCH_SNAPSHOT_BUCKET = os.getenv("SEARCH_SNAPSHOT_BUCKET")
+SEARCH_SNAPSHOT_DIRECTORY = os.getenv("SEARCH_SNAPSHOT_DIRECTORY")
 logger = logging.getLogger()
 logger.setLevel("INFO")
 
 ttlOffSetSecs = (3 * 60 * 60)
-local_filename = os.getenv("CARD_JSON_LOCATION", "/tmp/default-cards.json")
+# Without a location the bulk file is parsed while it downloads, the tests keep a local copy to parse instead
+local_filename = os.getenv("CARD_JSON_LOCATION")
+# tracemalloc slows the ingest down, the peak memory is only measured on request
+INGEST_TRACE_MEMORY = os.getenv("INGEST_TRACE_MEMORY", "false").lower() == "true"
+# In Lambda the metrics of an invocation are printed as a CloudWatch Embedded Metric Format line,
+# elsewhere they are logged as a text report
+EMIT_EMBEDDED_METRICS = "AWS_LAMBDA_FUNCTION_NAME" in environ
+METRICS_NAMESPACE = "CardService/Ingest"
+INGEST_STAGES = ("Download", "Parse", "Transform", "WriteWait", "Finish")
+BATCH_LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500)
+
+EMBEDDED_METRICS_HANDLER_NAME = "embedded-metrics"
+
+
+def is_embedded_metrics(record):
+    return getattr(record, "embedded_metrics", False)
+
+
+def skip_embedded_metrics(record):
+    return not is_embedded_metrics(record)
+
+
+if EMIT_EMBEDDED_METRICS:
+    # EMF lines have to be plain json, the handler of the Lambda runtime prefixes every message of the logger.
+    # A handler of their own prints the metrics records as they are, the other handlers skip them.
+    for handler in list(logger.handlers):
+        if handler.get_name() == EMBEDDED_METRICS_HANDLER_NAME:
+            logger.removeHandler(handler)
+        elif all(getattr(existing, "__name__", None) != "skip_embedded_metrics" for existing in handler.filters):
+            handler.addFilter(skip_embedded_metrics)
+    metrics_handler = logging.StreamHandler(sys.stdout)
+    metrics_handler.set_name(EMBEDDED_METRICS_HANDLER_NAME)
+    metrics_handler.setFormatter(logging.Formatter("%(message)s"))
+    metrics_handler.addFilter(is_embedded_metrics)
+    logger.addHandler(metrics_handler)
+
+# Parsing feeds batches of prints into a bounded queue that writer threads drain, when DynamoDB is the
+# bottleneck the queue fills up and the parser waits for the writers
+INGEST_WRITER_THREADS = int(os.getenv("INGEST_WRITER_THREADS", "4"))
+WRITE_QUEUE_BATCHES = 64
+# Writes are paced by a WriteRateController per table, WRITE_CAPACITY_BUDGET caps it in write units per second
+WRITE_CAPACITY_BUDGET = int(os.getenv("WRITE_CAPACITY_BUDGET", "0")) or None
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# A single DynamoDB item can hold at most 400 KB, long posting lists are split over multiple shards
+MAX_POSTINGS_SHARD_BYTES = 350_000
+TERM_FREQUENCY_MAX = 0xFFFF
+
+# Filters of the search endpoint are postings as well, their terms contain a ':' so they never clash with words
+COLOR_BITS = {'W': 1, 'U': 2, 'B': 4, 'R': 8, 'G': 16}
+MANA_SYMBOL_PATTERN = re.compile(r"\{([^}]+)\}")
+# Mana values from here on share one posting list, only a few joke cards go beyond it
+MANA_VALUE_LIMIT = 20
+
+# Autocomplete reads all names starting with the same characters from a single partition
+NAME_PREFIX_LENGTH = 2
+
+# Misspelled searches are corrected with a SymSpell deletion dictionary over the words of the names.
+# Only the deletes of a word prefix are stored, the search function checks the full words afterwards
+FUZZY_MAX_EDIT_DISTANCE = 2
+FUZZY_PREFIX_LENGTH = 7
+
+# The search snapshot is a header followed by named sections, so the search function can memory map it.
+# Every section is an array of unsigned 32 bit integers, except the ".s" sections that hold the utf-8 data
+# of a string table. The matching ".o" section holds the offsets of the strings in that data.
+SNAPSHOT_MAGIC = b"MTGSRCH2"
+SNAPSHOT_HEADER = struct.Struct("<8sI")
+SNAPSHOT_SECTION = struct.Struct("<16sQQ")
+SNAPSHOT_ALIGNMENT = 8
+
+# Ingest only writes the prints and summaries whose content changed since the last run, written items have no
+# RemoveAt anymore. The manifest holds the content hash of every item, items that left the bulk file get a RemoveAt.
+# It is a header followed by the prints and then the oracles, Scryfall ids are UUIDs and are stored as their bytes.
+MANIFEST_PK = "IngestManifest"
+MANIFEST_MAGIC = b"MTGMANI1"
+MANIFEST_HEADER = struct.Struct("<8sII")
+MANIFEST_PRINT = struct.Struct("<16s16s8s")
+MANIFEST_ORACLE = struct.Struct("<16s8s")
+MANIFEST_SHARD_BYTES = 350_000
+CONTENT_HASH_BYTES = 8
+# A dry run reports the difference with the last ingest and writes nothing, it lists this many ids per change
+DRY_RUN_SAMPLE_SIZE = 25
+
+# Ingest checkpoints the cards it has written together with its state, which is kept next to the search snapshots.
+# When the invocation is about to time out it invokes itself with a continuation event, a crashed run is picked up
+# by the next one that reads the same bulk file. Cards before the checkpoint are parsed again but not processed.
+CHECKPOINT_PK = "IngestCheckpoint"
+CHECKPOINT_INTERVAL_CARDS = int(os.getenv("INGEST_CHECKPOINT_INTERVAL_CARDS", "10000"))
+# Time left for flushing the writers, saving the state and invoking the continuation
+CHECKPOINT_MARGIN_MS = int(os.getenv("INGEST_CHECKPOINT_MARGIN_MS", "60000"))
+CHECKPOINT_TTL_SECONDS = 24 * 60 * 60
+# The finish runs in phases, when the time is nearly up before a phase it continues from there in a new invocation
+FINISH_PHASES = ("Summaries", "SearchIndex", "Manifest")
+
+# A sharded ingest has a coordinator that splits the bulk file in shards of INGEST_SHARD_CARDS cards, which it keeps
+# next to the checkpoints. Every shard is a job for a worker invocation of this function, which writes the prints of
+# its shard. The worker that completes the last shard claims the finish, merges the results of all shards into a
+# checkpoint and hands the finish to a continuation. A claim lasts until the deadline of the claiming invocation.
+# INGEST_LOCAL_WORKERS runs the workers in a process pool instead, 1 runs them one after the other in the coordinator.
+# The coordinator splits the whole bulk file in a single invocation without checkpoints, so sharding is off by default.
+SHARDS_PK = "IngestShards"
+INGEST_SHARD_CARDS = int(os.getenv("INGEST_SHARD_CARDS", "0"))
+INGEST_LOCAL_WORKERS = int(os.getenv("INGEST_LOCAL_WORKERS", "0"))
+# Claim of a worker without a deadline, the longest a Lambda invocation can run
+FINISH_CLAIM_SECONDS = 900
 
 
 def turnCardIntoFaceItem(card):
@@ -67,13 +212,30 @@ def createCardInfo(card, oracle_id):
             "Price": card['prices']['eur'],
             "OracleId": oracle_id,
             "PrintId": card['id'],
-            "LowerCaseOracleName": str.lower(card.get('name', ''))
+            "LowerCaseOracleName": str.lower(card.get('name', '')),
+            "SetCode": card.get('set', ''),
+            "ColorIdentity": card.get('color_identity', []),
+            "ManaCost": getManaCostFromCard(card),
+            "TypeTokens": sorted(set(TOKEN_PATTERN.findall(str.lower(getTypeLineFromCard(card)))))
         }
     except Exception as error:
         logger.error(f"An error has occurred while processing card: \n{card}\n "
                      f"Error: \n {error}")
 
 
+def getManaCostFromCard(card):
+    # Split cards have the cost of both halves on the card, double faced cards only on their faces
+    if 'mana_cost' in card:
+        return card['mana_cost']
+    return (card.get('card_faces') or [{}])[0].get('mana_cost', '')
+
+
+def getTypeLineFromCard(card):
+    if 'type_line' in card:
+        return card['type_line']
+    return ' // '.join(face.get('type_line', '') for face in card.get('card_faces', []))
+
+
 def getOracleFromCard(card):
     if card.get('layout', '') == 'reversible_card':
         return card['card_faces'][0]['oracle_id']
@@ -88,14 +250,20 @@ def getCombinedLowerCaseOracleText(faces):
     return loweredText
 
 
-# Can only handle 25 items at a time!
+# Writes in batches of 25 items, paced by the controller of the table
 def writeBatchToDb(items, table, ttl):
-    with table.batch_writer() as batch:
-        for item in items:
+    controller = get_write_controller(table.name)
+    batch = []
+    for item in items:
+        # Without a ttl the item stays until ingest retires it
+        if ttl is not None:
             item['RemoveAt'] = ttl
-            response = batch.put_item(
-                Item=item
-            )
+        batch.append(item)
+        if len(batch) == BATCH_WRITE_ITEM_LIMIT:
+            write_batch(controller, batch)
+            batch = []
+    if batch:
+        write_batch(controller, batch)
 
 
 def calculateTTL(offsetInSeconds, update_frequency_days):
@@ -103,15 +271,124 @@ def calculateTTL(offsetInSeconds, update_frequency_days):
     return currentEpochInSeconds + offsetInSeconds + int(update_frequency_days) * 24 * 60 * 60
 
 
-def cutTheListAndPersist(item_list, ttl):
-    if len(item_list) < 25:
-        return item_list
+def get_write_controller(table_name):
+    controller = write_controllers.get(table_name)
+    if controller is None:
+        controller = write_controllers[table_name] = WriteRateController(dynamodb_client, table_name, WRITE_CAPACITY_BUDGET)
+    return controller
+
+
+def log_write_summaries():
+    for controller in write_controllers.values():
+        controller.log_summary()
+
+
+class BatchWritePipeline:
+    """Writes items in batches of 25 from a pool of writer threads, put only blocks while the queue is full.
+
+    The writers share the rate controller of the table, so together they stay within its rate.
+    """
+
+    def __init__(self, table_name, writer_count):
+        self.controller = get_write_controller(table_name)
+        self.writer_count = writer_count
+        self.batches = queue.Queue(maxsize=WRITE_QUEUE_BATCHES)
+        self.pending = []
+        self.lock = threading.Lock()
+        self.error = None
+        self.closed = False
+        self.started_at = time.perf_counter()
+        self.stats = {"Items": 0, "Batches": 0, "BlockedPuts": 0, "BlockedSeconds": 0.0, "MaxQueuedBatches": 0}
+        self.writers = [threading.Thread(target=self.write_batches, daemon=True) for _ in range(writer_count)]
+        for writer in self.writers:
+            writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # An error of the ingest itself wins over an error of the writers
+        try:
+            self.close()
+        except Exception:
+            if exc_type is None:
+                raise
+            logger.exception("Error while closing the writers of a failed ingest")
+
+    def put(self, item):
+        if self.error is not None:
+            raise self.error
+        self.pending.append(item)
+        if len(self.pending) == BATCH_WRITE_ITEM_LIMIT:
+            self.enqueue(self.pending)
+            self.pending = []
+
+    def enqueue(self, batch):
+        if self.batches.full():
+            # Backpressure, the writers do not keep up with the parser
+            started_at = time.perf_counter()
+            self.batches.put(batch)
+            blocked_seconds = time.perf_counter() - started_at
+            self.stats["BlockedPuts"] += 1
+            self.stats["BlockedSeconds"] += blocked_seconds
+            ingest_metrics.add_seconds("WriteWait", blocked_seconds)
+        else:
+            self.batches.put(batch)
+        self.stats["MaxQueuedBatches"] = max(self.stats["MaxQueuedBatches"], self.batches.qsize())
+
+    def flush(self):
+        """Waits until every item that was put is written, raises the first error of a writer."""
+        if self.pending:
+            self.enqueue(self.pending)
+            self.pending = []
+        with ingest_metrics.timer("WriteWait"):
+            self.batches.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """Writes the remaining items and waits for the writers, raises the first error of a writer."""
+        if self.closed:
+            return self.stats
+        self.closed = True
+        if self.pending:
+            self.enqueue(self.pending)
+            self.pending = []
+        for _ in self.writers:
+            self.batches.put(None)
+        for writer in self.writers:
+            writer.join()
 
-    to_be_persisted = item_list[:25]
-    to_be_continued = item_list[25:]
+        elapsed = time.perf_counter() - self.started_at
+        self.stats["Seconds"] = round(elapsed, 3)
+        self.stats["ItemsPerSecond"] = round(self.stats["Items"] / elapsed, 1) if elapsed > 0 else 0.0
+        logger.info(
+            f"Wrote {self.stats['Items']} items in {elapsed:.1f} s ({self.stats['ItemsPerSecond']} items/s) "
+            f"with {self.writer_count} writers, the parser waited {self.stats['BlockedSeconds']:.1f} s on "
+            f"{self.stats['BlockedPuts']} full queue puts"
+        )
+        if self.error is not None:
+            raise self.error
+        return self.stats
 
-    writeBatchToDb(to_be_persisted, table, ttl)
-    return to_be_continued
+    def write_batches(self):
+        while True:
+            batch = self.batches.get()
+            try:
+                if batch is None:
+                    return
+                if self.error is not None:
+                    # Keeps draining so the parser never waits on a queue that nobody empties
+                    continue
+                write_batch(self.controller, batch)
+                with self.lock:
+                    self.stats["Items"] += len(batch)
+                    self.stats["Batches"] += 1
+            except Exception as error:
+                logger.error(f"Error while writing a batch of {len(batch)} items: {error}")
+                self.error = error
+            finally:
+                self.batches.task_done()
 
 
 def countPersistedItems(amount):
@@ -145,9 +422,959 @@ def is_image_uri_missing(card):
         return False
 
 
-def lambda_handler(event, context):
+def create_generation_id():
+    return time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+
+
+def add_print_to_catalog(catalog, card_info):
+    """Reduces the prints of an oracle to a single catalog entry, the most recent print represents the oracle."""
+    oracle = catalog.get(card_info['OracleId'])
+    if oracle is None:
+        oracle = catalog[card_info['OracleId']] = {
+            "OracleId": card_info['OracleId'],
+            "OracleName": card_info['OracleName'],
+            "LowerCaseOracleName": card_info['LowerCaseOracleName'],
+            "CombinedLowercaseOracleText": card_info['CombinedLowercaseOracleText'],
+            "ColorIdentity": card_info['ColorIdentity'],
+            "ManaCost": card_info['ManaCost'],
+            "TypeTokens": card_info['TypeTokens'],
+            "PrintCount": 0,
+            "SetCodes": set(),
+            "Rarities": set(),
+            "ReleasedAt": ""
+        }
+
+    oracle['PrintCount'] += 1
+    oracle['SetCodes'].add(str.lower(card_info['SetCode']))
+    oracle['Rarities'].add(str.lower(card_info['Rarity']))
+    oracle['FirstReleasedAt'] = min(oracle.get('FirstReleasedAt', card_info['ReleasedAt']), card_info['ReleasedAt'])
+    # Prints without a price are stored with a price of 0.00, they only count as cheapest when no print has a price
+    price = parse_price(card_info['Price'])
+    cheapest_price = oracle.get('CheapestPrice')
+    if cheapest_price is None or (price or math.inf) < (parse_price(cheapest_price) or math.inf):
+        oracle.update({"CheapestPrintId": card_info['PrintId'], "CheapestPrice": card_info['Price']})
+    if card_info['ReleasedAt'] >= oracle['ReleasedAt']:
+        card_faces = card_info.get('CardFaces') or [{}]
+        oracle.update({
+            "PrintId": card_info['PrintId'],
+            "SetName": card_info['SetName'],
+            "Price": card_info['Price'],
+            "ReleasedAt": card_info['ReleasedAt'],
+            "ImageUrl": card_faces[0].get('ImageUrl', '')
+        })
+
+
+def parse_price(price):
+    try:
+        return float(price)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def create_summary_item(oracle):
+    # Lives next to the prints of the oracle, so picking a default print is a GetItem instead of a Query
+    return {
+        "PK": f"OracleId#{oracle['OracleId']}",
+        "SK": "Summary",
+        "OracleId": oracle['OracleId'],
+        "OracleName": oracle['OracleName'],
+        "LatestPrintId": oracle['PrintId'],
+        "LatestReleasedAt": oracle['ReleasedAt'],
+        "CheapestPrintId": oracle['CheapestPrintId'],
+        "CheapestPrice": oracle['CheapestPrice'],
+        "FirstReleasedAt": oracle['FirstReleasedAt'],
+        "PrintCount": oracle['PrintCount'],
+        "SetCodes": sorted(oracle['SetCodes'])
+    }
+
+
+def get_content_hash(item):
+    content = json.dumps(item, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=CONTENT_HASH_BYTES).digest()
+
+
+def serialize_ingest_manifest(print_hashes, oracle_hashes):
+    """print_hashes maps a PrintId to its OracleId and content hash, oracle_hashes an OracleId to the hash of its summary."""
+    manifest = bytearray(MANIFEST_HEADER.pack(MANIFEST_MAGIC, len(print_hashes), len(oracle_hashes)))
+    for print_id, (oracle_id, content_hash) in print_hashes.items():
+        manifest += MANIFEST_PRINT.pack(uuid.UUID(print_id).bytes, uuid.UUID(oracle_id).bytes, content_hash)
+    for oracle_id, content_hash in oracle_hashes.items():
+        manifest += MANIFEST_ORACLE.pack(uuid.UUID(oracle_id).bytes, content_hash)
+    return bytes(manifest)
+
+
+def deserialize_ingest_manifest(manifest):
+    magic, print_count, oracle_count = MANIFEST_HEADER.unpack_from(manifest)
+    if magic != MANIFEST_MAGIC:
+        raise ValueError(f"unknown ingest manifest format {magic!r}")
+
+    prints_end = MANIFEST_HEADER.size + print_count * MANIFEST_PRINT.size
+    oracles_end = prints_end + oracle_count * MANIFEST_ORACLE.size
+    print_hashes = {
+        str(uuid.UUID(bytes=print_id)): (str(uuid.UUID(bytes=oracle_id)), content_hash)
+        for print_id, oracle_id, content_hash in MANIFEST_PRINT.iter_unpack(manifest[MANIFEST_HEADER.size:prints_end])
+    }
+    oracle_hashes = {
+        str(uuid.UUID(bytes=oracle_id)): content_hash
+        for oracle_id, content_hash in MANIFEST_ORACLE.iter_unpack(manifest[prints_end:oracles_end])
+    }
+    return print_hashes, oracle_hashes
+
+
+def query_ingest_manifest_shards(generation, **query_params):
+    query_params["KeyConditionExpression"] = (
+        Key('PK').eq(MANIFEST_PK) & Key('SK').begins_with(f"Generation#{generation}#")
+    )
+    while True:
+        response = table.query(**query_params)
+        yield from response['Items']
+        if 'LastEvaluatedKey' not in response:
+            return
+        query_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def load_ingest_manifest():
+    """Returns the manifest of the last ingest, None when every print has to be written."""
+    head = table.get_item(Key={"PK": MANIFEST_PK, "SK": "Head"}).get('Item')
+    if head is None:
+        logger.info("No ingest manifest found, writing every print")
+        return None
+
+    shards = sorted(query_ingest_manifest_shards(head['Generation']), key=lambda shard: shard['SK'])
+    if len(shards) != head['ShardCount']:
+        logger.warning(f"Ingest manifest {head['Generation']} has {len(shards)} of {head['ShardCount']} shards, writing every print")
+        return None
+
+    print_hashes, oracle_hashes = deserialize_ingest_manifest(b"".join(shard['Data'].value for shard in shards))
+    return {
+        "Generation": head['Generation'],
+        "Prints": print_hashes,
+        "Oracles": oracle_hashes,
+        "BulkData": head.get('BulkData'),
+        "IndexRemoveAt": head.get('IndexRemoveAt')
+    }
+
+
+def persist_ingest_manifest(print_hashes, oracle_hashes, generation, previous_manifest, bulk_data=None, index_ttl=None):
+    manifest = serialize_ingest_manifest(print_hashes, oracle_hashes)
+    shards = [manifest[start:start + MANIFEST_SHARD_BYTES] for start in range(0, len(manifest), MANIFEST_SHARD_BYTES)]
+    writeBatchToDb((
+        {"PK": MANIFEST_PK, "SK": f"Generation#{generation}#Shard#{shard_number:04d}", "Data": shard}
+        for shard_number, shard in enumerate(shards)
+    ), table, None)
+    head = {
+        "PK": MANIFEST_PK,
+        "SK": "Head",
+        "Generation": generation,
+        "ShardCount": len(shards),
+        "PrintCount": len(print_hashes),
+        "OracleCount": len(oracle_hashes)
+    }
+    # The next run skips the ingest while Scryfall reports the same bulk file
+    if bulk_data is not None:
+        head["BulkData"] = bulk_data
+    if index_ttl is not None:
+        head["IndexRemoveAt"] = index_ttl
+    # The head is written last, so the next run never reads a manifest that is only partially written
+    writeBatchToDb([head], table, None)
+
+    # A resumed ingest can find the manifest it wrote itself
+    if previous_manifest is not None and previous_manifest['Generation'] != generation:
+        with table.batch_writer() as batch:
+            for shard in query_ingest_manifest_shards(previous_manifest['Generation'], ProjectionExpression="PK, SK"):
+                batch.delete_item(Key=shard)
+    logger.info(f"Persisted ingest manifest {generation} of {len(manifest)} bytes in {len(shards)} shards")
+
+
+def expire_retired_items(keys, ttl):
+    # Retired items stay readable until the ttl, like every item did when ingest still rewrote them all
+    for key in keys:
+        try:
+            table.update_item(
+                Key=key,
+                UpdateExpression="SET RemoveAt = :ttl",
+                ConditionExpression="attribute_exists(PK)",
+                ExpressionAttributeValues={":ttl": ttl}
+            )
+        except ClientError as error:
+            if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+
+def has_ingest_storage():
+    return bool(SEARCH_SNAPSHOT_BUCKET or SEARCH_SNAPSHOT_DIRECTORY)
+
+
+def is_time_nearly_up(context):
+    get_remaining_time_in_millis = getattr(context, "get_remaining_time_in_millis", None)
+    return get_remaining_time_in_millis is not None and get_remaining_time_in_millis() < CHECKPOINT_MARGIN_MS
+
+
+def create_ingest_state():
+    return {
+        "Catalog": {},
+        "PrintHashes": {},
+        "Changes": {"New": [], "Changed": [], "Retired": []},
+        "UnchangedCount": 0
+    }
+
+
+def serialize_ingest_state(state):
+    data = {
+        "Catalog": [
+            {**oracle, "SetCodes": sorted(oracle['SetCodes']), "Rarities": sorted(oracle['Rarities'])}
+            for oracle in state['Catalog'].values()
+        ],
+        "PrintHashes": {
+            print_id: [oracle_id, content_hash.hex()]
+            for print_id, (oracle_id, content_hash) in state['PrintHashes'].items()
+        },
+        "Changes": state['Changes'],
+        "UnchangedCount": state['UnchangedCount']
+    }
+    return gzip.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+
+def deserialize_ingest_state(data):
+    data = json.loads(gzip.decompress(data))
+    return {
+        "Catalog": {
+            oracle['OracleId']: {**oracle, "SetCodes": set(oracle['SetCodes']), "Rarities": set(oracle['Rarities'])}
+            for oracle in data['Catalog']
+        },
+        "PrintHashes": {
+            print_id: (oracle_id, bytes.fromhex(content_hash))
+            for print_id, (oracle_id, content_hash) in data['PrintHashes'].items()
+        },
+        "Changes": data['Changes'],
+        "UnchangedCount": data['UnchangedCount']
+    }
+
+
+def put_ingest_object(key, data):
+    if SEARCH_SNAPSHOT_BUCKET:
+        s3.put_object(Bucket=SEARCH_SNAPSHOT_BUCKET, Key=key, Body=data)
+    else:
+        path = os.path.join(SEARCH_SNAPSHOT_DIRECTORY, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(data)
+
+
+def get_ingest_object(key):
+    if SEARCH_SNAPSHOT_BUCKET:
+        return s3.get_object(Bucket=SEARCH_SNAPSHOT_BUCKET, Key=key)['Body'].read()
+    with open(os.path.join(SEARCH_SNAPSHOT_DIRECTORY, key), "rb") as file:
+        return file.read()
+
+
+def delete_ingest_object(key):
+    if SEARCH_SNAPSHOT_BUCKET:
+        s3.delete_object(Bucket=SEARCH_SNAPSHOT_BUCKET, Key=key)
+    else:
+        path = os.path.join(SEARCH_SNAPSHOT_DIRECTORY, key)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_ingest_checkpoint():
+    """Returns the checkpoint of an unfinished ingest with its state, None when the last ingest finished."""
+    checkpoint = table.get_item(Key={"PK": CHECKPOINT_PK, "SK": "Control"}).get('Item')
+    if checkpoint is None:
+        return None
+
+    return {
+        "Generation": checkpoint['Generation'],
+        "BulkData": checkpoint['BulkData'],
+        "CardOrdinal": int(checkpoint['CardOrdinal']),
+        "FinishPhase": checkpoint.get('FinishPhase'),
+        "StateKey": checkpoint['StateKey'],
+        "State": deserialize_ingest_state(get_ingest_object(checkpoint['StateKey']))
+    }
+
+
+def save_ingest_checkpoint(generation, bulk_data, card_ordinal, state, previous_state_key, finish_phase=None):
+    """Saves the state after the cards before card_ordinal, those cards have to be written already.
+
+    With a finish phase every card was read, the ingest continues with that phase of its finish.
+    """
+    state_key = f"ingest-checkpoints/{generation}/{card_ordinal:08d}.json.gz"
+    put_ingest_object(state_key, serialize_ingest_state(state))
+    checkpoint = {
+        "PK": CHECKPOINT_PK,
+        "SK": "Control",
+        "Generation": generation,
+        "BulkData": bulk_data,
+        "CardOrdinal": card_ordinal,
+        "StateKey": state_key,
+        "RemoveAt": int(time.time()) + CHECKPOINT_TTL_SECONDS
+    }
+    if finish_phase is not None:
+        checkpoint["FinishPhase"] = finish_phase
+    # The control item points at the new state before the previous one is removed, a crash in between leaves both
+    table.put_item(Item=checkpoint)
+    if previous_state_key is not None and previous_state_key != state_key:
+        delete_ingest_object(previous_state_key)
+    resume_point = f"its {finish_phase} phase" if finish_phase is not None else f"card {card_ordinal}"
+    logger.info(f"Checkpointed ingest {generation} before {resume_point}")
+    return state_key
+
+
+def delete_ingest_checkpoint(state_key):
+    if state_key is None:
+        return
+    table.delete_item(Key={"PK": CHECKPOINT_PK, "SK": "Control"})
+    delete_ingest_object(state_key)
+
+
+def invoke_continuation(context, generation, resume_point):
+    lambda_client.invoke(
+        FunctionName=context.function_name,
+        InvocationType="Event",
+        Payload=json.dumps({"Continuation": True, "Generation": generation}).encode("utf-8")
+    )
+    logger.info(f"Ingest {generation} continues {resume_point} in a new invocation")
+
+
+def get_shard_key(generation, shard_number):
+    return f"ingest-shards/{generation}/{shard_number:04d}.json.gz"
+
+
+def get_shard_result_key(generation, shard_number):
+    return f"ingest-shards/{generation}/{shard_number:04d}.result.json.gz"
+
+
+def split_into_shards(cards, shard_size):
+    while True:
+        shard = list(islice(cards, shard_size))
+        if not shard:
+            return
+        yield shard
+
+
+def merge_into_catalog(catalog, oracle):
+    """Adds the catalog entry of a later shard, the result is the same as adding its prints to the catalog in file order."""
+    current = catalog.get(oracle['OracleId'])
+    if current is None:
+        catalog[oracle['OracleId']] = oracle
+        return
+
+    current['PrintCount'] += oracle['PrintCount']
+    current['SetCodes'] |= oracle['SetCodes']
+    current['Rarities'] |= oracle['Rarities']
+    current['FirstReleasedAt'] = min(current['FirstReleasedAt'], oracle['FirstReleasedAt'])
+    if (parse_price(oracle['CheapestPrice']) or math.inf) < (parse_price(current['CheapestPrice']) or math.inf):
+        current.update({"CheapestPrintId": oracle['CheapestPrintId'], "CheapestPrice": oracle['CheapestPrice']})
+    if oracle['ReleasedAt'] >= current['ReleasedAt']:
+        current.update({field: oracle[field] for field in ("PrintId", "SetName", "Price", "ReleasedAt", "ImageUrl")})
+
+
+def coordinate_sharded_ingest(cards, generation, context, bulk_data):
+    """Splits the bulk file in shards of INGEST_SHARD_CARDS cards and hands every shard to a worker."""
+    shard_count = 0
+    for shard_number, shard in enumerate(split_into_shards(cards, INGEST_SHARD_CARDS)):
+        # No field of a print is a number, the floats only keep the shard a valid json file
+        put_ingest_object(get_shard_key(generation, shard_number), gzip.compress(json.dumps(shard, default=float).encode("utf-8")))
+        shard_count += 1
+
+    table.put_item(Item={
+        "PK": SHARDS_PK,
+        "SK": f"Generation#{generation}",
+        "ShardCount": shard_count,
+        "BulkData": bulk_data,
+        "RemoveAt": int(time.time()) + CHECKPOINT_TTL_SECONDS
+    })
+    logger.info(f"Split ingest {generation} in {shard_count} shards of at most {INGEST_SHARD_CARDS} cards")
+
+    if shard_count == 0:
+        finish_sharded_ingest(generation, 0, load_ingest_manifest(), bulk_data, context)
+    elif INGEST_LOCAL_WORKERS == 1:
+        for shard_number in range(shard_count):
+            ingest_shard(generation, shard_number, context)
+    elif INGEST_LOCAL_WORKERS > 1:
+        with multiprocessing.Pool(INGEST_LOCAL_WORKERS) as pool:
+            pool.starmap(ingest_local_shard, [(generation, shard_number) for shard_number in range(shard_count)])
+    else:
+        for shard_number in range(shard_count):
+            lambda_client.invoke(
+                FunctionName=getattr(context, "function_name", None),
+                InvocationType="Event",
+                Payload=json.dumps({"Shard": shard_number, "Generation": generation}).encode("utf-8")
+            )
+
+
+def ingest_shard(generation, shard_number, context=None):
+    """Transforms and writes the cards of a shard, the worker that completes the last shard finishes the ingest."""
+    try:
+        shard = get_ingest_object(get_shard_key(generation, shard_number))
+    except FileNotFoundError:
+        shard = None
+    except ClientError as error:
+        if error.response['Error']['Code'] != 'NoSuchKey':
+            raise
+        shard = None
+    if shard is None:
+        # The finish deletes the shards, a worker that is retried after it has nothing left to do
+        logger.info(f"Shard {shard_number} of ingest {generation} is gone, the ingest was already finished")
+        return
+    cards = json.loads(gzip.decompress(shard))
+    manifest = load_ingest_manifest()
+    previous_prints = manifest['Prints'] if manifest is not None else {}
+    state = create_ingest_state()
+    with BatchWritePipeline(table.name, INGEST_WRITER_THREADS) as writer:
+        for card in cards:
+            ingest_print(state, card, previous_prints, writer)
+    put_ingest_object(get_shard_result_key(generation, shard_number), serialize_ingest_state(state))
+
+    # A set of completed shards instead of a counter, a retried worker does not complete a shard twice
+    control = table.update_item(
+        Key={"PK": SHARDS_PK, "SK": f"Generation#{generation}"},
+        UpdateExpression="ADD CompletedShards :shard",
+        ExpressionAttributeValues={":shard": {shard_number}},
+        ReturnValues="ALL_NEW"
+    )['Attributes']
+    logger.info(f"Completed shard {shard_number} of ingest {generation} with {len(cards)} cards")
+    if len(control['CompletedShards']) == control['ShardCount'] and claim_sharded_ingest(generation, context):
+        try:
+            finish_sharded_ingest(generation, int(control['ShardCount']), manifest, control.get('BulkData'), context)
+        except Exception:
+            # A retry of this shard, or of any other one, can claim the finish again right away
+            release_sharded_ingest(generation)
+            raise
+
+
+def ingest_local_shard(generation, shard_number):
+    # Processes of the pool have controllers of their own, a forked one starts without the stats of its parent
+    write_controllers.clear()
+    ingest_metrics.reset("Shard")
+    ingest_shard(generation, shard_number)
+    log_write_summaries()
+    ingest_metrics.emit()
+
+
+def claim_sharded_ingest(generation, context):
+    """Claims the finish until the deadline of this invocation, a claim past its deadline was left by a crash."""
+    now = int(time.time())
+    get_remaining_time_in_millis = getattr(context, "get_remaining_time_in_millis", None)
+    claim_seconds = get_remaining_time_in_millis() // 1000 if get_remaining_time_in_millis is not None else FINISH_CLAIM_SECONDS
+    try:
+        table.update_item(
+            Key={"PK": SHARDS_PK, "SK": f"Generation#{generation}"},
+            UpdateExpression="SET FinishingUntil = :until",
+            ConditionExpression="attribute_not_exists(FinishingUntil) OR FinishingUntil < :now",
+            ExpressionAttributeValues={":until": now + claim_seconds, ":now": now}
+        )
+        return True
+    except ClientError as error:
+        if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+
+def release_sharded_ingest(generation):
+    try:
+        table.update_item(
+            Key={"PK": SHARDS_PK, "SK": f"Generation#{generation}"},
+            UpdateExpression="REMOVE FinishingUntil",
+            # The finish can fail after it removed the control item, the release must not create it again
+            ConditionExpression="attribute_exists(PK)"
+        )
+    except ClientError as error:
+        if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+
+def finish_sharded_ingest(generation, shard_count, manifest, bulk_data, context):
+    """Merges the results of the shards into a checkpoint, the finish continues from that checkpoint."""
+    state = create_ingest_state()
+    for shard_number in range(shard_count):
+        shard_state = deserialize_ingest_state(get_ingest_object(get_shard_result_key(generation, shard_number)))
+        for oracle in shard_state['Catalog'].values():
+            merge_into_catalog(state['Catalog'], oracle)
+        state['PrintHashes'].update(shard_state['PrintHashes'])
+        for change in ("New", "Changed"):
+            state['Changes'][change].extend(shard_state['Changes'][change])
+        state['UnchangedCount'] += shard_state['UnchangedCount']
+
+    state_key = save_ingest_checkpoint(generation, bulk_data, len(state['PrintHashes']), state, None, FINISH_PHASES[0])
+    for shard_number in range(shard_count):
+        delete_ingest_object(get_shard_key(generation, shard_number))
+        delete_ingest_object(get_shard_result_key(generation, shard_number))
+    table.delete_item(Key={"PK": SHARDS_PK, "SK": f"Generation#{generation}"})
+
+    if getattr(context, "function_name", None) is not None:
+        # A fresh invocation gets the whole timeout for the finish, Lambda retries it when it fails
+        invoke_continuation(context, generation, f"with its {FINISH_PHASES[0]} phase")
+        return
+
     ttl = calculateTTL(ttlOffSetSecs, update_frequency_days)
+    with ingest_metrics.timer("Finish"), BatchWritePipeline(table.name, INGEST_WRITER_THREADS) as writer:
+        finish_ingest(state, manifest, generation, ttl, False, writer, state_key, bulk_data)
+
+
+def create_ingest_report(dry_run, previous_manifest, state, changed_summaries, retired_oracle_ids):
+    changes = state['Changes']
+    return {
+        "DryRun": dry_run,
+        "PreviousGeneration": previous_manifest['Generation'] if previous_manifest is not None else None,
+        "UnchangedPrints": state['UnchangedCount'],
+        **{f"{change}Prints": len(print_ids) for change, print_ids in changes.items()},
+        "ChangedSummaries": len(changed_summaries),
+        "RetiredSummaries": len(retired_oracle_ids),
+        "Samples": {change: print_ids[:DRY_RUN_SAMPLE_SIZE] for change, print_ids in changes.items()}
+    }
 
+
+def create_catalog_item(oracle):
+    return {
+        **oracle,
+        "PK": f"Oracle#{oracle['OracleId']}",
+        "SK": "Catalog",
+        "SetCodes": sorted(oracle['SetCodes']),
+        "Rarities": sorted(oracle['Rarities'])
+    }
+
+
+def add_oracle_to_search_index(postings, frequencies, documents, oracle):
+    posting = oracle['OracleId']
+    name_terms = TOKEN_PATTERN.findall(oracle['LowerCaseOracleName'])
+    text_terms = TOKEN_PATTERN.findall(oracle['CombinedLowercaseOracleText'])
+    documents[posting] = create_search_document(oracle, len(name_terms), len(text_terms))
+
+    name_frequencies = Counter(name_terms)
+    text_frequencies = Counter(text_terms)
+    for term in name_frequencies.keys() | text_frequencies.keys():
+        postings[term].append(posting)
+        frequencies[term].append(pack_term_frequency(name_frequencies[term], text_frequencies[term]))
+
+    for term in get_filter_terms(oracle):
+        postings[term].append(posting)
+        frequencies[term].append(0)
+
+
+def get_filter_terms(oracle):
+    # An oracle passes the rarity and set filters when any of its prints does
+    color_identity = sum(COLOR_BITS.get(color, 0) for color in oracle['ColorIdentity'])
+    mana_value = min(int(parse_mana_value(oracle['ManaCost'])), MANA_VALUE_LIMIT)
+    filter_terms = {f"c:{color_identity}", f"mv:{mana_value}"}
+    filter_terms.update(f"r:{rarity}" for rarity in oracle['Rarities'])
+    filter_terms.update(f"s:{set_code}" for set_code in oracle['SetCodes'])
+    filter_terms.update(f"t:{type_token}" for type_token in oracle['TypeTokens'])
+    return filter_terms
+
+
+def parse_mana_value(mana_cost):
+    mana_value = 0
+    for symbol in MANA_SYMBOL_PATTERN.findall(mana_cost):
+        # Hybrid symbols like {2/W} count their highest half, phyrexian symbols like {U/P} count as one
+        first_half = symbol.split('/')[0]
+        if first_half.isdigit():
+            mana_value += int(first_half)
+        elif first_half in ('X', 'Y', 'Z'):
+            continue
+        elif first_half == '½' or first_half.startswith('H'):
+            mana_value += 0.5
+        else:
+            mana_value += 1
+    return mana_value
+
+
+def pack_term_frequency(name_frequency, text_frequency):
+    # Both frequencies share one unsigned 32 bit integer, the name frequency in the high half
+    return min(name_frequency, TERM_FREQUENCY_MAX) << 16 | min(text_frequency, TERM_FREQUENCY_MAX)
+
+
+def create_posting_items(postings, generation):
+    # Every term gets one or more shards holding space separated OracleId postings
+    for term, term_postings in postings.items():
+        shard = []
+        shard_size = 0
+        shard_number = 0
+        for posting in sorted(term_postings):
+            if shard and shard_size + len(posting) + 1 > MAX_POSTINGS_SHARD_BYTES:
+                yield create_posting_item(term, generation, shard_number, shard)
+                shard = []
+                shard_size = 0
+                shard_number += 1
+            shard.append(posting)
+            shard_size += len(posting) + 1
+        yield create_posting_item(term, generation, shard_number, shard)
+
+
+def create_posting_item(term, generation, shard_number, shard):
+    return {
+        "PK": f'Token#{term}',
+        "SK": f'Generation#{generation}#Shard#{shard_number:04d}',
+        "Term": term,
+        "Postings": " ".join(shard)
+    }
+
+
+def create_search_index_meta_item(generation, document_count, term_count, snapshot_key):
+    meta_item = {
+        "PK": "SearchIndex",
+        "SK": "Meta",
+        "Generation": generation,
+        "DocumentCount": document_count,
+        "TermCount": term_count
+    }
+    if snapshot_key is not None:
+        meta_item["SnapshotKey"] = snapshot_key
+    return meta_item
+
+
+def create_name_items(documents):
+    # One item per distinct name, different oracles can share a name (like the tokens)
+    names = {}
+    for posting, document in documents.items():
+        names.setdefault(str.lower(document[0]), (document[0], posting))
+
+    for lowercase_name, (name, oracle_id) in names.items():
+        yield {
+            "PK": f'NamePrefix#{lowercase_name[:NAME_PREFIX_LENGTH]}',
+            "SK": f'Name#{lowercase_name}',
+            "OracleName": name,
+            "OracleId": oracle_id
+        }
+
+
+def create_search_document(oracle, name_length, text_length):
+    return (
+        oracle['OracleName'],
+        oracle['SetName'],
+        oracle['Price'],
+        oracle['ImageUrl'],
+        name_length,
+        text_length,
+        oracle['PrintId'],
+        oracle['PrintCount']
+    )
+
+
+def get_trigrams(text):
+    return {text[position:position + 3] for position in range(len(text) - 2)}
+
+
+def get_deletes(word, max_distance):
+    """Every string that is left after removing up to max_distance characters from the word, the word included."""
+    deletes = {word}
+    edge = {word}
+    for _ in range(max_distance):
+        edge = {value[:position] + value[position + 1:] for value in edge for position in range(len(value))}
+        deletes.update(edge)
+    return deletes
+
+
+def create_string_table(values):
+    offsets = array('I', [0])
+    data = bytearray()
+    for value in values:
+        data += value.encode('utf-8')
+        offsets.append(len(data))
+    return offsets, bytes(data)
+
+
+def serialize_search_snapshot(postings, frequencies, documents):
+    # Documents are ordered by their posting, so document ids sort the same way as the postings in DynamoDB
+    document_postings = sorted(documents)
+    document_ids = {posting: document_id for document_id, posting in enumerate(document_postings)}
+    terms = sorted(postings)
+
+    posting_offsets = array('I', [0])
+    posting_documents = array('I')
+    posting_frequencies = array('I')
+    for term in terms:
+        term_postings = sorted(zip((document_ids[posting] for posting in postings[term]), frequencies[term]))
+        posting_documents.extend(document_id for document_id, _ in term_postings)
+        posting_frequencies.extend(frequency for _, frequency in term_postings)
+        posting_offsets.append(len(posting_documents))
+
+    # Trigrams of the lowercase names narrow substring searches down to a few candidates
+    name_trigrams = defaultdict(list)
+    for document_id, posting in enumerate(document_postings):
+        for trigram in get_trigrams(str.lower(documents[posting][0])):
+            name_trigrams[trigram].append(document_id)
+    trigrams = sorted(name_trigrams)
+
+    trigram_offsets = array('I', [0])
+    trigram_documents = array('I')
+    for trigram in trigrams:
+        trigram_documents.extend(name_trigrams[trigram])
+        trigram_offsets.append(len(trigram_documents))
+
+    # Deletion dictionary of the name words, the counts let corrections prefer the words most names use
+    word_counts = Counter(
+        word for posting in document_postings for word in set(TOKEN_PATTERN.findall(str.lower(documents[posting][0])))
+    )
+    words = sorted(word_counts)
+    word_deletes = defaultdict(list)
+    for word_id, word in enumerate(words):
+        for delete in get_deletes(word[:FUZZY_PREFIX_LENGTH], FUZZY_MAX_EDIT_DISTANCE):
+            word_deletes[delete].append(word_id)
+    deletes = sorted(word_deletes)
+
+    delete_offsets = array('I', [0])
+    delete_words = array('I')
+    for delete in deletes:
+        delete_words.extend(word_deletes[delete])
+        delete_offsets.append(len(delete_words))
+
+    sections = {}
+    string_tables = {
+        "terms": terms,
+        "trigrams": trigrams,
+        "docs.posting": document_postings,
+        "docs.name": [documents[posting][0] for posting in document_postings],
+        "docs.set": [documents[posting][1] for posting in document_postings],
+        "docs.price": [documents[posting][2] for posting in document_postings],
+        "docs.image": [documents[posting][3] for posting in document_postings],
+        "docs.print": [documents[posting][6] for posting in document_postings],
+        "fuzzy.words": words,
+        "fuzzy.deletes": deletes,
+    }
+    for name, values in string_tables.items():
+        offsets, data = create_string_table(values)
+        sections[f"{name}.o"] = offsets.tobytes()
+        sections[f"{name}.s"] = data
+    sections["postings.o"] = posting_offsets.tobytes()
+    sections["postings.docs"] = posting_documents.tobytes()
+    sections["postings.tf"] = posting_frequencies.tobytes()
+    sections["docs.nlen"] = array('I', (documents[posting][4] for posting in document_postings)).tobytes()
+    sections["docs.tlen"] = array('I', (documents[posting][5] for posting in document_postings)).tobytes()
+    sections["docs.prints"] = array('I', (documents[posting][7] for posting in document_postings)).tobytes()
+    sections["trigrams.post.o"] = trigram_offsets.tobytes()
+    sections["trigrams.post"] = trigram_documents.tobytes()
+    sections["fuzzy.counts"] = array('I', (word_counts[word] for word in words)).tobytes()
+    sections["fuzzy.post.o"] = delete_offsets.tobytes()
+    sections["fuzzy.post"] = delete_words.tobytes()
+
+    header_size = SNAPSHOT_HEADER.size + SNAPSHOT_SECTION.size * len(sections)
+    section_table = []
+    body = bytearray()
+    for name, data in sections.items():
+        body += b"\0" * (-(header_size + len(body)) % SNAPSHOT_ALIGNMENT)
+        section_table.append(SNAPSHOT_SECTION.pack(name.encode('ascii'), header_size + len(body), len(data)))
+        body += data
+
+    return SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(sections)) + b"".join(section_table) + bytes(body)
+
+
+def persist_search_snapshot(postings, frequencies, documents, generation):
+    if not SEARCH_SNAPSHOT_BUCKET and not SEARCH_SNAPSHOT_DIRECTORY:
+        return None
+
+    snapshot = serialize_search_snapshot(postings, frequencies, documents)
+    snapshot_key = f"search-snapshots/{generation}.bin"
+
+    if SEARCH_SNAPSHOT_BUCKET:
+        s3.put_object(Bucket=SEARCH_SNAPSHOT_BUCKET, Key=snapshot_key, Body=snapshot)
+    else:
+        snapshot_path = os.path.join(SEARCH_SNAPSHOT_DIRECTORY, snapshot_key)
+        os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+        with open(snapshot_path, "wb") as file:
+            file.write(snapshot)
+
+    logger.info(f"Persisted search snapshot '{snapshot_key}' of {len(snapshot)} bytes")
+    return snapshot_key
+
+
+def persist_search_index(catalog, generation, ttl):
+    postings = defaultdict(list)
+    frequencies = defaultdict(lambda: array('I'))
+    documents = {}
+    for oracle in catalog.values():
+        add_oracle_to_search_index(postings, frequencies, documents, oracle)
+
+    with BatchWritePipeline(card_index_table.name, INGEST_WRITER_THREADS) as writer:
+        # Search runs against the oracles, their prints are expanded by get_cards when they are needed.
+        # Name items are not bound to a generation, every run refreshes their TTL so retired names expire
+        for item in chain(
+                (create_catalog_item(oracle) for oracle in catalog.values()),
+                create_posting_items(postings, generation),
+                create_name_items(documents)):
+            item['RemoveAt'] = ttl
+            writer.put(item)
+    snapshot_key = persist_search_snapshot(postings, frequencies, documents, generation)
+    # The meta item is written last, so search never picks up a generation that is only partially written
+    meta_item = create_search_index_meta_item(generation, len(documents), len(postings), snapshot_key)
+    writeBatchToDb([meta_item], card_index_table, ttl)
+    logger.info(f"Persisted search index generation {generation} with {len(postings)} terms for {len(documents)} oracles")
+
+
+class IngestMetrics:
+    """Timers and counters of the stages of an ingest invocation, emitted once when it ends.
+
+    The stages tell where the time went: waiting on the bytes of the bulk file, parsing them, transforming
+    the cards into prints, waiting on the writers and finishing the summaries, index and manifest.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset("Ingest")
+
+    def reset(self, mode):
+        self.mode = mode
+        self.started_at = time.perf_counter()
+        self.seconds = Counter()
+        self.counts = Counter()
+        self.gauges = {}
+
+    def add_seconds(self, stage, seconds):
+        with self.lock:
+            self.seconds[stage] += seconds
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    @contextmanager
+    def timer(self, stage):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_seconds(stage, time.perf_counter() - started_at)
+
+    def time_cards(self, cards):
+        """Yields the parsed cards, the time in the parser without its reads of the bulk file is parse time."""
+        cards = iter(cards)
+        while True:
+            started_at = time.perf_counter()
+            download_seconds = self.seconds["Download"]
+            try:
+                card = next(cards)
+            except StopIteration:
+                return
+            self.add_seconds("Parse", time.perf_counter() - started_at - (self.seconds["Download"] - download_seconds))
+            self.count("CardsParsed")
+            yield card
+
+    def get_batch_latencies(self):
+        # The write controllers of the invocation time the BatchWriteItem requests
+        return sorted(chain.from_iterable(controller.latencies for controller in write_controllers.values()))
+
+    def get_batch_latency_histogram(self):
+        histogram = {f"<={bound}ms": 0 for bound in BATCH_LATENCY_BUCKETS_MS}
+        histogram[f">{BATCH_LATENCY_BUCKETS_MS[-1]}ms"] = 0
+        for latency in self.get_batch_latencies():
+            bound = next((bound for bound in BATCH_LATENCY_BUCKETS_MS if latency <= bound), None)
+            histogram[f"<={bound}ms" if bound is not None else f">{BATCH_LATENCY_BUCKETS_MS[-1]}ms"] += 1
+        return histogram
+
+    def get_metrics(self):
+        """Returns the metrics of the invocation as (name, unit, value) tuples."""
+        metrics = [(f"{stage}Seconds", "Seconds", round(self.seconds[stage], 3)) for stage in INGEST_STAGES]
+        metrics.append(("TotalSeconds", "Seconds", round(time.perf_counter() - self.started_at, 3)))
+        metrics.append(("BytesDownloaded", "Bytes", self.counts["BytesDownloaded"]))
+        metrics.append(("CardsParsed", "Count", self.counts["CardsParsed"]))
+        parse_seconds = self.seconds["Parse"]
+        metrics.append((
+            "CardsParsedPerSecond", "Count/Second",
+            round(self.counts["CardsParsed"] / parse_seconds, 1) if parse_seconds > 0 else 0.0
+        ))
+        metrics.append((
+            "ItemsWritten", "Count", sum(controller.stats["Items"] for controller in write_controllers.values())
+        ))
+        latencies = self.get_batch_latencies()
+        metrics.append(("Batches", "Count", len(latencies)))
+        for name in ("Retries", "Throttles"):
+            metrics.append((name, "Count", sum(controller.stats[name] for controller in write_controllers.values())))
+
+        for name, quantile in (("P50", 0.5), ("P90", 0.9), ("P99", 0.99), ("Max", 1.0)):
+            latency = latencies[min(len(latencies) - 1, int(quantile * len(latencies)))] if latencies else 0.0
+            metrics.append((f"BatchLatency{name}", "Milliseconds", round(latency, 1)))
+
+        if resource is not None:
+            # ru_maxrss is in KB on Linux, a warm Lambda container keeps the peak of its earlier invocations
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            metrics.append(("PeakRssMegabytes", "Megabytes", round(peak_rss / 1024, 1)))
+        if "TracedPeakMegabytes" in self.gauges:
+            metrics.append(("TracedPeakMegabytes", "Megabytes", self.gauges["TracedPeakMegabytes"]))
+        return metrics
+
+    def emit(self):
+        metrics = self.get_metrics()
+        histogram = self.get_batch_latency_histogram()
+        if EMIT_EMBEDDED_METRICS:
+            logger.info(json.dumps({
+                "_aws": {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": [{
+                        "Namespace": METRICS_NAMESPACE,
+                        "Dimensions": [["Mode"]],
+                        "Metrics": [{"Name": name, "Unit": unit} for name, unit, _ in metrics]
+                    }]
+                },
+                "Mode": self.mode,
+                **{name: value for name, _, value in metrics},
+                "BatchLatencyHistogram": histogram
+            }), extra={"embedded_metrics": True})
+            return
+
+        lines = [f"Ingest metrics ({self.mode} invocation):"]
+        lines.extend(f"  {name:<24} {value} {unit}" for name, unit, value in metrics)
+        lines.append(f"  {'BatchLatencyHistogram':<24} " + ", ".join(f"{bucket}: {count}" for bucket, count in histogram.items()))
+        logger.info("\n".join(lines))
+
+
+ingest_metrics = IngestMetrics()
+
+
+class MeteredReader:
+    """Passes the reads of the parser through to the bulk file, their time counts as download time."""
+
+    def __init__(self, file):
+        self.file = file
+
+    def read(self, size=-1):
+        with ingest_metrics.timer("Download"):
+            return self.file.read(size)
+
+
+def request_bulk_file(stack, bulk_data, previous_bulk_data=None):
+    """Requests the bulk file, conditional on the ETag of the last ingest when that ingested the same download uri."""
+    headers = {}
+    if previous_bulk_data is not None and previous_bulk_data.get('DownloadUri') == bulk_data['DownloadUri'] \
+            and previous_bulk_data.get('ETag'):
+        headers["If-None-Match"] = previous_bulk_data['ETag']
+    response = stack.enter_context(requests.get(bulk_data['DownloadUri'], stream=True, headers=headers))
+    if response.headers.get("ETag"):
+        bulk_data['ETag'] = response.headers["ETag"]
+    return response
+
+
+def open_bulk_file(stack, response):
+    """Returns the bulk file as a binary file that closes with the stack, None when the download failed."""
+    if response.status_code != 200:
+        logger.info(f"Failed to download. Status code: {response.status_code}")
+        return None
+
+    if local_filename is None:
+        # ijson reads straight from the socket, urllib3 decodes a gzip or deflate response on the way
+        response.raw.decode_content = True
+        # tell counts the bytes that came over the wire, before they were decoded
+        stack.callback(lambda: ingest_metrics.count("BytesDownloaded", response.raw.tell()))
+        logger.info(f"Parsing '{response.url}' while it downloads with the {ijson_backend.backend} backend")
+        return MeteredReader(response.raw)
+
+    # wb for write bytes
+    with ingest_metrics.timer("Download"), open(local_filename, "wb") as file:
+        for chunk in response.iter_content(chunk_size=8192):
+            file.write(chunk)
+            ingest_metrics.count("BytesDownloaded", len(chunk))
+    logger.info(f"Downloaded '{local_filename}' successfully.")
+    return stack.enter_context(open(local_filename, "rb"))
+
+
+def stop_memory_trace():
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    ingest_metrics.gauges["TracedPeakMegabytes"] = round(peak / 2 ** 20, 1)
+    logger.info(f"Ingest allocated {peak / 2 ** 20:.1f} MB at its peak and {current / 2 ** 20:.1f} MB at the end")
+
+
+def get_default_cards_bulk_data():
+    """Returns the download uri of the default cards with the updated_at and size Scryfall reports for them."""
     with requests.get("https://api.scryfall.com/bulk-data") as response:
         if response.status_code == 200:
             bulk_data_items = response.json()
@@ -157,60 +1384,292 @@ def lambda_handler(event, context):
     # Because we fetch a json file with multiple items with different types we first need to find the one with the type default_card
     for item in bulk_data_items["data"]:
         if item["type"] == "default_cards":
-            default_cards_uri = item["download_uri"]
-            break
+            bulk_data = {"DownloadUri": item["download_uri"]}
+            for field, attribute in (("updated_at", "UpdatedAt"), ("size", "Size")):
+                if item.get(field) is not None:
+                    bulk_data[attribute] = item[field]
+            return bulk_data
 
-    with requests.get(default_cards_uri, stream=True) as response:
-        if response.status_code == 200:
-            # wb for write bytes
-            with open(local_filename, "wb") as file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    file.write(chunk)
-            logger.info(f"Downloaded '{local_filename}' successfully.")
-        else:
-            logger.info(f"Failed to download. Status code: {response.status_code}")
-            return False
 
-    with open(f'{local_filename}', "rb") as file:
-        cards = ijson.items(file, 'item')
+def create_print_item(card):
+    oracle_id = getOracleFromCard(card)
+    card_info = createCardInfo(card, oracle_id)
+    missing_image_uri = is_image_uri_missing(card)
+    card_faces = []
 
-        item_list = []
-        for card in cards:
-            oracle_id = getOracleFromCard(card)
-            card_info = createCardInfo(card, oracle_id)
-            missing_image_uri = is_image_uri_missing(card)
-            card_faces = []
-
-            if card.get("card_faces") != None:
-                face_count = 0
-                for face in card['card_faces']:
-                    if missing_image_uri:
-                        card_image_uri = ''
-                    else:
-                        if get_image_uri_from_face(card):
-                            card_image_uri = face['image_uris'].get('png', '')
-                        else:
-                            card_image_uri = card['image_uris'].get('png', '')
-
-                    if get_Colors_from_face(card):
-                        card_colors = face['colors']
-                    else:
-                        card_colors = card['colors']
-
-                    face_count += 1
-                    card_faces.append(turn_face_into_face_item(face, card_image_uri, card_colors))
+    if card.get("card_faces") != None:
+        face_count = 0
+        for face in card['card_faces']:
+            if missing_image_uri:
+                card_image_uri = ''
             else:
-                card_faces.append(turnCardIntoFaceItem(card))
+                if get_image_uri_from_face(card):
+                    card_image_uri = face['image_uris'].get('png', '')
+                else:
+                    card_image_uri = card['image_uris'].get('png', '')
+
+            if get_Colors_from_face(card):
+                card_colors = face['colors']
+            else:
+                card_colors = card['colors']
+
+            face_count += 1
+            card_faces.append(turn_face_into_face_item(face, card_image_uri, card_colors))
+    else:
+        card_faces.append(turnCardIntoFaceItem(card))
+
+    card_info['CardFaces'] = card_faces
+    card_info['CombinedLowercaseOracleText'] = getCombinedLowerCaseOracleText(card_faces)
+    return card_info
+
+
+def ingest_print(state, card, previous_prints, writer):
+    """Adds a card of the bulk file to the state, its print is only written when it is new or changed."""
+    started_at = time.perf_counter()
+    card_info = create_print_item(card)
+    add_print_to_catalog(state['Catalog'], card_info)
+
+    content = (card_info['OracleId'], get_content_hash(card_info))
+    state['PrintHashes'][card_info['PrintId']] = content
+    previous_print = previous_prints.get(card_info['PrintId'])
+    ingest_metrics.add_seconds("Transform", time.perf_counter() - started_at)
+    if previous_print == content:
+        state['UnchangedCount'] += 1
+        return
+
+    state['Changes']["New" if previous_print is None else "Changed"].append(card_info['PrintId'])
+    if writer is not None:
+        writer.put(card_info)
+
+
+def finish_ingest(
+        state, manifest, generation, ttl, dry_run, writer, state_key=None, bulk_data=None, context=None,
+        finish_phase=FINISH_PHASES[0]):
+    """Writes the summaries, retires what left the bulk file and publishes the search index and the manifest.
+
+    With a context the finish checkpoints before a phase when the time is nearly up and continues from that phase
+    in a new invocation, the report of such a finish only tells where it continues.
+    """
+    previous_prints = manifest['Prints'] if manifest is not None else {}
+    # A print that moved to another oracle is retired under its old key
+    retired_keys = [
+        (oracle_id, print_id) for print_id, (oracle_id, _) in previous_prints.items()
+        if state['PrintHashes'].get(print_id, (None,))[0] != oracle_id
+    ]
+    state['Changes']["Retired"] = [print_id for _, print_id in retired_keys]
+
+    summary_items = [create_summary_item(oracle) for oracle in state['Catalog'].values()]
+    oracle_hashes = {item['OracleId']: get_content_hash(item) for item in summary_items}
+    previous_oracles = manifest['Oracles'] if manifest is not None else {}
+    changed_summaries = [
+        item for item in summary_items if previous_oracles.get(item['OracleId']) != oracle_hashes[item['OracleId']]
+    ]
+    retired_oracle_ids = [oracle_id for oracle_id in previous_oracles if oracle_id not in oracle_hashes]
+
+    report = create_ingest_report(dry_run, manifest, state, changed_summaries, retired_oracle_ids)
+    logger.info(f"Ingest difference with the last run: {json.dumps(report)}")
+    if dry_run:
+        return report
+
+    # Every phase can run again, the manifest that tells what changed is only replaced by the last one
+    for phase in FINISH_PHASES[FINISH_PHASES.index(finish_phase):]:
+        if phase != finish_phase and context is not None and is_time_nearly_up(context):
+            writer.close()
+            save_ingest_checkpoint(generation, bulk_data, len(state['PrintHashes']), state, state_key, phase)
+            invoke_continuation(context, generation, f"with its {phase} phase")
+            return {"Continuation": True, "Generation": generation, "FinishPhase": phase}
+
+        if phase == "Summaries":
+            for summary_item in changed_summaries:
+                writer.put(summary_item)
+            # Retired items and the manifest are only written once every print has been written
+            writer.close()
+
+            expire_retired_items([
+                *({"PK": f"OracleId#{oracle_id}", "SK": f"PrintId#{print_id}"} for oracle_id, print_id in retired_keys),
+                *({"PK": f"OracleId#{oracle_id}", "SK": "Summary"} for oracle_id in retired_oracle_ids)
+            ], ttl)
+        elif phase == "SearchIndex":
+            if card_index_table is not None:
+                persist_search_index(state['Catalog'], generation, ttl)
+        elif phase == "Manifest":
+            # Written last, a run that fails before this point is compared with the previous manifest again.
+            # Without its checkpoint a run that fails while writing the manifest starts over, which is safe as well
+            delete_ingest_checkpoint(state_key)
+            persist_ingest_manifest(
+                state['PrintHashes'], oracle_hashes, generation, manifest, bulk_data,
+                ttl if card_index_table is not None else None
+            )
+    return report
+
 
-            card_info['CardFaces'] = card_faces
-            card_info['CombinedLowercaseOracleText'] = getCombinedLowerCaseOracleText(card_faces)
-            item_list.append(card_info)
-            item_list = cutTheListAndPersist(item_list, ttl)
+def is_bulk_data_unchanged(previous_bulk_data, bulk_data):
+    """Scryfall reports when it last updated the bulk file and its size, an ingest without them is never skipped."""
+    if previous_bulk_data is None or 'UpdatedAt' not in bulk_data or 'Size' not in bulk_data:
+        return False
+    return (
+        previous_bulk_data.get('DownloadUri') == bulk_data['DownloadUri']
+        and previous_bulk_data.get('UpdatedAt') == bulk_data['UpdatedAt']
+        and previous_bulk_data.get('Size') == bulk_data['Size']
+    )
+
+
+def skip_unchanged_ingest(manifest, bulk_data):
+    """Keeps the items of the last ingest, the bulk file it read did not change since."""
+    logger.info(f"Skipping ingest, the bulk file of {bulk_data.get('UpdatedAt')} was already ingested by {manifest['Generation']}")
+    ingest_metrics.mode = "Skipped"
+    table.update_item(
+        Key={"PK": MANIFEST_PK, "SK": "Head"},
+        UpdateExpression="SET BulkData = :bulk_data",
+        ExpressionAttributeValues={":bulk_data": {**manifest['BulkData'], **bulk_data}}
+    )
+    return {"Skipped": True, "Generation": manifest['Generation']}
+
+
+def is_search_index_expiring(manifest, ttl):
+    """Tells whether less than half of the TTL of the search index of the last ingest remains.
 
-        item_list = cutTheListAndPersist(item_list, ttl)
+    The items of a generation all expire together, instead of refreshing their RemoveAt an ingest of the unchanged
+    bulk file writes them again under a new generation.
+    """
+    if card_index_table is None or manifest is None or manifest.get('IndexRemoveAt') is None:
+        return False
+    now = int(time.time())
+    return int(manifest['IndexRemoveAt']) - now <= (ttl - now) // 2
+
+
+def lambda_handler(event, context):
+    event = event or {}
+    # Every invocation learns the write rate anew, the capacity of a table can change between runs
+    write_controllers.clear()
+    ingest_metrics.reset(get_ingest_mode(event))
+    try:
+        return run_ingest(event, context)
+    finally:
+        log_write_summaries()
+        ingest_metrics.emit()
 
-        if len(item_list) != 0:
-            writeBatchToDb(item_list, table, ttl)
+
+def get_ingest_mode(event):
+    if "Shard" in event:
+        return "Shard"
+    if event.get("DryRun"):
+        return "DryRun"
+    if event.get("Continuation"):
+        return "Continuation"
+    return "Ingest"
+
+
+def run_ingest(event, context):
+    if "Shard" in event:
+        ingest_shard(event['Generation'], int(event['Shard']), context)
+        return True
+
+    dry_run = bool(event.get("DryRun"))
+    continuation = bool(event.get("Continuation"))
+    # A dry run or a forced run always reads the bulk file
+    skippable = not dry_run and not event.get("Force")
+    resumable = not dry_run and has_ingest_storage()
+    ttl = calculateTTL(ttlOffSetSecs, update_frequency_days)
+    manifest = load_ingest_manifest()
+    previous_prints = manifest['Prints'] if manifest is not None else {}
+    checkpoint = load_ingest_checkpoint() if resumable else None
+
+    if continuation:
+        if checkpoint is None or checkpoint['Generation'] != event.get("Generation"):
+            logger.info(f"There is no checkpoint of ingest {event.get('Generation')} to continue")
+            return False
+        bulk_data = checkpoint['BulkData']
+    else:
+        bulk_data = get_default_cards_bulk_data()
+        if checkpoint is not None and checkpoint['BulkData']['DownloadUri'] != bulk_data['DownloadUri']:
+            logger.info(f"Discarding the checkpoint of ingest {checkpoint['Generation']}, Scryfall published a new bulk file")
+            delete_ingest_checkpoint(checkpoint['StateKey'])
+            checkpoint = None
+
+    # An unfinished ingest is always finished, otherwise an unchanged bulk file is not downloaded again
+    # until the search index of the last ingest is about to expire
+    skippable = skippable and checkpoint is None and not is_search_index_expiring(manifest, ttl)
+    previous_bulk_data = manifest['BulkData'] if manifest is not None and skippable else None
+    if is_bulk_data_unchanged(previous_bulk_data, bulk_data):
+        return skip_unchanged_ingest(manifest, bulk_data)
+
+    # Sharded ingests checkpoint before they finish, an ingest that read every card continues without the bulk file
+    if checkpoint is not None and checkpoint['FinishPhase'] is not None:
+        logger.info(f"Resuming ingest {checkpoint['Generation']} with its {checkpoint['FinishPhase']} phase")
+        with ingest_metrics.timer("Finish"), BatchWritePipeline(table.name, INGEST_WRITER_THREADS) as writer:
+            report = finish_ingest(
+                checkpoint['State'], manifest, checkpoint['Generation'], ttl, False, writer,
+                checkpoint['StateKey'], bulk_data, context, checkpoint['FinishPhase']
+            )
+        if report.get("Continuation"):
+            return report
+        logger.info("Finished!")
+        return True
+
+    sharded = INGEST_SHARD_CARDS > 0 and resumable and checkpoint is None
+    checkpointing = resumable and not sharded
+    if checkpoint is not None:
+        logger.info(f"Resuming ingest {checkpoint['Generation']} from card {checkpoint['CardOrdinal']}")
+        generation = checkpoint['Generation']
+        start_ordinal = checkpoint['CardOrdinal']
+        state_key = checkpoint['StateKey']
+        state = checkpoint['State']
+    else:
+        generation = create_generation_id()
+        start_ordinal = 0
+        state_key = None
+        state = create_ingest_state()
+
+    with ExitStack() as stack:
+        if INGEST_TRACE_MEMORY:
+            tracemalloc.start()
+            stack.callback(stop_memory_trace)
+
+        response = request_bulk_file(stack, bulk_data, previous_bulk_data)
+        if response.status_code == 304:
+            return skip_unchanged_ingest(manifest, bulk_data)
+        file = open_bulk_file(stack, response)
+        if file is None:
+            return False
+
+        cards = ingest_metrics.time_cards(ijson_backend.items(file, 'item'))
+        if sharded:
+            coordinate_sharded_ingest(cards, generation, context, bulk_data)
+            return True
+
+        writer = stack.enter_context(BatchWritePipeline(table.name, INGEST_WRITER_THREADS))
+        card_count = 0
+        for card_ordinal, card in enumerate(cards):
+            card_count = card_ordinal + 1
+            if card_ordinal < start_ordinal:
+                continue
+
+            if checkpointing and card_ordinal > start_ordinal:
+                time_nearly_up = is_time_nearly_up(context)
+                if time_nearly_up or card_ordinal % CHECKPOINT_INTERVAL_CARDS == 0:
+                    writer.flush()
+                    state_key = save_ingest_checkpoint(generation, bulk_data, card_ordinal, state, state_key)
+                    if time_nearly_up:
+                        invoke_continuation(context, generation, f"from card {card_ordinal}")
+                        return {"Continuation": True, "Generation": generation, "CardOrdinal": card_ordinal}
+
+            ingest_print(state, card, previous_prints, writer if not dry_run else None)
+
+        if checkpointing and is_time_nearly_up(context):
+            # The finish gets an invocation of its own, which does not read the bulk file again
+            writer.flush()
+            save_ingest_checkpoint(generation, bulk_data, card_count, state, state_key, FINISH_PHASES[0])
+            invoke_continuation(context, generation, f"with its {FINISH_PHASES[0]} phase")
+            return {"Continuation": True, "Generation": generation, "FinishPhase": FINISH_PHASES[0]}
+
+        with ingest_metrics.timer("Finish"):
+            report = finish_ingest(
+                state, manifest, generation, ttl, dry_run, writer, state_key, bulk_data,
+                context if checkpointing else None
+            )
+        if dry_run or report.get("Continuation"):
+            return report
 
         logger.info("Finished!")
     return True
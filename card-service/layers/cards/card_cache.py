@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from botocore.exceptions import ClientError
+from http_responses import get_content_encoding, get_encoded_etag, get_header
+
+logger = logging.getLogger()
+
+
+class SearchIndexMeta:
+    """The meta item of the search index, it names the generation that the last ingest published.
+
+    Cards and index results only change with a new generation, reading the item once per TTL is enough to notice one.
+    """
+
+    def __init__(self, index_table, ttl_seconds):
+        self.index_table = index_table
+        self.ttl_seconds = ttl_seconds
+        self.item = None
+        self.fetched_at = None
+
+    def get_item(self):
+        if self.index_table is None:
+            return None
+        now = time.monotonic()
+        if self.fetched_at is not None and now - self.fetched_at < self.ttl_seconds:
+            return self.item
+
+        try:
+            item = self.index_table.get_item(Key={"PK": "SearchIndex", "SK": "Meta"}).get("Item")
+        except ClientError as e:
+            # The last known generation is still the best guess, it is read again with the next request
+            logger.warning(f"Error while fetching the search index meta: {e}")
+            return self.item
+
+        self.item = item
+        self.fetched_at = now
+        return item
+
+    def get_generation(self):
+        item = self.get_item()
+        return item["Generation"] if item is not None else None
+
+    def clear(self):
+        self.item = None
+        self.fetched_at = None
+
+
+class ResponseCache:
+    """LRU of responses in the container, bounded by the size of their keys and bodies.
+
+    The TTL of a response depends on its status code, without one it stays until it is evicted.
+    """
+
+    def __init__(self, name, max_bytes, body_key="body", ttl_seconds=None, status_ttl_seconds=None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.body_key = body_key
+        self.ttl_seconds = ttl_seconds
+        self.status_ttl_seconds = status_ttl_seconds or {}
+        self.entries = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def get(self, cache_key):
+        entry = self.entries.get(cache_key)
+        if entry is not None and (entry["ExpiresAt"] is None or entry["ExpiresAt"] > time.monotonic()):
+            self.entries.move_to_end(cache_key)
+            self.hits += 1
+            self.log_lookup("hit")
+            return entry["Response"]
+
+        self.misses += 1
+        self.log_lookup("miss")
+        return None
+
+    def put(self, cache_key, response):
+        """Adds the response, the least recently used ones go until the cache fits again."""
+        response_size = len(cache_key) + len(response[self.body_key])
+        if response_size > self.max_bytes:
+            return
+
+        ttl = self.status_ttl_seconds.get(response["statusCode"], self.ttl_seconds)
+        if cache_key in self.entries:
+            self.size_bytes -= self.entries.pop(cache_key)["Size"]
+        self.entries[cache_key] = {
+            "Response": response,
+            "Size": response_size,
+            "ExpiresAt": time.monotonic() + ttl if ttl is not None else None
+        }
+        self.size_bytes += response_size
+
+        while self.size_bytes > self.max_bytes:
+            _, evicted_entry = self.entries.popitem(last=False)
+            self.size_bytes -= evicted_entry["Size"]
+
+    def clear(self):
+        self.entries.clear()
+        self.size_bytes = 0
+
+    def log_lookup(self, outcome):
+        logger.info(f"{self.name} cache {outcome}, {self.hits} hits and {self.misses} misses, "
+                    f"{len(self.entries)} responses of {self.size_bytes} bytes cached")
+
+
+def create_cache_headers(generation, body, cache_control):
+    """Strong ETag of the body, prefixed with the generation it was read from."""
+    content_hash = hashlib.sha256(body.encode("utf-8")).hexdigest()[:32]
+    etag = f'"{generation}.{content_hash}"' if generation is not None else f'"{content_hash}"'
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+
+def get_matching_etag(if_none_match, etag):
+    """Returns the tag of If-None-Match that is the ETag, None when the response has to be sent."""
+    if not if_none_match:
+        return None
+    for tag in (tag.strip() for tag in if_none_match.split(",")):
+        # If-None-Match compares weakly, the opaque tag still has to match including its encoding
+        if (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return tag
+    return None
+
+
+def conditional_response(event, response, cache_control, body_key="body", compressed=False):
+    """Answers with a 304 when If-None-Match holds the ETag of the response.
+
+    With compressed the response goes through compress_response afterwards, its ETag is then the one of the encoding
+    this request gets.
+    """
+    etag = response.get("headers", {}).get("ETag")
+    if etag is None:
+        return response
+    if compressed:
+        etag = get_encoded_etag(etag, get_content_encoding(event, response[body_key]))
+    if get_matching_etag(get_header(event, "If-None-Match"), etag) is None:
+        return response
+    return not_modified_response(etag, cache_control, body_key)
+
+
+def not_modified_response(etag, cache_control, body_key="body"):
+    return {
+        "statusCode": 304,
+        "headers": {"ETag": etag, "Cache-Control": cache_control},
+        body_key: ""
+    }
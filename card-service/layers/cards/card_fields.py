@@ -0,0 +1,60 @@
+# Top level attributes of a card that can be requested with fields=, ImageUrl is the image of the first face
+CARD_FIELDS = {
+    "PK", "SK", "OracleId", "PrintId", "OracleName", "LowerCaseOracleName", "SetName", "SetCode", "ReleasedAt",
+    "Rarity", "Price", "ColorIdentity", "ManaCost", "TypeTokens", "CardFaces", "CombinedLowercaseOracleText",
+    "ImageUrl"
+}
+SUMMARY_FIELDS = ["OracleId", "PrintId", "OracleName", "SetName", "Price", "ImageUrl"]
+KEY_FIELDS = ("PK", "SK")
+
+
+def parse_fields(query_string_parameters, card_fields=CARD_FIELDS, summary_fields=SUMMARY_FIELDS):
+    """Returns the requested fields, or None when the full card is requested."""
+    query_string_parameters = query_string_parameters or {}
+    view = query_string_parameters.get("view")
+    fields_value = query_string_parameters.get("fields")
+
+    if view is not None and view != "summary":
+        raise ValueError(f"view '{view}' does not exist, use 'summary'")
+
+    fields = list(summary_fields) if view == "summary" else []
+    if fields_value:
+        fields.extend(field.strip() for field in fields_value.split(",") if field.strip())
+    if not fields:
+        return None
+
+    unknown_fields = [field for field in fields if field not in card_fields]
+    if unknown_fields:
+        raise ValueError(f"unknown fields: {', '.join(unknown_fields)}")
+    return list(dict.fromkeys(fields))
+
+
+def get_projection(fields, key_fields=(), top_level_image_url=False):
+    """ProjectionExpression that only reads the requested fields, every name is an expression attribute name.
+
+    Cards keep their ImageUrl on the first face, catalog items keep it at the top level.
+    """
+    attribute_names = {}
+    paths = []
+    for field in dict.fromkeys([*key_fields, *fields]):
+        if field == "ImageUrl" and not top_level_image_url:
+            if "CardFaces" in fields:
+                # The whole faces are read already, a nested path would overlap with them
+                continue
+            attribute_names.update({"#CardFaces": "CardFaces", "#ImageUrl": "ImageUrl"})
+            paths.append("#CardFaces[0].#ImageUrl")
+        else:
+            attribute_names[f"#{field}"] = field
+            paths.append(f"#{field}")
+    return {"ProjectionExpression": ", ".join(paths), "ExpressionAttributeNames": attribute_names}
+
+
+def serialize_card(item, fields):
+    if fields is None:
+        return item
+
+    card = {field: item[field] for field in fields if field in item}
+    if "ImageUrl" in fields and "ImageUrl" not in item:
+        card_faces = item.get("CardFaces") or [{}]
+        card["ImageUrl"] = card_faces[0].get("ImageUrl", "")
+    return card
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The functions import the shared modules from Lambda layers, the tests import them from the sources of the layers
+SERVICE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(SERVICE_DIRECTORY, "..", "common-service", "layers", "shared"))
+sys.path.append(os.path.join(SERVICE_DIRECTORY, "layers", "cards"))
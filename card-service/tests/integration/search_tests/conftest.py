@@ -74,3 +74,24 @@ def setup_dynamodb_collection_with_items(setup_dynamodb_collection):
     )
 
     yield table
+
+
+CARD_INDEX_TABLE_NAME = "test-card-index-table"
+
+
+@pytest.fixture()
+def setup_dynamodb_card_index(setup_dynamodb_collection):
+    dynamodb = boto3.resource("dynamodb")
+    index_table = dynamodb.create_table(
+        TableName=CARD_INDEX_TABLE_NAME,
+        KeySchema=[
+            {"AttributeName": "PK", "KeyType": "HASH"},
+            {"AttributeName": "SK", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "PK", "AttributeType": "S"},
+            {"AttributeName": "SK", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    yield setup_dynamodb_collection, index_table
@@ -0,0 +1,52 @@
+import importlib
+import json
+import os
+from unittest.mock import patch
+from .conftest import DYNAMODB_TABLE_NAME, CARD_INDEX_TABLE_NAME
+from .test_search_index import renew_entities
+
+
+def autocomplete(query_string_parameters):
+    import functions.autocomplete.app
+    importlib.reload(functions.autocomplete.app)
+    response = functions.autocomplete.app.lambda_handler({"queryStringParameters": query_string_parameters}, None)
+    return response["statusCode"], json.loads(response["body"])
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_autocomplete_returns_names_with_prefix(setup_dynamodb_card_index, requests_mock, tmp_path):
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+
+    status_code, body = autocomplete({"prefix": "Ar"})
+    _, limited_body = autocomplete({"prefix": "ar", "limit": "1"})
+    _, not_found_body = autocomplete({"prefix": "zz"})
+
+    assert status_code == 200
+    assert [item["OracleName"] for item in body["Items"]] == ["Archfiend of the Dross", "Archipelagore"]
+    assert len(limited_body["Items"]) == 1
+    assert not_found_body["Items"] == []
+
+
+@patch.dict(
+    os.environ,
+    {
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+    },
+)
+def test_autocomplete_invalid_parameters(setup_dynamodb_card_index):
+    short_status_code, _ = autocomplete({"prefix": "a"})
+    missing_status_code, _ = autocomplete(None)
+    limit_status_code, _ = autocomplete({"prefix": "ar", "limit": "100"})
+
+    assert short_status_code == 400
+    assert missing_status_code == 400
+    assert limit_status_code == 400
@@ -1,6 +1,10 @@
+import importlib
 import os
 import json
 import logging
+import queue
+import threading
+import time
 from unittest.mock import patch
 from .jwt_generator import generate_test_jwt
 from .conftest import DYNAMODB_TABLE_NAME
@@ -111,3 +115,192 @@ def test_search_no_query(setup_dynamodb_collection):
     # Assert
     assert result["statusCode"] == 406
     assert body["message"] == "query string parameter not provided"
+
+
+def insert_goblins(table, amount):
+    for number in range(amount):
+        table.put_item(
+            Item={
+                "PK": f"OracleId#goblin-{number}",
+                "SK": f"PrintId#goblin-{number}",
+                "OracleName": f"Goblin {number}",
+                "LowerCaseOracleName": f"goblin {number}",
+                "CombinedLowercaseOracleText": "haste ",
+            }
+        )
+        table.put_item(
+            Item={
+                "PK": f"OracleId#elf-{number}",
+                "SK": f"PrintId#elf-{number}",
+                "OracleName": f"Elf {number}",
+                "LowerCaseOracleName": f"elf {number}",
+                "CombinedLowercaseOracleText": "reach ",
+            }
+        )
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+        "SEARCH_SCAN_PAGE_SIZE": "3",
+        "SEARCH_SCAN_SEGMENTS": "1",
+    },
+)
+def test_search_paginates_with_cursor(setup_dynamodb_collection):
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+
+    # Arrange
+    insert_goblins(setup_dynamodb_collection, 7)
+    found_names = []
+    query_string_parameters = {"q": "goblin", "limit": "2"}
+
+    # Act
+    while True:
+        result = functions.Search.app.lambda_handler({"queryStringParameters": query_string_parameters}, None)
+        body = json.loads(result["Body"])
+        assert result["statusCode"] == 200
+        assert len(body["Items"]) <= 2
+        found_names.extend(item["OracleName"] for item in body["Items"])
+
+        if body["cursor"] is None:
+            break
+        query_string_parameters = {**query_string_parameters, "cursor": body["cursor"]}
+
+    # Assert
+    assert sorted(found_names) == [f"Goblin {number}" for number in range(7)]
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_invalid_pagination(setup_dynamodb_collection):
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+
+    invalid_limit = functions.Search.app.lambda_handler(
+        {"queryStringParameters": {"q": "goblin", "limit": "many"}}, None
+    )
+    invalid_cursor = functions.Search.app.lambda_handler(
+        {"queryStringParameters": {"q": "goblin", "cursor": "not-a-cursor"}}, None
+    )
+
+    assert invalid_limit["statusCode"] == 400
+    assert invalid_cursor["statusCode"] == 400
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+        "SEARCH_SCAN_PAGE_SIZE": "4",
+        "SEARCH_SCAN_SEGMENTS": "4",
+    },
+)
+def test_search_parallel_scan_merges_segments(setup_dynamodb_collection):
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+
+    # Arrange
+    insert_goblins(setup_dynamodb_collection, 5)
+
+    # Act
+    result = functions.Search.app.lambda_handler({"queryStringParameters": {"q": "haste"}}, None)
+    body = json.loads(result["Body"])
+
+    # Assert
+    assert result["statusCode"] == 200
+    assert sorted(item["OracleName"] for item in body["Items"]) == [f"Goblin {number}" for number in range(5)]
+    assert body["cursor"] is None
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+        "SEARCH_SCAN_PAGE_SIZE": "1",
+    },
+)
+def test_search_scan_segment_waits_for_the_merge(setup_dynamodb_collection):
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+
+    # Arrange
+    insert_goblins(setup_dynamodb_collection, 10)
+    dynamodb_client = functions.Search.app.dynamodb_client
+    pages = queue.Queue(maxsize=1)
+    stop_scanning = threading.Event()
+
+    # Act, nothing merges the pages of the segment
+    with patch.object(dynamodb_client, "scan", wraps=dynamodb_client.scan) as scan:
+        scanner = threading.Thread(
+            target=functions.Search.app.scan_segment,
+            args=(DYNAMODB_TABLE_NAME, "haste", None, 0, 1, None, pages, stop_scanning),
+        )
+        scanner.start()
+        time.sleep(functions.Search.app.SCAN_PUT_POLL_SECONDS * 4)
+        waiting_calls = scan.call_count
+        stop_scanning.set()
+        scanner.join(timeout=1)
+
+    # Assert, the segment read the queued page and the page it waited with, then stopped
+    assert waiting_calls == 2
+    assert not scanner.is_alive()
+    assert scan.call_count == 2
+    assert pages.qsize() == 1
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+        "SEARCH_SCAN_DEADLINE_MS": "0",
+    },
+)
+def test_search_parallel_scan_deadline_returns_cursor(setup_dynamodb_collection):
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+
+    # Arrange
+    insert_goblins(setup_dynamodb_collection, 5)
+
+    # Act
+    result = functions.Search.app.lambda_handler({"queryStringParameters": {"q": "haste"}}, None)
+    body = json.loads(result["Body"])
+
+    # Assert
+    assert result["statusCode"] == 200
+    assert body["cursor"] is not None
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_scan_projects_fields(setup_dynamodb_collection_with_items):
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+
+    result = functions.Search.app.lambda_handler(
+        {"queryStringParameters": {"q": "Oblivion", "fields": "OracleName"}}, None
+    )
+
+    assert json.loads(result["Body"])["Items"] == [{"OracleName": "Oblivion's Hunger"}]
@@ -0,0 +1,213 @@
+import importlib
+import json
+import os
+from unittest.mock import patch
+from .conftest import DYNAMODB_TABLE_NAME, CARD_INDEX_TABLE_NAME
+from .test_search_index import renew_entities
+
+
+def delete_catalog(index_table):
+    for item in index_table.scan()["Items"]:
+        if item["PK"].startswith("Oracle#"):
+            index_table.delete_item(Key={"PK": item["PK"], "SK": item["SK"]})
+
+
+def publish_generation(index_table, generation):
+    index_table.update_item(
+        Key={"PK": "SearchIndex", "SK": "Meta"},
+        UpdateExpression="SET Generation = :generation",
+        ExpressionAttributeValues={":generation": generation},
+    )
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+        "SEARCH_META_TTL_SECONDS": "0",
+    },
+)
+def test_search_cache_is_valid_until_next_generation(setup_dynamodb_card_index, requests_mock, tmp_path):
+    _, index_table = setup_dynamodb_card_index
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+
+    first = functions.Search.app.lambda_handler({"queryStringParameters": {"q": "Tapped  Scry"}}, None)
+    delete_catalog(index_table)
+    # Same query after normalization, the oracles are gone but the cached result is not
+    cached = functions.Search.app.lambda_handler({"queryStringParameters": {"q": "tapped scry"}}, None)
+
+    publish_generation(index_table, "20990101T000000Z")
+    refreshed = functions.Search.app.lambda_handler({"queryStringParameters": {"q": "tapped scry"}}, None)
+
+    assert first["statusCode"] == 200
+    assert cached == first
+    assert refreshed["statusCode"] == 404
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_cache_skips_scan_fallback(setup_dynamodb_card_index, requests_mock, tmp_path):
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+
+    # Without a snapshot a query without terms is answered by the scan, which can stop at its deadline
+    fallback = functions.Search.app.lambda_handler({"queryStringParameters": {"q": "//"}}, None)
+    indexed = functions.Search.app.lambda_handler({"queryStringParameters": {"q": "tapped scry"}}, None)
+
+    cached_queries = [json.loads(cache_key)[1] for cache_key in functions.Search.app.search_cache]
+    assert fallback["statusCode"] == 200
+    assert indexed["statusCode"] == 200
+    assert cached_queries == ["tapped scry"]
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+        "SEARCH_CACHE_MAX_BYTES": "2000",
+    },
+)
+def test_search_cache_evicts_least_recently_used(setup_dynamodb_card_index, requests_mock, tmp_path):
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+
+    # Only two of these responses fit, reading "tapped scry" again makes "double strike" the least recently used
+    for query in ["tapped scry", "double strike", "tapped scry", "ornithopter"]:
+        functions.Search.app.lambda_handler({"queryStringParameters": {"q": query}}, None)
+
+    cached_queries = [json.loads(cache_key)[1] for cache_key in functions.Search.app.search_cache]
+    assert functions.Search.app.search_cache.size_bytes <= 2000
+    assert cached_queries == ["tapped scry", "ornithopter"]
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+        "SEARCH_SHARED_CACHE": "true",
+    },
+)
+def test_search_shared_cache_serves_other_containers(setup_dynamodb_card_index, requests_mock, tmp_path):
+    _, index_table = setup_dynamodb_card_index
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+    first = functions.Search.app.lambda_handler({"queryStringParameters": {"q": "double strike"}}, None)
+
+    delete_catalog(index_table)
+    # A fresh container has an empty cache of its own
+    importlib.reload(functions.Search.app)
+    shared = functions.Search.app.lambda_handler({"queryStringParameters": {"q": "double strike"}}, None)
+
+    assert first["statusCode"] == 200
+    assert shared == first
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+        "SEARCH_META_TTL_SECONDS": "0",
+    },
+)
+def test_search_answers_conditional_requests(setup_dynamodb_card_index, requests_mock, tmp_path):
+    _, index_table = setup_dynamodb_card_index
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+
+    first = functions.Search.app.lambda_handler({"queryStringParameters": {"q": "tapped scry"}}, None)
+    etag = first["headers"]["ETag"]
+    meta = index_table.get_item(Key={"PK": "SearchIndex", "SK": "Meta"})["Item"]
+    cached = functions.Search.app.lambda_handler(
+        {"queryStringParameters": {"q": "tapped scry"}, "headers": {"if-none-match": etag}}, None
+    )
+
+    # Without a cached response the search runs again and its result is compared
+    functions.Search.app.search_cache.clear()
+    searched = functions.Search.app.lambda_handler(
+        {"queryStringParameters": {"q": "tapped scry"}, "headers": {"if-none-match": etag}}, None
+    )
+    # Only the ETag of the response matches, not any tag of the generation or the tag of another encoding
+    other_hash = functions.Search.app.lambda_handler(
+        {"queryStringParameters": {"q": "tapped scry"}, "headers": {"If-None-Match": f'"{meta["Generation"]}.0"'}}, None
+    )
+    other_encoding = functions.Search.app.lambda_handler(
+        {"queryStringParameters": {"q": "tapped scry"}, "headers": {"If-None-Match": f'{etag[:-1]}-gzip"'}}, None
+    )
+
+    delete_catalog(index_table)
+    publish_generation(index_table, "20990101T000000Z")
+    modified = functions.Search.app.lambda_handler(
+        {"queryStringParameters": {"q": "tapped scry"}, "headers": {"If-None-Match": etag}}, None
+    )
+
+    assert etag.startswith(f'"{meta["Generation"]}.')
+    assert first["headers"]["Cache-Control"] == "public, max-age=60"
+    assert cached["statusCode"] == 304
+    assert cached["headers"]["ETag"] == etag
+    assert searched == cached
+    assert other_hash == first
+    assert other_encoding == first
+    assert modified["statusCode"] == 404
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+        "COMPRESSION_MIN_BYTES": "0",
+    },
+)
+def test_search_etag_per_content_encoding(setup_dynamodb_card_index, requests_mock, tmp_path):
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+    query_string_parameters = {"q": "tapped scry"}
+
+    plain = functions.Search.app.lambda_handler({"queryStringParameters": query_string_parameters}, None)
+    compressed = functions.Search.app.lambda_handler(
+        {"queryStringParameters": query_string_parameters,
+         "headers": {"Accept": "application/vnd.mtg+json", "Accept-Encoding": "gzip"}}, None
+    )
+    gzip_etag = compressed["headers"]["ETag"]
+    # The cached response is compared with the ETag of the encoding the client holds, weak or strong
+    not_modified_gzip = functions.Search.app.lambda_handler(
+        {"queryStringParameters": query_string_parameters,
+         "headers": {"Accept": "application/vnd.mtg+json", "Accept-Encoding": "gzip", "If-None-Match": gzip_etag}}, None
+    )
+    not_modified_weak = functions.Search.app.lambda_handler(
+        {"queryStringParameters": query_string_parameters, "headers": {"If-None-Match": f"W/{plain['headers']['ETag']}"}},
+        None
+    )
+
+    assert compressed["headers"]["Content-Encoding"] == "gzip"
+    assert gzip_etag == f'{plain["headers"]["ETag"][:-1]}-gzip"'
+    assert not_modified_gzip["statusCode"] == 304
+    assert not_modified_gzip["headers"]["ETag"] == gzip_etag
+    assert not_modified_weak["statusCode"] == 304
@@ -0,0 +1,534 @@
+import importlib
+import json
+import os
+import time
+from unittest.mock import patch, MagicMock
+from boto3.dynamodb.conditions import Key
+from .conftest import DYNAMODB_TABLE_NAME, CARD_INDEX_TABLE_NAME
+
+BULK_DATA_URI = "https://data.scryfall.io/default-cards/default-cards-20240116100428.json"
+
+
+def renew_entities(requests_mock, tmp_path, json_test_file, updated_at=None):
+    with open(f"tests/integration/json_test_files/{json_test_file}", "r", encoding="utf-8") as file:
+        mock_file_content = file.read().encode("utf-8")
+
+    bulk_data = {"type": "default_cards", "download_uri": BULK_DATA_URI}
+    if updated_at is not None:
+        bulk_data.update({"updated_at": updated_at, "size": len(mock_file_content)})
+    requests_mock.get("https://api.scryfall.com/bulk-data", json={"data": [bulk_data]})
+    requests_mock.get(BULK_DATA_URI, content=mock_file_content)
+
+    with patch.dict(os.environ, {"DYNAMODB_TABLE_NAME": DYNAMODB_TABLE_NAME,
+                                 "CARDS_UPDATE_FREQUENCY": "7",
+                                 "CARD_JSON_LOCATION": str(tmp_path / "default-cards.json")}), \
+            patch("boto3.client", return_value=MagicMock()):
+        import functions.renew_entities.app
+        importlib.reload(functions.renew_entities.app)
+        return functions.renew_entities.app.lambda_handler({}, {})
+
+
+def search(query):
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+    return functions.Search.app.lambda_handler({"queryStringParameters": {"q": query}}, None)
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_renew_entities_writes_search_index(setup_dynamodb_card_index, requests_mock, tmp_path):
+    _, index_table = setup_dynamodb_card_index
+
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+
+    meta = index_table.get_item(Key={"PK": "SearchIndex", "SK": "Meta"})["Item"]
+    assert meta["DocumentCount"] == 30
+
+    postings = index_table.query(KeyConditionExpression=Key("PK").eq("Token#sliver"))["Items"]
+    assert len(postings) == 1
+    assert postings[0]["SK"].startswith(f"Generation#{meta['Generation']}#")
+    assert postings[0]["Postings"] == "44623693-51d6-49ad-8cd7-140505caf02f"
+
+    oracle = index_table.get_item(Key={"PK": "Oracle#44623693-51d6-49ad-8cd7-140505caf02f", "SK": "Catalog"})["Item"]
+    assert oracle["OracleName"] == "Fury Sliver"
+    assert oracle["PrintId"] == "0000579f-7b35-4ed3-b44c-db2a538066fe"
+    assert oracle["PrintCount"] == 1
+    assert oracle["SetCodes"] == ["tsp"]
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_unchanged_bulk_file_rebuilds_expiring_search_index(setup_dynamodb_card_index, requests_mock, tmp_path):
+    card_table, index_table = setup_dynamodb_card_index
+    updated_at = "2024-01-16T10:04:28.000+00:00"
+
+    renew_entities(requests_mock, tmp_path, "30_cards.json", updated_at)
+    head = card_table.get_item(Key={"PK": "IngestManifest", "SK": "Head"})["Item"]
+    # A day later most of the TTL remains, the ingest is skipped
+    with patch("time.time", return_value=time.time() + 24 * 60 * 60):
+        next_day = renew_entities(requests_mock, tmp_path, "30_cards.json", updated_at)
+    # Once less than half of it remains, the index is written again under a new generation
+    later_time = time.time() + 5 * 24 * 60 * 60
+    with patch("time.time", return_value=later_time), patch("time.gmtime", return_value=time.gmtime(later_time)):
+        later = renew_entities(requests_mock, tmp_path, "30_cards.json", updated_at)
+
+    assert next_day["Skipped"] is True
+    assert later is True
+    rebuilt_head = card_table.get_item(Key={"PK": "IngestManifest", "SK": "Head"})["Item"]
+    assert rebuilt_head["Generation"] != head["Generation"]
+    assert rebuilt_head["IndexRemoveAt"] > head["IndexRemoveAt"]
+    meta = index_table.get_item(Key={"PK": "SearchIndex", "SK": "Meta"})["Item"]
+    assert meta["Generation"] == rebuilt_head["Generation"]
+    assert meta["RemoveAt"] == rebuilt_head["IndexRemoveAt"]
+    assert len(json.loads(search("sliver")["Body"])["Items"]) == 1
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_index_intersects_terms(setup_dynamodb_card_index, requests_mock, tmp_path):
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+
+    # Both terms match multiple cards on their own, only Temple of Malady has both
+    result = search("Tapped scry")
+    body = json.loads(result["Body"])
+
+    assert result["statusCode"] == 200
+    assert [item["OracleName"] for item in body["Items"]] == ["Temple of Malady"]
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_index_matches_oracle_text(setup_dynamodb_card_index, requests_mock, tmp_path):
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+
+    result = search("double strike")
+    body = json.loads(result["Body"])
+
+    assert result["statusCode"] == 200
+    assert [item["OracleName"] for item in body["Items"]] == ["Fury Sliver"]
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_index_not_found(setup_dynamodb_card_index, requests_mock, tmp_path):
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+
+    result = search("sliver dragon")
+
+    assert result["statusCode"] == 404
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_index_scans_for_parts_of_words(setup_dynamodb_card_index, requests_mock, tmp_path):
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+
+    # Without the snapshot no posting has either query, they are only parts of words of names and oracle texts
+    arch = json.loads(search("Arch")["Body"])
+    burn = json.loads(search("urn")["Body"])
+
+    assert {"Archfiend of the Dross", "Archipelagore", "Rampant Growth"} <= {item["OracleName"] for item in arch["Items"]}
+    assert {"Turn // Burn", "Burning Prophet"} <= {item["OracleName"] for item in burn["Items"]}
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_falls_back_to_scan_without_index(setup_dynamodb_collection_with_items, setup_dynamodb_card_index):
+    result = search("Oblivion")
+    body = json.loads(result["Body"])
+
+    assert body["Items"][0]["OracleName"] == "Oblivion's Hunger"
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_index_paginates_with_cursor(setup_dynamodb_card_index, requests_mock, tmp_path):
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+
+    all_cards = functions.Search.app.lambda_handler({"queryStringParameters": {"q": "flying"}}, None)
+    expected_names = [item["OracleName"] for item in json.loads(all_cards["Body"])["Items"]]
+
+    found_names = []
+    query_string_parameters = {"q": "flying", "limit": "2"}
+    while True:
+        body = json.loads(functions.Search.app.lambda_handler({"queryStringParameters": query_string_parameters}, None)["Body"])
+        found_names.extend(item["OracleName"] for item in body["Items"])
+        if body["cursor"] is None:
+            break
+        query_string_parameters = {**query_string_parameters, "cursor": body["cursor"]}
+
+    assert len(expected_names) == 7
+    assert found_names == expected_names
+
+
+def remove_token_postings(index_table):
+    for item in index_table.scan()["Items"]:
+        if item["PK"].startswith("Token#"):
+            index_table.delete_item(Key={"PK": item["PK"], "SK": item["SK"]})
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_snapshot_answers_in_memory(setup_dynamodb_card_index, requests_mock, tmp_path):
+    _, index_table = setup_dynamodb_card_index
+
+    with patch.dict(os.environ, {"SEARCH_SNAPSHOT_DIRECTORY": str(tmp_path / "snapshots")}):
+        renew_entities(requests_mock, tmp_path, "30_cards.json")
+        meta = index_table.get_item(Key={"PK": "SearchIndex", "SK": "Meta"})["Item"]
+        assert (tmp_path / "snapshots" / meta["SnapshotKey"]).exists()
+
+        # Without the postings in DynamoDB only the snapshot can answer the search
+        remove_token_postings(index_table)
+        import functions.Search.app
+        importlib.reload(functions.Search.app)
+
+        found_names = []
+        query_string_parameters = {"q": "flying", "limit": "3"}
+        while True:
+            result = functions.Search.app.lambda_handler({"queryStringParameters": query_string_parameters}, None)
+            body = json.loads(result["Body"])
+            found_names.extend(item["OracleName"] for item in body["Items"])
+            if body["cursor"] is None:
+                break
+            query_string_parameters = {**query_string_parameters, "cursor": body["cursor"]}
+
+        not_found = functions.Search.app.lambda_handler({"queryStringParameters": {"q": "sliver dragon"}}, None)
+
+    assert sorted(found_names) == sorted([
+        "Spirit", "Siren Lookout", "Web", "Osai Vultures", "Archfiend of the Dross", "Ornithopter", "Hellkite Igniter"
+    ])
+    assert len(found_names) == 7
+    assert not_found["statusCode"] == 404
+    assert functions.Search.app.search_snapshot["Generation"] == meta["Generation"]
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_snapshot_matches_name_substrings(setup_dynamodb_card_index, requests_mock, tmp_path):
+    with patch.dict(os.environ, {"SEARCH_SNAPSHOT_DIRECTORY": str(tmp_path / "snapshots")}):
+        renew_entities(requests_mock, tmp_path, "30_cards.json")
+
+        # Neither query is a whole word, only the trigrams of the names can find them
+        arch = json.loads(search("Arch")["Body"])
+        split_cards = json.loads(search("//")["Body"])
+        burn = json.loads(search("urn")["Body"])
+
+    assert sorted({item["OracleName"] for item in arch["Items"]}) == ["Archfiend of the Dross", "Archipelagore"]
+    assert {item["OracleName"] for item in split_cards["Items"]} == {"Turn // Burn"}
+    assert {"Turn // Burn", "Burning Prophet"} <= {item["OracleName"] for item in burn["Items"]}
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_snapshot_ranks_name_matches_first(setup_dynamodb_card_index, requests_mock, tmp_path):
+    with patch.dict(os.environ, {"SEARCH_SNAPSHOT_DIRECTORY": str(tmp_path / "snapshots")}):
+        renew_entities(requests_mock, tmp_path, "30_cards.json")
+
+        # Both terms also appear in the oracle text of other cards
+        time_items = json.loads(search("time")["Body"])["Items"]
+        turn_items = json.loads(search("turn")["Body"])["Items"]
+        flying_items = json.loads(search("flying")["Body"])["Items"]
+
+    assert [item["OracleName"] for item in time_items] == ["Dig Through Time", "Godo, Bandit Warlord"]
+    assert turn_items[0]["OracleName"] == "Turn // Burn"
+    assert len(turn_items) == 6
+    # Spirit and Ornithopter only have flying as oracle text, the shortest texts rank first
+    assert {item["OracleName"] for item in flying_items[:2]} == {"Spirit", "Ornithopter"}
+    for items in (time_items, turn_items, flying_items):
+        scores = [item["Score"] for item in items]
+        assert scores == sorted(scores, reverse=True)
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_snapshot_suggests_corrected_names(setup_dynamodb_card_index, requests_mock, tmp_path):
+    with patch.dict(os.environ, {"SEARCH_SNAPSHOT_DIRECTORY": str(tmp_path / "snapshots")}):
+        renew_entities(requests_mock, tmp_path, "30_cards.json")
+
+        # A missing letter, a swap of two letters and two missing letters in a single word
+        hardened = search("hardend scalse")
+        ornithopter = search("ornitoptr")
+        unknown = search("sliver dragon")
+
+    assert hardened["statusCode"] == 404
+    assert json.loads(hardened["Body"])["suggestions"] == ["Hardened Scales"]
+    assert json.loads(ornithopter["Body"])["suggestions"] == ["Ornithopter"]
+    assert unknown["statusCode"] == 404
+    assert json.loads(unknown["Body"])["suggestions"] == []
+
+
+def found_names(result):
+    return sorted(item["OracleName"] for item in json.loads(result["Body"])["Items"])
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_snapshot_applies_filters(setup_dynamodb_card_index, requests_mock, tmp_path):
+    with patch.dict(os.environ, {"SEARCH_SNAPSHOT_DIRECTORY": str(tmp_path / "snapshots")}):
+        renew_entities(requests_mock, tmp_path, "30_cards.json")
+
+        green_creatures = search("t:creature mv<=3 c:g")
+        rakdos = search("c:br")
+        colorless = search("c:c")
+        rare_lands = search("r:rare t:land")
+        ixalan = search("s:xln")
+        big_spells = search("mv>=8")
+        flying_artifacts = search("flying t:artifact")
+
+    assert found_names(green_creatures) == ["Caller of the Claw", "Llanowar Elves"]
+    assert found_names(rakdos) == ["Kroxa, Titan of Death's Hunger"]
+    assert found_names(colorless) == ["Gilded Sentinel", "Ornithopter", "Strionic Resonator"]
+    assert found_names(rare_lands) == ["Temple of Malady"]
+    assert found_names(ixalan) == ["Gilded Sentinel", "Siren Lookout"]
+    assert found_names(big_spells) == ["Dig Through Time"]
+    assert found_names(flying_artifacts) == ["Ornithopter"]
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_index_applies_filters(setup_dynamodb_card_index, requests_mock, tmp_path):
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+
+    # Without a snapshot the filter postings are read from DynamoDB
+    green_creatures = search("t:creature mv<=3 c:g")
+    exact_colors = search("c=ub")
+    filtered_text = search("flying c:w")
+
+    assert found_names(green_creatures) == ["Caller of the Claw", "Llanowar Elves"]
+    assert exact_colors["statusCode"] == 404
+    assert found_names(filtered_text) == ["Osai Vultures", "Spirit"]
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_invalid_filters(setup_dynamodb_card_index, requests_mock, tmp_path):
+    # Without an index filters can not be answered
+    without_index = search("t:creature")
+
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+    invalid_mana_value = search("mv<=x")
+    invalid_color = search("c:rp")
+    invalid_operator = search("t>creature")
+
+    assert without_index["statusCode"] == 400
+    assert invalid_mana_value["statusCode"] == 400
+    assert invalid_color["statusCode"] == 400
+    assert invalid_operator["statusCode"] == 400
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_snapshot_summary_view(setup_dynamodb_card_index, requests_mock, tmp_path):
+    _, index_table = setup_dynamodb_card_index
+
+    with patch.dict(os.environ, {"SEARCH_SNAPSHOT_DIRECTORY": str(tmp_path / "snapshots")}):
+        renew_entities(requests_mock, tmp_path, "30_cards.json")
+        for item in index_table.scan()["Items"]:
+            if item["PK"].startswith("Oracle#"):
+                index_table.delete_item(Key={"PK": item["PK"], "SK": item["SK"]})
+
+        # The summary fields are all in the snapshot, no oracle has to be read
+        import functions.Search.app
+        importlib.reload(functions.Search.app)
+        summary = functions.Search.app.lambda_handler(
+            {"queryStringParameters": {"q": "tapped scry", "view": "summary"}}, None
+        )
+
+    items = json.loads(summary["Body"])["Items"]
+    assert len(items) == 1
+    assert set(items[0]) == {"OracleId", "PrintId", "OracleName", "SetName", "Price", "ImageUrl", "PrintCount", "Score"}
+    assert items[0]["OracleName"] == "Temple of Malady"
+    assert items[0]["ImageUrl"].startswith("https://cards.scryfall.io/png/")
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_index_projects_fields(setup_dynamodb_card_index, requests_mock, tmp_path):
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+    result = functions.Search.app.lambda_handler(
+        {"queryStringParameters": {"q": "double strike", "fields": "OracleName,PrintCount"}}, None
+    )
+    invalid = functions.Search.app.lambda_handler(
+        {"queryStringParameters": {"q": "double strike", "view": "full"}}, None
+    )
+
+    assert json.loads(result["Body"])["Items"] == [{"OracleName": "Fury Sliver", "PrintCount": 1}]
+    assert invalid["statusCode"] == 400
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_index_projects_image_url_of_catalog(setup_dynamodb_card_index, requests_mock, tmp_path):
+    renew_entities(requests_mock, tmp_path, "30_cards.json")
+    image_url = "https://cards.scryfall.io/png/front/0/0/0000579f-7b35-4ed3-b44c-db2a538066fe.png?1562894979"
+
+    import functions.Search.app
+    importlib.reload(functions.Search.app)
+    # Without a snapshot the catalog items are read from DynamoDB, they keep ImageUrl at the top level
+    fields = functions.Search.app.lambda_handler(
+        {"queryStringParameters": {"q": "double strike", "fields": "OracleName,ImageUrl"}}, None
+    )
+    summary = functions.Search.app.lambda_handler(
+        {"queryStringParameters": {"q": "double strike", "view": "summary"}}, None
+    )
+
+    assert json.loads(fields["Body"])["Items"] == [{"OracleName": "Fury Sliver", "ImageUrl": image_url}]
+    assert json.loads(summary["Body"])["Items"][0]["ImageUrl"] == image_url
+
+
+@patch.dict(
+    os.environ,
+    {
+        "DYNAMODB_TABLE": DYNAMODB_TABLE_NAME,
+        "CARD_INDEX_TABLE_NAME": CARD_INDEX_TABLE_NAME,
+        "DISABLE_XRAY": "True",
+        "EVENT_BUS_ARN": "",
+    },
+)
+def test_search_returns_oracles_once(setup_dynamodb_card_index, requests_mock, tmp_path):
+    with patch.dict(os.environ, {"SEARCH_SNAPSHOT_DIRECTORY": str(tmp_path / "snapshots")}):
+        renew_entities(requests_mock, tmp_path, "reprints.json")
+
+        # Three prints of Fury Sliver, the search finds the oracle once
+        by_name = json.loads(search("fury sliver")["Body"])["Items"]
+        # The oldest print is the only one in Time Spiral
+        by_set = json.loads(search("s:tsp")["Body"])["Items"]
+
+    assert len(by_name) == 1
+    assert by_name[0]["OracleId"] == "44623693-51d6-49ad-8cd7-140505caf02f"
+    assert by_name[0]["PrintCount"] == 3
+    # The most recent print represents the oracle
+    assert by_name[0]["PrintId"] == "0000579f-7b35-4ed3-b44c-db2a538066f1"
+    assert by_name[0]["SetName"] == "Time Spiral Remastered"
+    assert [item["OracleName"] for item in by_set] == ["Fury Sliver"]
@@ -1,3 +1,4 @@
+import importlib
 import json
 import os
 from unittest.mock import patch
@@ -44,6 +45,92 @@ def test_get_card_by_id_not_found(setup_dynamodb):
     assert response['statusCode'] == 404
 
 
+
+@patch.dict(os.environ, {"DYNAMODB_TABLE_NAME": DYNAMODB_TABLE_NAME, "DISABLE_XRAY": "True"})
+def test_get_card_summary_view(setup_dynamodb):
+    from functions.get_card.app import lambda_handler
+
+    table = setup_dynamodb
+    for card in setup_items():
+        table.put_item(Item=card)
+
+    event = {
+        'pathParameters': {'oracle_id': '562d71b9-1646-474e-9293-55da6947a758', 'print_id': '67f4c93b-080c-4196-b095-6a120a221988'},
+        'queryStringParameters': {'view': 'summary', 'fields': 'Rarity'}
+    }
+    response = lambda_handler(event, {})
+
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    # moto does not project list elements, so the value of ImageUrl is not checked here
+    assert set(body) == {"OracleId", "PrintId", "OracleName", "SetName", "Price", "ImageUrl", "Rarity"}
+    assert body["OracleName"] == "Agadeem's Awakening // Agadeem, the Undercrypt"
+    assert body["Price"] == "18.27"
+    assert body["Rarity"] == "mythic"
+
+
+@patch.dict(os.environ, {"DYNAMODB_TABLE_NAME": DYNAMODB_TABLE_NAME, "DISABLE_XRAY": "True"})
+def test_get_card_unknown_fields(setup_dynamodb):
+    from functions.get_card.app import lambda_handler
+
+    event = {
+        'pathParameters': {'oracle_id': '562d71b9-1646-474e-9293-55da6947a758', 'print_id': '67f4c93b-080c-4196-b095-6a120a221988'},
+        'queryStringParameters': {'fields': 'OracleName,Secret'}
+    }
+    response = lambda_handler(event, {})
+
+    assert response['statusCode'] == 400
+
+@patch.dict(os.environ, {"DYNAMODB_TABLE_NAME": DYNAMODB_TABLE_NAME, "DISABLE_XRAY": "True"})
+def test_get_card_caches_responses(setup_dynamodb):
+    import functions.get_card.app
+    get_card = importlib.reload(functions.get_card.app)
+
+    table = setup_dynamodb
+    card = setup_items()[0]
+    missing_event = {'pathParameters': {'oracle_id': card['OracleId'], 'print_id': '0dd894cb-1968-471c-af08-ea7ec5ce8428'}}
+    event = {'pathParameters': {'oracle_id': card['OracleId'], 'print_id': card['PrintId']}}
+
+    table.put_item(Item=card)
+    found = get_card.lambda_handler(event, {})
+    not_found = get_card.lambda_handler(missing_event, {})
+    # Both answers come from the cache now, even though the table changed in the meantime
+    table.delete_item(Key={'PK': card['PK'], 'SK': card['SK']})
+    table.put_item(Item={**card, 'SK': 'PrintId#0dd894cb-1968-471c-af08-ea7ec5ce8428'})
+
+    assert get_card.lambda_handler(event, {}) == found
+    assert get_card.lambda_handler(missing_event, {}) == not_found
+    assert not_found['statusCode'] == 404
+    assert (get_card.card_cache.hits, get_card.card_cache.misses) == (2, 2)
+
+    # Not found answers expire sooner than the cards
+    for entry in get_card.card_cache.entries.values():
+        if entry["Response"]["statusCode"] == 404:
+            entry["ExpiresAt"] = 0
+    assert get_card.lambda_handler(missing_event, {})['statusCode'] == 200
+    assert get_card.lambda_handler(event, {}) == found
+
+
+@patch.dict(os.environ, {"DYNAMODB_TABLE_NAME": DYNAMODB_TABLE_NAME, "DISABLE_XRAY": "True"})
+def test_get_card_answers_conditional_requests(setup_dynamodb):
+    import functions.get_card.app
+    get_card = importlib.reload(functions.get_card.app)
+
+    table = setup_dynamodb
+    card = setup_items()[0]
+    table.put_item(Item=card)
+    event = {'pathParameters': {'oracle_id': card['OracleId'], 'print_id': card['PrintId']}}
+
+    found = get_card.lambda_handler(event, {})
+    etag = found['headers']['ETag']
+    not_modified = get_card.lambda_handler({**event, 'headers': {'If-None-Match': etag}}, {})
+    other_etag = get_card.lambda_handler({**event, 'headers': {'If-None-Match': '"something-else"'}}, {})
+
+    assert found['headers']['Cache-Control'] == "public, max-age=300"
+    assert not_modified == {"statusCode": 304, "headers": found['headers'], "body": ""}
+    assert other_etag == found
+
+
 def setup_items():
     return [
         {
@@ -1,5 +1,9 @@
+import base64
+import gzip
+import importlib
 import json
 import os
+import boto3
 from unittest.mock import patch
 from .conftest import DYNAMODB_TABLE_NAME
 
@@ -26,6 +30,212 @@ def test_get_collection(setup_dynamodb):
     assert len(body[0]["CardFaces"]) == 2
 
 
+
+@patch.dict(os.environ, {"DYNAMODB_TABLE_NAME": DYNAMODB_TABLE_NAME, "DISABLE_XRAY": "True"})
+def test_get_collection_selected_fields(setup_dynamodb):
+    from functions.get_cards.app import lambda_handler
+
+    table = setup_dynamodb
+    for card in setup_items():
+        table.put_item(Item=card)
+
+    event = {
+        'pathParameters': {'oracle_id': '562d71b9-1646-474e-9293-55da6947a758'},
+        'queryStringParameters': {'fields': 'OracleName,Price'}
+    }
+    response = lambda_handler(event, {})
+
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])["Items"]
+    assert body == [{"OracleName": "Agadeem's Awakening // Agadeem, the Undercrypt", "Price": "18.27"}]
+
+@patch.dict(os.environ, {"DYNAMODB_TABLE_NAME": DYNAMODB_TABLE_NAME, "DISABLE_XRAY": "True"})
+def test_get_collection_selects_print(setup_dynamodb):
+    lambda_handler = reload_get_cards().lambda_handler
+
+    table = setup_dynamodb
+    for card in setup_reprints():
+        table.put_item(Item=card)
+    table.put_item(Item={
+        "PK": f'OracleId#{SLIVER_ORACLE_ID}',
+        "SK": "Summary",
+        "OracleId": SLIVER_ORACLE_ID,
+        "LatestPrintId": "0000579f-7b35-4ed3-b44c-db2a538066f1",
+        "CheapestPrintId": "0000579f-7b35-4ed3-b44c-db2a538066f2",
+        "PrintCount": 3
+    })
+
+    def select(value):
+        event = {
+            'pathParameters': {'oracle_id': SLIVER_ORACLE_ID},
+            'queryStringParameters': {'select': value, 'fields': 'PrintId'}
+        }
+        return lambda_handler(event, {})
+
+    every_print = lambda_handler({'pathParameters': {'oracle_id': SLIVER_ORACLE_ID}}, {})
+
+    assert json.loads(select('latest')['body'])["Items"] == [{"PrintId": "0000579f-7b35-4ed3-b44c-db2a538066f1"}]
+    assert json.loads(select('cheapest')['body'])["Items"] == [{"PrintId": "0000579f-7b35-4ed3-b44c-db2a538066f2"}]
+    assert select('oldest')['statusCode'] == 400
+    # The summary item is not one of the prints
+    assert len(json.loads(every_print['body'])["Items"]) == 3
+
+
+@patch.dict(os.environ, {"DYNAMODB_TABLE_NAME": DYNAMODB_TABLE_NAME, "DISABLE_XRAY": "True"})
+def test_get_collection_selects_print_without_summary(setup_dynamodb):
+    lambda_handler = reload_get_cards().lambda_handler
+
+    table = setup_dynamodb
+    for card in setup_reprints():
+        table.put_item(Item=card)
+
+    latest = lambda_handler({
+        'pathParameters': {'oracle_id': SLIVER_ORACLE_ID},
+        'queryStringParameters': {'select': 'latest', 'view': 'summary'}
+    }, {})
+    # The print without a price is not the cheapest one
+    cheapest = lambda_handler({
+        'pathParameters': {'oracle_id': SLIVER_ORACLE_ID},
+        'queryStringParameters': {'select': 'cheapest', 'fields': 'PrintId'}
+    }, {})
+
+    assert json.loads(latest['body'])["Items"][0]["SetName"] == "Time Spiral Remastered"
+    assert json.loads(cheapest['body'])["Items"] == [{"PrintId": "0000579f-7b35-4ed3-b44c-db2a538066f2"}]
+
+
+@patch.dict(os.environ, {"DYNAMODB_TABLE_NAME": DYNAMODB_TABLE_NAME, "CARD_INDEX_TABLE_NAME": "test-card-index-table",
+                         "DISABLE_XRAY": "True"})
+def test_get_collection_cache_follows_generation(setup_dynamodb):
+    table = setup_dynamodb
+    index_table = create_index_table()
+    for card in setup_reprints():
+        table.put_item(Item=card)
+    index_table.put_item(Item={"PK": "SearchIndex", "SK": "Meta", "Generation": "20240101T000000Z"})
+    get_cards = reload_get_cards()
+    event = {'pathParameters': {'oracle_id': SLIVER_ORACLE_ID}, 'queryStringParameters': {'fields': 'PrintId'}}
+
+    first = get_cards.lambda_handler(event, {})
+    table.delete_item(Key={'PK': f'OracleId#{SLIVER_ORACLE_ID}', 'SK': 'PrintId#0000579f-7b35-4ed3-b44c-db2a538066f0'})
+    cached = get_cards.lambda_handler(event, {})
+
+    # The next ingest publishes a new generation, the cached response is no longer used
+    index_table.put_item(Item={"PK": "SearchIndex", "SK": "Meta", "Generation": "20240102T000000Z"})
+    get_cards.catalog_meta.clear()
+    renewed = get_cards.lambda_handler(event, {})
+
+    # A client with the ETag of the cached response gets a 304 without a read, another hash of the generation does not
+    not_modified = get_cards.lambda_handler({**event, 'headers': {'If-None-Match': renewed['headers']['ETag']}}, {})
+    other_hash = get_cards.lambda_handler({**event, 'headers': {'If-None-Match': '"20240102T000000Z.0"'}}, {})
+
+    assert len(json.loads(first['body'])["Items"]) == 3
+    assert cached == first
+    assert len(json.loads(renewed['body'])["Items"]) == 2
+    assert first['headers']['ETag'].startswith('"20240101T000000Z.')
+    assert renewed['headers']['ETag'].startswith('"20240102T000000Z.')
+    assert not_modified['statusCode'] == 304
+    assert other_hash == renewed
+    assert (get_cards.card_cache.hits, get_cards.card_cache.misses) == (3, 2)
+
+
+@patch.dict(os.environ, {"DYNAMODB_TABLE_NAME": DYNAMODB_TABLE_NAME, "DISABLE_XRAY": "True"})
+def test_get_collection_compresses_large_responses(setup_dynamodb):
+    lambda_handler = reload_get_cards().lambda_handler
+
+    table = setup_dynamodb
+    for card in setup_items():
+        table.put_item(Item=card)
+
+    oracle_id = '562d71b9-1646-474e-9293-55da6947a758'
+    plain = lambda_handler({'pathParameters': {'oracle_id': oracle_id}}, {})
+    compressed = lambda_handler({
+        'pathParameters': {'oracle_id': oracle_id},
+        'headers': {'accept': 'application/vnd.mtg+json, */*', 'accept-encoding': 'br;q=0, gzip, deflate'}
+    }, {})
+    # API Gateway only decodes the base64 body for a client that accepts the binary media type first
+    text_only = lambda_handler({
+        'pathParameters': {'oracle_id': oracle_id},
+        'headers': {'Accept': 'application/json, application/vnd.mtg+json', 'Accept-Encoding': 'gzip'}
+    }, {})
+    small = lambda_handler({
+        'pathParameters': {'oracle_id': oracle_id},
+        'queryStringParameters': {'fields': 'Price'},
+        'headers': {'Accept': 'application/vnd.mtg+json', 'Accept-Encoding': 'gzip'}
+    }, {})
+
+    assert "isBase64Encoded" not in plain
+    assert plain['headers']['Vary'] == "Accept, Accept-Encoding"
+    assert "isBase64Encoded" not in text_only
+    assert text_only['body'] == plain['body']
+    assert compressed['isBase64Encoded'] is True
+    assert compressed['headers']['Content-Encoding'] == "gzip"
+    assert gzip.decompress(base64.b64decode(compressed['body'])).decode("utf-8") == plain['body']
+    # Bodies below the threshold are not worth the encoding
+    assert "Content-Encoding" not in small['headers']
+    assert json.loads(small['body']) == {"Items": [{"Price": "18.27"}]}
+
+
+@patch.dict(os.environ, {"DYNAMODB_TABLE_NAME": DYNAMODB_TABLE_NAME, "DISABLE_XRAY": "True"})
+def test_get_collection_etag_per_content_encoding(setup_dynamodb):
+    lambda_handler = reload_get_cards().lambda_handler
+
+    table = setup_dynamodb
+    for card in setup_items():
+        table.put_item(Item=card)
+
+    event = {'pathParameters': {'oracle_id': '562d71b9-1646-474e-9293-55da6947a758'}}
+    plain = lambda_handler(event, {})
+    binary_headers = {'Accept': 'application/vnd.mtg+json', 'Accept-Encoding': 'gzip'}
+    compressed = lambda_handler({**event, 'headers': binary_headers}, {})
+    gzip_etag = compressed['headers']['ETag']
+    # Either representation revalidates, also with a weak validator
+    not_modified_gzip = lambda_handler({**event, 'headers': {**binary_headers, 'If-None-Match': gzip_etag}}, {})
+    not_modified_weak = lambda_handler({**event, 'headers': {'If-None-Match': f"W/{plain['headers']['ETag']}"}}, {})
+
+    assert gzip_etag == f'{plain["headers"]["ETag"][:-1]}-gzip"'
+    assert not_modified_gzip['statusCode'] == 304
+    assert not_modified_gzip['headers']['ETag'] == gzip_etag
+    assert not_modified_weak['statusCode'] == 304
+
+
+SLIVER_ORACLE_ID = "44623693-51d6-49ad-8cd7-140505caf02f"
+
+
+def reload_get_cards():
+    # Every test starts with an empty cache
+    import functions.get_cards.app
+    return importlib.reload(functions.get_cards.app)
+
+
+def create_index_table():
+    return boto3.resource("dynamodb").create_table(
+        TableName="test-card-index-table",
+        KeySchema=[{'AttributeName': 'PK', 'KeyType': 'HASH'}, {'AttributeName': 'SK', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'PK', 'AttributeType': 'S'}, {'AttributeName': 'SK', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def setup_reprints():
+    prints = [
+        ("0000579f-7b35-4ed3-b44c-db2a538066f0", "Time Spiral", "2006-10-06", "0.00"),
+        ("0000579f-7b35-4ed3-b44c-db2a538066f1", "Time Spiral Remastered", "2021-03-19", "0.35"),
+        ("0000579f-7b35-4ed3-b44c-db2a538066f2", "Premium Deck Series: Slivers", "2009-11-20", "0.21"),
+    ]
+    return [
+        {
+            "PK": f'OracleId#{SLIVER_ORACLE_ID}',
+            "SK": f'PrintId#{print_id}',
+            "OracleId": SLIVER_ORACLE_ID,
+            "PrintId": print_id,
+            "OracleName": "Fury Sliver",
+            "SetName": set_name,
+            "ReleasedAt": released_at,
+            "Price": price,
+        }
+        for print_id, set_name, released_at, price in prints
+    ]
+
+
 def setup_items():
     return [
         {
@@ -0,0 +1,122 @@
+import base64
+import gzip
+import importlib
+import json
+import os
+from unittest.mock import patch
+from .conftest import DYNAMODB_TABLE_NAME
+
+SLIVER_ORACLE_ID = "44623693-51d6-49ad-8cd7-140505caf02f"
+AGADEEM_ORACLE_ID = "562d71b9-1646-474e-9293-55da6947a758"
+
+
+def get_cards_batch(keys, query_string_parameters=None, headers=None):
+    import functions.get_cards_batch.app
+    importlib.reload(functions.get_cards_batch.app)
+    event = {"body": json.dumps({"Keys": keys}), "queryStringParameters": query_string_parameters, "headers": headers}
+    return functions.get_cards_batch.app.lambda_handler(event, {})
+
+
+@patch.dict(os.environ, {"DYNAMODB_TABLE_NAME": DYNAMODB_TABLE_NAME, "DISABLE_XRAY": "True"})
+def test_get_cards_batch_keeps_request_order(setup_dynamodb):
+    table = setup_dynamodb
+    for card in setup_items():
+        table.put_item(Item=card)
+
+    response = get_cards_batch([
+        {"OracleId": SLIVER_ORACLE_ID, "PrintId": "0000579f-7b35-4ed3-b44c-db2a538066f1"},
+        {"OracleId": AGADEEM_ORACLE_ID, "PrintId": "67f4c93b-080c-4196-b095-6a120a221988"},
+        {"OracleId": AGADEEM_ORACLE_ID, "PrintId": "0dd894cb-1968-471c-af08-ea7ec5ce8428"},
+        {"OracleId": SLIVER_ORACLE_ID, "PrintId": "0000579f-7b35-4ed3-b44c-db2a538066f1"},
+    ], {"fields": "PrintId,SetName"})
+
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    assert body["Items"] == [
+        {"PrintId": "0000579f-7b35-4ed3-b44c-db2a538066f1", "SetName": "Time Spiral Remastered"},
+        {"PrintId": "67f4c93b-080c-4196-b095-6a120a221988", "SetName": "Zendikar Rising"},
+        None,
+        {"PrintId": "0000579f-7b35-4ed3-b44c-db2a538066f1", "SetName": "Time Spiral Remastered"},
+    ]
+    assert body["UnprocessedKeys"] == []
+
+
+@patch.dict(os.environ, {"DYNAMODB_TABLE_NAME": DYNAMODB_TABLE_NAME, "DISABLE_XRAY": "True"})
+def test_get_cards_batch_resolves_latest_print(setup_dynamodb):
+    table = setup_dynamodb
+    for card in setup_items():
+        table.put_item(Item=card)
+
+    # Without a card index table the prints of the oracle are queried
+    response = get_cards_batch([
+        {"OracleId": SLIVER_ORACLE_ID, "PrintId": "latest"},
+        {"OracleId": AGADEEM_ORACLE_ID},
+        {"OracleId": "00000000-0000-0000-0000-000000000000"},
+    ], {"fields": "PrintId"})
+
+    body = json.loads(response["body"])
+    assert body["Items"] == [
+        {"PrintId": "0000579f-7b35-4ed3-b44c-db2a538066f1"},
+        {"PrintId": "67f4c93b-080c-4196-b095-6a120a221988"},
+        None,
+    ]
+
+
+@patch.dict(os.environ, {"DYNAMODB_TABLE_NAME": DYNAMODB_TABLE_NAME, "DISABLE_XRAY": "True"})
+def test_get_cards_batch_invalid_keys(setup_dynamodb):
+    too_many = get_cards_batch([{"OracleId": SLIVER_ORACLE_ID}] * 301)
+    without_oracle = get_cards_batch([{"PrintId": "latest"}])
+
+    assert too_many["statusCode"] == 400
+    assert without_oracle["statusCode"] == 400
+    assert json.loads(without_oracle["body"])["Message"] == "every key needs an OracleId"
+
+
+@patch.dict(os.environ, {"DYNAMODB_TABLE_NAME": DYNAMODB_TABLE_NAME, "DISABLE_XRAY": "True"})
+def test_get_cards_batch_compresses_large_responses(setup_dynamodb):
+    table = setup_dynamodb
+    for card in setup_items():
+        table.put_item(Item=card)
+
+    # The request body arrives as text, API Gateway decodes the compressed response for the binary media type
+    response = get_cards_batch(
+        [{"OracleId": SLIVER_ORACLE_ID}] * 20,
+        headers={"Content-Type": "application/json", "Accept": "application/vnd.mtg+json", "Accept-Encoding": "gzip"}
+    )
+
+    assert response["isBase64Encoded"] is True
+    assert response["headers"]["Content-Encoding"] == "gzip"
+    body = json.loads(gzip.decompress(base64.b64decode(response["body"])))
+    assert [item["SetName"] for item in body["Items"]] == ["Time Spiral Remastered"] * 20
+
+
+def setup_items():
+    prints = [
+        ("0000579f-7b35-4ed3-b44c-db2a538066f0", "Time Spiral", "2006-10-06"),
+        ("0000579f-7b35-4ed3-b44c-db2a538066f1", "Time Spiral Remastered", "2021-03-19"),
+        ("0000579f-7b35-4ed3-b44c-db2a538066f2", "Premium Deck Series: Slivers", "2009-11-20"),
+    ]
+    return [
+        {
+            "PK": f'OracleId#{SLIVER_ORACLE_ID}',
+            "SK": f'PrintId#{print_id}',
+            "OracleId": SLIVER_ORACLE_ID,
+            "PrintId": print_id,
+            "OracleName": "Fury Sliver",
+            "SetName": set_name,
+            "ReleasedAt": released_at,
+            "Price": "0.25",
+        }
+        for print_id, set_name, released_at in prints
+    ] + [
+        {
+            "PK": f'OracleId#{AGADEEM_ORACLE_ID}',
+            "SK": 'PrintId#67f4c93b-080c-4196-b095-6a120a221988',
+            "OracleId": AGADEEM_ORACLE_ID,
+            "PrintId": "67f4c93b-080c-4196-b095-6a120a221988",
+            "OracleName": "Agadeem's Awakening // Agadeem, the Undercrypt",
+            "SetName": "Zendikar Rising",
+            "ReleasedAt": "2020-09-25",
+            "Price": "18.27",
+        }
+    ]
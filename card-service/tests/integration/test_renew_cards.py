@@ -1,12 +1,16 @@
+import gzip
 import importlib
 import json
 from unittest.mock import patch, MagicMock
 import os
 import boto3
+import pytest
 from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
 from moto import mock_dynamodb
 import logging
 import time
+import write_rate
 
 logger = logging.getLogger()
 logger.setLevel("INFO")
@@ -380,11 +384,14 @@ def test_renew_cards_ten_cards(requests_mock, aws_credentials):
         functions.renew_entities.app.lambda_handler({}, {})
 
         # Assert
-        cards = table.scan()
+        items = table.scan()['Items']
+        cards = [item for item in items if item['SK'].startswith('PrintId#')]
+        summaries = [item for item in items if item['SK'] == 'Summary']
 
         assert requests_mock.called
         assert requests_mock.call_count == 2
-        assert len(cards['Items']) == 10
+        assert len(cards) == 10
+        assert len(summaries) == len({card['OracleId'] for card in cards})
         os.remove('tests/integration/ten_cards.json')
 
 
@@ -421,8 +428,8 @@ def test_renew_cards_thirty_cards(requests_mock, aws_credentials):
         functions.renew_entities.app.lambda_handler({}, {})
 
         # Assert
-        cards = table.scan()
-        assert len(cards['Items']) == 30
+        cards = [item for item in table.scan()['Items'] if item['SK'].startswith('PrintId#')]
+        assert len(cards) == 30
         assert requests_mock.called
         assert requests_mock.call_count == 2
         os.remove('tests/integration/thirty_cards.json')
@@ -469,10 +476,718 @@ def test_renew_cards_has_correct_ttl(requests_mock, aws_credentials):
 
         assert requests_mock.called
         assert requests_mock.call_count == 2
-        assert len(single_face_card['Items']) == 1
+        # The print and the summary item of its oracle
+        assert len(single_face_card['Items']) == 2
 
+        # Items in the bulk file stay, only retired items get a RemoveAt
         for item in single_face_card['Items']:
-            print(item['RemoveAt'])
+            assert 'RemoveAt' not in item
+
+        requests_mock.get("https://data.scryfall.io/default-cards/default-cards-20240116100428.json",
+                          content=b"[]")
+        functions.renew_entities.app.lambda_handler({}, {})
+
+        retired_card = table.query(
+            KeyConditionExpression=Key('PK').eq('OracleId#44623693-51d6-49ad-8cd7-140505caf02f')
+        )
+        assert len(retired_card['Items']) == 2
+        for item in retired_card['Items']:
             assert item['RemoveAt'] > int(time.time()) + CARDS_UPDATE_FREQUENCY
             assert item['RemoveAt'] <= int(time.time()) + 2 * CARDS_UPDATE_FREQUENCY
         os.remove('tests/integration/correct_ttl.json')
+
+
+@patch.dict(os.environ, {"DISABLE_XRAY": "True",
+                         "EVENT_BUS_ARN": "",
+                         "DYNAMODB_TABLE_NAME": "test-card-table",
+                         "CARDS_UPDATE_FREQUENCY": "7",
+                         "CARD_JSON_LOCATION": "tests/integration/reprints.json"})
+@mock_dynamodb
+def test_renew_cards_writes_oracle_summary(requests_mock, aws_credentials):
+    # Arrange
+    with patch('boto3.client') as mock_client:
+        table = setup_table()
+        mock_client.return_value = MagicMock()
+
+        bulk_data_mock_response = {
+            "data": [
+                {"type": "default_cards",
+                 "download_uri": "https://data.scryfall.io/default-cards/default-cards-20240116100428.json"}
+            ]
+        }
+        with open('tests/integration/json_test_files/reprints.json', 'r') as file:
+            json_data = json.load(file)
+        # The oldest print has no price, the one from 2009 is the cheapest
+        json_data[0]['prices']['eur'] = None
+        json_data[2]['prices']['eur'] = '0.02'
+        mock_file_content = json.dumps(json_data).encode('utf-8')
+
+        requests_mock.get("https://api.scryfall.com/bulk-data", json=bulk_data_mock_response)
+        requests_mock.get("https://data.scryfall.io/default-cards/default-cards-20240116100428.json",
+                          content=mock_file_content)
+
+        # Act
+        import functions.renew_entities.app
+        importlib.reload(functions.renew_entities.app)
+        functions.renew_entities.app.lambda_handler({}, {})
+
+        # Assert
+        summary = table.get_item(
+            Key={'PK': 'OracleId#44623693-51d6-49ad-8cd7-140505caf02f', 'SK': 'Summary'}
+        )['Item']
+
+        assert summary['LatestPrintId'] == '0000579f-7b35-4ed3-b44c-db2a538066f1'
+        assert summary['LatestReleasedAt'] == '2021-03-19'
+        assert summary['CheapestPrintId'] == '0000579f-7b35-4ed3-b44c-db2a538066f2'
+        assert summary['CheapestPrice'] == '0.02'
+        assert summary['FirstReleasedAt'] == '2006-10-06'
+        assert summary['PrintCount'] == 3
+        os.remove('tests/integration/reprints.json')
+
+
+@patch.dict(os.environ, {"DISABLE_XRAY": "True",
+                         "EVENT_BUS_ARN": "",
+                         "DYNAMODB_TABLE_NAME": "test-card-table",
+                         "CARDS_UPDATE_FREQUENCY": "7",
+                         "CARD_JSON_LOCATION": "tests/integration/changed_reprints.json"})
+@mock_dynamodb
+def test_renew_cards_writes_only_changed_prints(requests_mock, aws_credentials):
+    # Arrange
+    with patch('boto3.client') as mock_client:
+        table = setup_table()
+        mock_client.return_value = MagicMock()
+
+        bulk_data_mock_response = {
+            "data": [
+                {"type": "default_cards",
+                 "download_uri": "https://data.scryfall.io/default-cards/default-cards-20240116100428.json"}
+            ]
+        }
+        with open('tests/integration/json_test_files/reprints.json', 'r') as file:
+            json_data = json.load(file)
+
+        requests_mock.get("https://api.scryfall.com/bulk-data", json=bulk_data_mock_response)
+        requests_mock.get("https://data.scryfall.io/default-cards/default-cards-20240116100428.json",
+                          content=json.dumps(json_data).encode('utf-8'))
+
+        import functions.renew_entities.app
+        importlib.reload(functions.renew_entities.app)
+        functions.renew_entities.app.lambda_handler({}, {})
+
+        # The newest print gets a new price and the oldest print leaves the bulk file
+        changed_data = [dict(json_data[1], prices={**json_data[1]['prices'], 'eur': '1.50'}), json_data[2]]
+        requests_mock.get("https://data.scryfall.io/default-cards/default-cards-20240116100428.json",
+                          content=json.dumps(changed_data).encode('utf-8'))
+
+        # Act
+        report = functions.renew_entities.app.lambda_handler({"DryRun": True}, {})
+        dry_run_prices = {item['PrintId']: item['Price'] for item in table.scan()['Items'] if 'Price' in item}
+        # Marks the unchanged print, a write would replace the whole item
+        table.update_item(
+            Key={'PK': f'OracleId#{json_data[2]["oracle_id"]}', 'SK': f'PrintId#{json_data[2]["id"]}'},
+            UpdateExpression="SET Untouched = :untouched",
+            ExpressionAttributeValues={":untouched": True}
+        )
+        functions.renew_entities.app.lambda_handler({}, {})
+
+        # Assert
+        assert report['NewPrints'] == 0
+        assert report['ChangedPrints'] == 1
+        assert report['UnchangedPrints'] == 1
+        assert report['RetiredPrints'] == 1
+        assert report['Samples']['Retired'] == [json_data[0]['id']]
+        assert dry_run_prices[json_data[1]['id']] == json_data[1]['prices']['eur']
+
+        prints = {
+            item['PrintId']: item for item in table.query(
+                KeyConditionExpression=Key('PK').eq(f'OracleId#{json_data[0]["oracle_id"]}') &
+                Key('SK').begins_with('PrintId#')
+            )['Items']
+        }
+        assert prints[json_data[1]['id']]['Price'] == '1.50'
+        assert prints[json_data[2]['id']]['Untouched'] is True
+        assert 'RemoveAt' in prints[json_data[0]['id']]
+        assert 'RemoveAt' not in prints[json_data[1]['id']]
+
+        summary = table.get_item(
+            Key={'PK': f'OracleId#{json_data[0]["oracle_id"]}', 'SK': 'Summary'}
+        )['Item']
+        assert summary['PrintCount'] == 2
+        os.remove('tests/integration/changed_reprints.json')
+
+
+@patch.dict(os.environ, {"DISABLE_XRAY": "True",
+                         "EVENT_BUS_ARN": "",
+                         "DYNAMODB_TABLE_NAME": "test-card-table",
+                         "CARDS_UPDATE_FREQUENCY": "7",
+                         "INGEST_TRACE_MEMORY": "true"})
+@mock_dynamodb
+def test_renew_cards_streams_compressed_bulk_file(requests_mock, aws_credentials):
+    # Arrange
+    with patch('boto3.client') as mock_client:
+        table = setup_table()
+        mock_client.return_value = MagicMock()
+
+        bulk_data_mock_response = {
+            "data": [
+                {"type": "default_cards",
+                 "download_uri": "https://data.scryfall.io/default-cards/default-cards-20240116100428.json"}
+            ]
+        }
+        with open('tests/integration/json_test_files/30_cards.json', 'rb') as file:
+            mock_file_content = gzip.compress(file.read())
+
+        requests_mock.get("https://api.scryfall.com/bulk-data", json=bulk_data_mock_response)
+        requests_mock.get("https://data.scryfall.io/default-cards/default-cards-20240116100428.json",
+                          content=mock_file_content, headers={"Content-Encoding": "gzip"})
+
+        # Act, without CARD_JSON_LOCATION the response is parsed while it downloads
+        os.environ.pop("CARD_JSON_LOCATION", None)
+        import functions.renew_entities.app
+        importlib.reload(functions.renew_entities.app)
+        functions.renew_entities.app.lambda_handler({}, {})
+
+        # Assert
+        cards = [item for item in table.scan()['Items'] if item['SK'].startswith('PrintId#')]
+        assert functions.renew_entities.app.local_filename is None
+        assert len(cards) == 30
+
+
+@patch.dict(os.environ, {"DISABLE_XRAY": "True",
+                         "EVENT_BUS_ARN": "",
+                         "DYNAMODB_TABLE_NAME": "test-card-table",
+                         "CARDS_UPDATE_FREQUENCY": "7",
+                         "AWS_LAMBDA_FUNCTION_NAME": "card-service-test-RenewEntitiesFunction"})
+@mock_dynamodb
+def test_renew_cards_emits_embedded_metrics(requests_mock, aws_credentials):
+    # Arrange
+    with patch('boto3.client') as mock_client:
+        setup_table()
+        mock_client.return_value = MagicMock()
+
+        bulk_data_mock_response = {
+            "data": [
+                {"type": "default_cards",
+                 "download_uri": "https://data.scryfall.io/default-cards/default-cards-20240116100428.json"}
+            ]
+        }
+        with open('tests/integration/json_test_files/30_cards.json', 'rb') as file:
+            mock_file_content = gzip.compress(file.read())
+
+        requests_mock.get("https://api.scryfall.com/bulk-data", json=bulk_data_mock_response)
+        requests_mock.get("https://data.scryfall.io/default-cards/default-cards-20240116100428.json",
+                          content=mock_file_content, headers={"Content-Encoding": "gzip"})
+
+        # Act
+        os.environ.pop("CARD_JSON_LOCATION", None)
+        import functions.renew_entities.app
+        importlib.reload(functions.renew_entities.app)
+        renew_entities = functions.renew_entities.app
+        metrics_handler = next(
+            handler for handler in renew_entities.logger.handlers
+            if handler.get_name() == renew_entities.EMBEDDED_METRICS_HANDLER_NAME
+        )
+        try:
+            with patch.object(metrics_handler, "emit") as emit_metrics:
+                renew_entities.lambda_handler({}, {})
+        finally:
+            renew_entities.logger.removeHandler(metrics_handler)
+
+        # Assert, a single EMF line with every metric it declares
+        emit_metrics.assert_called_once()
+        line = json.loads(metrics_handler.format(emit_metrics.call_args.args[0]))
+        directive = line["_aws"]["CloudWatchMetrics"][0]
+        assert directive["Namespace"] == "CardService/Ingest"
+        assert directive["Dimensions"] == [["Mode"]]
+        assert all(metric["Name"] in line for metric in directive["Metrics"])
+        assert line["Mode"] == "Ingest"
+        assert line["CardsParsed"] == 30
+        assert line["BytesDownloaded"] == len(mock_file_content)
+        assert line["ItemsWritten"] > 30
+        assert line["Batches"] == sum(line["BatchLatencyHistogram"].values())
+
+@patch.dict(os.environ, {"DISABLE_XRAY": "True",
+                         "EVENT_BUS_ARN": "",
+                         "DYNAMODB_TABLE_NAME": "test-card-table",
+                         "CARDS_UPDATE_FREQUENCY": "7"})
+@mock_dynamodb
+def test_renew_cards_skips_unchanged_bulk_file(requests_mock, aws_credentials):
+    # Arrange
+    with patch('boto3.client') as mock_client:
+        table = setup_table()
+        mock_client.return_value = MagicMock()
+
+        download_uri = "https://data.scryfall.io/default-cards/default-cards-20240116100428.json"
+        with open('tests/integration/json_test_files/30_cards.json', 'rb') as file:
+            mock_file_content = file.read()
+
+        def mock_bulk_data(updated_at):
+            requests_mock.get("https://api.scryfall.com/bulk-data", json={"data": [
+                {"type": "default_cards", "download_uri": download_uri,
+                 "updated_at": updated_at, "size": len(mock_file_content)}
+            ]})
+
+        mock_bulk_data("2024-01-16T10:04:28.000+00:00")
+        requests_mock.get(download_uri, content=mock_file_content, headers={"ETag": '"30-cards"'})
+        requests_mock.get(download_uri, status_code=304, request_headers={"If-None-Match": '"30-cards"'})
+
+        os.environ.pop("CARD_JSON_LOCATION", None)
+        import functions.renew_entities.app
+        importlib.reload(functions.renew_entities.app)
+        renew_entities = functions.renew_entities.app
+
+        def downloads():
+            return [request for request in requests_mock.request_history if request.url == download_uri]
+
+        # Act
+        first = renew_entities.lambda_handler({}, {})
+        generation = table.get_item(Key={'PK': 'IngestManifest', 'SK': 'Head'})['Item']['Generation']
+        unchanged = renew_entities.lambda_handler({}, {})
+        downloads_while_unchanged = len(downloads())
+
+        # Scryfall reports a new update of the same file, the conditional download tells it did not change
+        mock_bulk_data("2024-01-17T10:04:28.000+00:00")
+        not_modified = renew_entities.lambda_handler({}, {})
+        conditional_download = downloads()[-1]
+        head_after_not_modified = table.get_item(Key={'PK': 'IngestManifest', 'SK': 'Head'})['Item']
+
+        forced = renew_entities.lambda_handler({"Force": True}, {})
+
+        # Assert
+        assert first is True
+        assert unchanged == {"Skipped": True, "Generation": generation}
+        assert downloads_while_unchanged == 1
+        assert not_modified == {"Skipped": True, "Generation": generation}
+        assert conditional_download.headers["If-None-Match"] == '"30-cards"'
+        assert head_after_not_modified['Generation'] == generation
+        assert head_after_not_modified['BulkData'] == {
+            "DownloadUri": download_uri,
+            "UpdatedAt": "2024-01-17T10:04:28.000+00:00",
+            "Size": len(mock_file_content),
+            "ETag": '"30-cards"'
+        }
+        assert forced is True
+        # Without a condition on the ETag
+        assert len(downloads()) == 3
+        assert "If-None-Match" not in downloads()[-1].headers
+
+
+@patch.dict(os.environ, {"DISABLE_XRAY": "True",
+                         "DYNAMODB_TABLE_NAME": "test-card-table",
+                         "CARDS_UPDATE_FREQUENCY": "7"})
+@mock_dynamodb
+def test_batch_write_pipeline_retries_unprocessed_items(aws_credentials):
+    # Arrange
+    table = setup_table()
+    import functions.renew_entities.app
+    importlib.reload(functions.renew_entities.app)
+    renew_entities = functions.renew_entities.app
+    batch_write_item = renew_entities.dynamodb_client.batch_write_item
+    calls = []
+
+    def partially_processed_batch_write_item(RequestItems):
+        calls.append(RequestItems)
+        if len(calls) == 1:
+            # DynamoDB leaves the last items of the first batch unprocessed
+            requests = RequestItems['test-card-table']
+            batch_write_item(RequestItems={'test-card-table': requests[:-5]})
+            return {"UnprocessedItems": {'test-card-table': requests[-5:]}}
+        return batch_write_item(RequestItems=RequestItems)
+
+    # Act
+    with patch.object(renew_entities.dynamodb_client, "batch_write_item", partially_processed_batch_write_item), \
+            patch.object(write_rate, "BACKOFF_BASE_SECONDS", 0):
+        with renew_entities.BatchWritePipeline('test-card-table', 2) as writer:
+            for number in range(60):
+                writer.put({"PK": f"OracleId#{number}", "SK": f"PrintId#{number}"})
+        stats = writer.close()
+
+    # Assert
+    assert len(table.scan()['Items']) == 60
+    assert stats['Items'] == 60
+    assert stats['Batches'] == 3
+    assert renew_entities.get_write_controller('test-card-table').stats['Retries'] == 1
+    assert len(calls) == 4
+
+
+@patch.dict(os.environ, {"DISABLE_XRAY": "True",
+                         "DYNAMODB_TABLE_NAME": "test-card-table",
+                         "CARDS_UPDATE_FREQUENCY": "7"})
+@mock_dynamodb
+def test_write_rate_controller_backs_off_on_throttles(aws_credentials):
+    # Arrange
+    table = setup_table()
+    import functions.renew_entities.app
+    importlib.reload(functions.renew_entities.app)
+    renew_entities = functions.renew_entities.app
+    batch_write_item = renew_entities.dynamodb_client.batch_write_item
+    calls = []
+
+    def throttled_batch_write_item(RequestItems):
+        calls.append(RequestItems)
+        if len(calls) <= 2:
+            raise ClientError(
+                {"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "throttled"}}, "BatchWriteItem"
+            )
+        return batch_write_item(RequestItems=RequestItems)
+
+    controller = renew_entities.WriteRateController(renew_entities.dynamodb_client, 'test-card-table', budget=100)
+
+    # Act
+    with patch.object(renew_entities.dynamodb_client, "batch_write_item", throttled_batch_write_item), \
+            patch.object(write_rate, "BACKOFF_BASE_SECONDS", 0):
+        renew_entities.write_batch(controller, [{"PK": f"OracleId#{number}", "SK": "Summary"} for number in range(10)])
+
+    # Assert
+    assert len(table.scan()['Items']) == 10
+    assert len(calls) == 3
+    assert controller.stats['Throttles'] == 2
+    assert controller.stats['Retries'] == 2
+    # The budget caps the rate, the two throttles halved it twice before the success added to it again
+    assert controller.stats['HighestRate'] == 100
+    assert controller.stats['LowestRate'] == 25
+    assert controller.rate == 25 + write_rate.WRITE_RATE_INCREASE
+
+
+class LambdaContext:
+    """Runs out of time after the given amount of checks."""
+
+    function_name = "card-service-test-RenewEntitiesFunction"
+
+    def __init__(self, checks_with_time_left):
+        self.checks_with_time_left = checks_with_time_left
+
+    def get_remaining_time_in_millis(self):
+        self.checks_with_time_left -= 1
+        return 300_000 if self.checks_with_time_left >= 0 else 1_000
+
+
+@patch.dict(os.environ, {"DISABLE_XRAY": "True",
+                         "EVENT_BUS_ARN": "",
+                         "DYNAMODB_TABLE_NAME": "test-card-table",
+                         "CARDS_UPDATE_FREQUENCY": "7",
+                         "CARD_JSON_LOCATION": "tests/integration/checkpointed_cards.json"})
+@mock_dynamodb
+def test_renew_cards_continues_from_checkpoint(requests_mock, aws_credentials, tmp_path):
+    # Arrange
+    with patch('boto3.client') as mock_client, \
+            patch.dict(os.environ, {"SEARCH_SNAPSHOT_DIRECTORY": str(tmp_path)}):
+        table = setup_table()
+        mock_lambda = MagicMock()
+        mock_client.return_value = mock_lambda
+
+        bulk_data_mock_response = {
+            "data": [
+                {"type": "default_cards",
+                 "download_uri": "https://data.scryfall.io/default-cards/default-cards-20240116100428.json"}
+            ]
+        }
+        with open('tests/integration/json_test_files/30_cards.json', 'r') as file:
+            json_data = json.load(file)
+
+        requests_mock.get("https://api.scryfall.com/bulk-data", json=bulk_data_mock_response)
+        requests_mock.get("https://data.scryfall.io/default-cards/default-cards-20240116100428.json",
+                          content=json.dumps(json_data).encode('utf-8'))
+
+        import functions.renew_entities.app
+        importlib.reload(functions.renew_entities.app)
+
+        # Act, the first invocation runs out of time at the 13th card
+        first = functions.renew_entities.app.lambda_handler({}, LambdaContext(11))
+        checkpoint = table.get_item(Key={'PK': 'IngestCheckpoint', 'SK': 'Control'})['Item']
+        cards_before_continuation = [item for item in table.scan()['Items'] if item['SK'].startswith('PrintId#')]
+        continuation_event = json.loads(mock_lambda.invoke.call_args.kwargs['Payload'])
+        second = functions.renew_entities.app.lambda_handler(continuation_event, LambdaContext(1000))
+
+        # Assert
+        assert first == {"Continuation": True, "Generation": checkpoint['Generation'], "CardOrdinal": 12}
+        assert continuation_event == {"Continuation": True, "Generation": checkpoint['Generation']}
+        assert len(cards_before_continuation) == 12
+        assert second is True
+
+        items = table.scan()['Items']
+        cards = [item for item in items if item['SK'].startswith('PrintId#')]
+        summaries = [item for item in items if item['SK'] == 'Summary']
+        assert len(cards) == 30
+        assert len(summaries) == len({card['OracleId'] for card in cards})
+        assert sum(summary['PrintCount'] for summary in summaries) == 30
+        assert 'Item' not in table.get_item(Key={'PK': 'IngestCheckpoint', 'SK': 'Control'})
+        manifest_head = table.get_item(Key={'PK': 'IngestManifest', 'SK': 'Head'})['Item']
+        assert manifest_head['Generation'] == checkpoint['Generation']
+        assert manifest_head['PrintCount'] == 30
+        os.remove('tests/integration/checkpointed_cards.json')
+
+
+@patch.dict(os.environ, {"DISABLE_XRAY": "True",
+                         "EVENT_BUS_ARN": "",
+                         "DYNAMODB_TABLE_NAME": "test-card-table",
+                         "CARDS_UPDATE_FREQUENCY": "7",
+                         "CARD_JSON_LOCATION": "tests/integration/checkpointed_finish_cards.json"})
+@mock_dynamodb
+def test_renew_cards_continues_finish_from_checkpoint(requests_mock, aws_credentials, tmp_path):
+    # Arrange
+    with patch('boto3.client') as mock_client, \
+            patch.dict(os.environ, {"SEARCH_SNAPSHOT_DIRECTORY": str(tmp_path)}):
+        table = setup_table()
+        mock_lambda = MagicMock()
+        mock_client.return_value = mock_lambda
+
+        bulk_data_mock_response = {
+            "data": [
+                {"type": "default_cards",
+                 "download_uri": "https://data.scryfall.io/default-cards/default-cards-20240116100428.json"}
+            ]
+        }
+        with open('tests/integration/json_test_files/30_cards.json', 'r') as file:
+            json_data = json.load(file)
+
+        requests_mock.get("https://api.scryfall.com/bulk-data", json=bulk_data_mock_response)
+        bulk_file_mock = requests_mock.get(
+            "https://data.scryfall.io/default-cards/default-cards-20240116100428.json",
+            content=json.dumps(json_data).encode('utf-8')
+        )
+
+        import functions.renew_entities.app
+        importlib.reload(functions.renew_entities.app)
+
+        # Act, the first invocation reads every card and runs out of time after the summaries
+        first = functions.renew_entities.app.lambda_handler({}, LambdaContext(30))
+        checkpoint = table.get_item(Key={'PK': 'IngestCheckpoint', 'SK': 'Control'})['Item']
+        manifest_before_continuation = table.get_item(Key={'PK': 'IngestManifest', 'SK': 'Head'})
+        continuation_event = json.loads(mock_lambda.invoke.call_args.kwargs['Payload'])
+        second = functions.renew_entities.app.lambda_handler(continuation_event, LambdaContext(1000))
+
+        # Assert
+        assert first == {"Continuation": True, "Generation": checkpoint['Generation'], "FinishPhase": "SearchIndex"}
+        assert checkpoint['FinishPhase'] == "SearchIndex"
+        assert 'Item' not in manifest_before_continuation
+        assert second is True
+        assert bulk_file_mock.call_count == 1
+
+        summaries = [item for item in table.scan()['Items'] if item['SK'] == 'Summary']
+        assert sum(summary['PrintCount'] for summary in summaries) == 30
+        assert 'Item' not in table.get_item(Key={'PK': 'IngestCheckpoint', 'SK': 'Control'})
+        manifest_head = table.get_item(Key={'PK': 'IngestManifest', 'SK': 'Head'})['Item']
+        assert manifest_head['Generation'] == checkpoint['Generation']
+        assert manifest_head['PrintCount'] == 30
+        assert not list(tmp_path.glob('ingest-checkpoints/*/*'))
+        os.remove('tests/integration/checkpointed_finish_cards.json')
+
+
+@patch.dict(os.environ, {"DISABLE_XRAY": "True",
+                         "EVENT_BUS_ARN": "",
+                         "DYNAMODB_TABLE_NAME": "test-card-table",
+                         "CARDS_UPDATE_FREQUENCY": "7",
+                         "CARD_JSON_LOCATION": "tests/integration/sharded_reprints.json",
+                         "INGEST_SHARD_CARDS": "1"})
+@mock_dynamodb
+def test_renew_cards_fans_out_shards_to_workers(requests_mock, aws_credentials, tmp_path):
+    # Arrange
+    with patch('boto3.client') as mock_client, \
+            patch.dict(os.environ, {"SEARCH_SNAPSHOT_DIRECTORY": str(tmp_path)}):
+        table = setup_table()
+        mock_lambda = MagicMock()
+        mock_client.return_value = mock_lambda
+
+        bulk_data_mock_response = {
+            "data": [
+                {"type": "default_cards",
+                 "download_uri": "https://data.scryfall.io/default-cards/default-cards-20240116100428.json"}
+            ]
+        }
+        with open('tests/integration/json_test_files/reprints.json', 'r') as file:
+            json_data = json.load(file)
+        json_data[0]['prices']['eur'] = None
+        json_data[2]['prices']['eur'] = '0.02'
+
+        requests_mock.get("https://api.scryfall.com/bulk-data", json=bulk_data_mock_response)
+        requests_mock.get("https://data.scryfall.io/default-cards/default-cards-20240116100428.json",
+                          content=json.dumps(json_data).encode('utf-8'))
+
+        import functions.renew_entities.app
+        importlib.reload(functions.renew_entities.app)
+
+        # Act, the coordinator publishes a job per print and the workers run in reverse order
+        functions.renew_entities.app.lambda_handler({}, LambdaContext(1000))
+        jobs = [json.loads(call.kwargs['Payload']) for call in mock_lambda.invoke.call_args_list]
+        for job in reversed(jobs):
+            functions.renew_entities.app.lambda_handler(job, LambdaContext(1000))
+        # The worker of the last shard hands the finish to a continuation
+        continuation_event = json.loads(mock_lambda.invoke.call_args.kwargs['Payload'])
+        finished = functions.renew_entities.app.lambda_handler(continuation_event, LambdaContext(1000))
+
+        # Assert
+        assert [job['Shard'] for job in jobs] == [0, 1, 2]
+        assert continuation_event == {"Continuation": True, "Generation": jobs[0]['Generation']}
+        assert finished is True
+        assert 'Item' not in table.get_item(Key={'PK': 'IngestCheckpoint', 'SK': 'Control'})
+        summary = table.get_item(
+            Key={'PK': 'OracleId#44623693-51d6-49ad-8cd7-140505caf02f', 'SK': 'Summary'}
+        )['Item']
+        assert summary['LatestPrintId'] == '0000579f-7b35-4ed3-b44c-db2a538066f1'
+        assert summary['CheapestPrintId'] == '0000579f-7b35-4ed3-b44c-db2a538066f2'
+        assert summary['FirstReleasedAt'] == '2006-10-06'
+        assert summary['PrintCount'] == 3
+        assert table.get_item(Key={'PK': 'IngestManifest', 'SK': 'Head'})['Item']['PrintCount'] == 3
+        assert 'Item' not in table.get_item(Key={'PK': 'IngestShards', 'SK': f"Generation#{jobs[0]['Generation']}"})
+        assert not list(tmp_path.glob('ingest-shards/*/*'))
+        os.remove('tests/integration/sharded_reprints.json')
+
+
+@patch.dict(os.environ, {"DISABLE_XRAY": "True",
+                         "EVENT_BUS_ARN": "",
+                         "DYNAMODB_TABLE_NAME": "test-card-table",
+                         "CARDS_UPDATE_FREQUENCY": "7",
+                         "CARD_JSON_LOCATION": "tests/integration/sharded_cards.json",
+                         "INGEST_SHARD_CARDS": "7",
+                         "INGEST_LOCAL_WORKERS": "1"})
+@mock_dynamodb
+def test_renew_cards_runs_shards_locally(requests_mock, aws_credentials, tmp_path):
+    # Arrange
+    with patch('boto3.client') as mock_client, \
+            patch.dict(os.environ, {"SEARCH_SNAPSHOT_DIRECTORY": str(tmp_path)}):
+        table = setup_table()
+        mock_client.return_value = MagicMock()
+
+        bulk_data_mock_response = {
+            "data": [
+                {"type": "default_cards",
+                 "download_uri": "https://data.scryfall.io/default-cards/default-cards-20240116100428.json"}
+            ]
+        }
+        with open('tests/integration/json_test_files/30_cards.json', 'r') as file:
+            json_data = json.load(file)
+
+        requests_mock.get("https://api.scryfall.com/bulk-data", json=bulk_data_mock_response)
+        requests_mock.get("https://data.scryfall.io/default-cards/default-cards-20240116100428.json",
+                          content=json.dumps(json_data).encode('utf-8'))
+
+        # Act
+        import functions.renew_entities.app
+        importlib.reload(functions.renew_entities.app)
+        functions.renew_entities.app.lambda_handler({}, {})
+
+        # Assert
+        items = table.scan()['Items']
+        cards = [item for item in items if item['SK'].startswith('PrintId#')]
+        summaries = [item for item in items if item['SK'] == 'Summary']
+        assert len(cards) == 30
+        assert sum(summary['PrintCount'] for summary in summaries) == 30
+        assert table.get_item(Key={'PK': 'IngestManifest', 'SK': 'Head'})['Item']['PrintCount'] == 30
+        os.remove('tests/integration/sharded_cards.json')
+
+
+@patch.dict(os.environ, {"DISABLE_XRAY": "True",
+                         "EVENT_BUS_ARN": "",
+                         "DYNAMODB_TABLE_NAME": "test-card-table",
+                         "CARDS_UPDATE_FREQUENCY": "7",
+                         "CARD_JSON_LOCATION": "tests/integration/pooled_shards_cards.json",
+                         "INGEST_SHARD_CARDS": "7",
+                         "INGEST_LOCAL_WORKERS": "2"})
+@mock_dynamodb
+def test_renew_cards_runs_shards_in_process_pool(requests_mock, aws_credentials, tmp_path):
+    # Arrange
+    with patch('boto3.client') as mock_client, \
+            patch.dict(os.environ, {"SEARCH_SNAPSHOT_DIRECTORY": str(tmp_path)}):
+        table = setup_table()
+        mock_client.return_value = MagicMock()
+
+        bulk_data_mock_response = {
+            "data": [
+                {"type": "default_cards",
+                 "download_uri": "https://data.scryfall.io/default-cards/default-cards-20240116100428.json"}
+            ]
+        }
+        with open('tests/integration/json_test_files/30_cards.json', 'r') as file:
+            json_data = json.load(file)
+
+        requests_mock.get("https://api.scryfall.com/bulk-data", json=bulk_data_mock_response)
+        requests_mock.get("https://data.scryfall.io/default-cards/default-cards-20240116100428.json",
+                          content=json.dumps(json_data).encode('utf-8'))
+
+        # Act
+        import functions.renew_entities.app
+        importlib.reload(functions.renew_entities.app)
+        functions.renew_entities.app.lambda_handler({}, {})
+        # moto keeps the table in the memory of every process, none of the workers sees the shards of the others
+        # complete. The shard results are files, the finish runs here like in the worker of the last shard.
+        control = table.scan(FilterExpression=Key('PK').eq('IngestShards'))['Items'][0]
+        generation = control['SK'].split('#')[1]
+        shard_results = sorted(path.name for path in tmp_path.glob(f'ingest-shards/{generation}/*.result.json.gz'))
+        functions.renew_entities.app.finish_sharded_ingest(
+            generation, int(control['ShardCount']), None, control['BulkData'], None
+        )
+
+        # Assert
+        assert control['ShardCount'] == 5
+        assert shard_results == [f'{shard_number:04d}.result.json.gz' for shard_number in range(5)]
+        summaries = [item for item in table.scan()['Items'] if item['SK'] == 'Summary']
+        assert sum(summary['PrintCount'] for summary in summaries) == 30
+        assert table.get_item(Key={'PK': 'IngestManifest', 'SK': 'Head'})['Item']['PrintCount'] == 30
+        assert 'Item' not in table.get_item(Key={'PK': 'IngestShards', 'SK': control['SK']})
+        assert not list(tmp_path.glob('ingest-shards/*/*'))
+        os.remove('tests/integration/pooled_shards_cards.json')
+
+
+@patch.dict(os.environ, {"DISABLE_XRAY": "True",
+                         "EVENT_BUS_ARN": "",
+                         "DYNAMODB_TABLE_NAME": "test-card-table",
+                         "CARDS_UPDATE_FREQUENCY": "7",
+                         "CARD_JSON_LOCATION": "tests/integration/crashed_finish_cards.json",
+                         "INGEST_SHARD_CARDS": "7",
+                         "INGEST_LOCAL_WORKERS": "1"})
+@mock_dynamodb
+def test_renew_cards_retries_crashed_finish(requests_mock, aws_credentials, tmp_path):
+    # Arrange
+    with patch('boto3.client') as mock_client, \
+            patch.dict(os.environ, {"SEARCH_SNAPSHOT_DIRECTORY": str(tmp_path)}):
+        table = setup_table()
+        mock_client.return_value = MagicMock()
+
+        bulk_data_mock_response = {
+            "data": [
+                {"type": "default_cards",
+                 "download_uri": "https://data.scryfall.io/default-cards/default-cards-20240116100428.json"}
+            ]
+        }
+        with open('tests/integration/json_test_files/30_cards.json', 'r') as file:
+            json_data = json.load(file)
+
+        requests_mock.get("https://api.scryfall.com/bulk-data", json=bulk_data_mock_response)
+        requests_mock.get("https://data.scryfall.io/default-cards/default-cards-20240116100428.json",
+                          content=json.dumps(json_data).encode('utf-8'))
+
+        import functions.renew_entities.app
+        importlib.reload(functions.renew_entities.app)
+
+        # Act, the worker of the last shard crashes while it merges the shards
+        with patch.object(functions.renew_entities.app, 'merge_into_catalog', side_effect=RuntimeError("Crashed")):
+            with pytest.raises(RuntimeError):
+                functions.renew_entities.app.lambda_handler({}, {})
+        control = table.scan(FilterExpression=Key('PK').eq('IngestShards'))['Items'][0]
+        control_key = {'PK': control['PK'], 'SK': control['SK']}
+        released_control = table.get_item(Key=control_key)['Item']
+        last_shard = {"Shard": 4, "Generation": control_key['SK'].split('#')[1]}
+
+        # A retry while another worker holds the claim leaves the finish to that worker
+        table.update_item(Key=control_key, UpdateExpression="SET FinishingUntil = :until",
+                          ExpressionAttributeValues={":until": int(time.time()) + 900})
+        functions.renew_entities.app.lambda_handler(last_shard, {})
+        manifest_while_claimed = table.get_item(Key={'PK': 'IngestManifest', 'SK': 'Head'})
+
+        # A retry after the claim of a crashed worker expired finishes the ingest
+        table.update_item(Key=control_key, UpdateExpression="SET FinishingUntil = :until",
+                          ExpressionAttributeValues={":until": int(time.time()) - 1})
+        functions.renew_entities.app.lambda_handler(last_shard, {})
+
+        # A retry after the finish deleted the shards has nothing left to do
+        functions.renew_entities.app.lambda_handler(last_shard, {})
+
+        # Assert
+        assert released_control['CompletedShards'] == {0, 1, 2, 3, 4}
+        assert 'FinishingUntil' not in released_control
+        assert 'Item' not in manifest_while_claimed
+        assert table.get_item(Key={'PK': 'IngestManifest', 'SK': 'Head'})['Item']['PrintCount'] == 30
+        assert 'Item' not in table.get_item(Key=control_key)
+        assert not list(tmp_path.glob('ingest-shards/*/*'))
+        os.remove('tests/integration/crashed_finish_cards.json')
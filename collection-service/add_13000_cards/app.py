@@ -6,20 +6,23 @@ import logging
 import ijson
 import uuid
 import random
+from write_rate import BATCH_WRITE_ITEM_LIMIT, WriteRateController, write_batch
 
 if "DISABLE_XRAY" not in environ:
     patch_all()
 
 dynamodb = boto3.resource("dynamodb", "us-east-1")
+dynamodb_client = dynamodb.meta.client
 DYNAMODB_TABLE_NAME = os.getenv("DYNAMODB_TABLE_NAME")
 user_id = os.getenv("USERID")
 local_filename = os.getenv("CARD_JSON_LOCATION")
 
-table = dynamodb.Table(DYNAMODB_TABLE_NAME)
-
 LOGGER = logging.getLogger()
 LOGGER.setLevel("INFO")
 
+# Writes are paced by a WriteRateController, WRITE_CAPACITY_BUDGET caps it in write units per second
+WRITE_CAPACITY_BUDGET = int(os.getenv("WRITE_CAPACITY_BUDGET", "0")) or None
+
 
 def parse_card_item_from_own_lambda(item, user_id, condition):
     card_instance_id = str(uuid.uuid4())
@@ -119,19 +122,14 @@ def getCombinedLowerCaseOracleText(faces):
     return loweredText
 
 
-def writeBatchToDb(items, table):
-    with table.batch_writer() as batch:
-        for item in items:
-            batch.put_item(Item=item)
-
-def cutTheListAndPersist(item_list):
-    if len(item_list) < 25:
+def cutTheListAndPersist(item_list, controller):
+    if len(item_list) < BATCH_WRITE_ITEM_LIMIT:
         return item_list
 
-    to_be_persisted = item_list[:25]
-    to_be_continued = item_list[25:]
+    to_be_persisted = item_list[:BATCH_WRITE_ITEM_LIMIT]
+    to_be_continued = item_list[BATCH_WRITE_ITEM_LIMIT:]
 
-    writeBatchToDb(to_be_persisted, table)
+    write_batch(controller, to_be_persisted)
     return to_be_continued
 
 
@@ -175,6 +173,7 @@ def is_image_uri_missing(card):
 
 
 def lambda_handler(event, context):
+    controller = WriteRateController(dynamodb_client, DYNAMODB_TABLE_NAME, WRITE_CAPACITY_BUDGET)
     with open(f"{local_filename}", "rb") as file:
         LOGGER.info("Started the function")
         cards = ijson.items(file, "item")
@@ -218,16 +217,17 @@ def lambda_handler(event, context):
                 )
 
                 item_list.append(collection_card_info)
-                item_list = cutTheListAndPersist(item_list)
+                item_list = cutTheListAndPersist(item_list, controller)
                 card_counter += 1
             else:
                 LOGGER.info(f"Finished adding: {card_counter} cards, breaking")
                 break
 
-        item_list = cutTheListAndPersist(item_list)
+        item_list = cutTheListAndPersist(item_list, controller)
         if len(item_list) != 0:
             LOGGER.info(f"Persisting {len(item_list)} items")
-            writeBatchToDb(item_list, table)
+            write_batch(controller, item_list)
 
+        controller.log_summary()
         LOGGER.info(f"Finished!")
     return True
@@ -1,8 +1,12 @@
 import importlib
 from unittest.mock import patch
 import os
+import sys
 import logging
 
+# The function imports the shared modules from a Lambda layer, here they come from the sources of the layer
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common-service", "layers", "shared"))
+
 LOGGER = logging.getLogger()
 LOGGER.setLevel("INFO")
 
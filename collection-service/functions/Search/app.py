@@ -6,6 +6,7 @@ from jose import jwt
 from aws_xray_sdk.core import patch_all
 from os import environ
 from boto3.dynamodb.conditions import Key, Attr
+from http_responses import compress_response
 
 if "DISABLE_XRAY" not in environ:
     patch_all()
@@ -106,7 +107,7 @@ def lambda_handler(event, context):
 
     logger.info(f"All of the items returned: {items}")
 
-    return {
+    return compress_response(event, {
         "headers": {
             "Content-Type": "application/json",
         },
@@ -118,4 +119,5 @@ def lambda_handler(event, context):
                 "sk-last-evaluated": sk_last_evaluated,
             }
         ),
-    }
+    })
+
@@ -1,5 +1,7 @@
 import os
 import json
+import base64
+import gzip
 import logging
 from unittest.mock import patch
 from .jwt_generator import generate_test_jwt
@@ -169,3 +171,26 @@ def test_search_limit_2_start_at_second(setup_dynamodb_collection_with_three_ite
         body["Items"][1]["SK"] == "CardInstanceId#ed1387cd-0ff9-41fc-825c-1b1cdb6a52e1"
     )
     assert body["Items"][1]["OracleName"] == "Chicken Egg"
+
+
+def test_search_compresses_large_responses(setup_dynamodb_collection_with_multiple_items):
+    from functions.Search.app import lambda_handler
+
+    # Arrange
+    event = {
+        "headers": {
+            "Authorization": generate_test_jwt(),
+            "Accept": "application/vnd.mtg+json",
+            "Accept-Encoding": "gzip, deflate",
+        },
+    }
+
+    # Act
+    result = lambda_handler(event, None)
+
+    # Assert
+    assert result["isBase64Encoded"] is True
+    assert result["headers"]["Content-Encoding"] == "gzip"
+    assert result["headers"]["Vary"] == "Accept, Accept-Encoding"
+    body = json.loads(gzip.decompress(base64.b64decode(result["body"])))
+    assert body["Items"][1]["OracleName"] == "Chicken Egg"
@@ -0,0 +1,94 @@
+import base64
+import gzip
+from os import environ
+
+try:
+    import brotli
+except ImportError:
+    # brotli is optional, without it responses are only compressed with gzip
+    brotli = None
+
+# The only binary media type of the APIs, it has to match x-amazon-apigateway-binary-media-types of their swagger specs.
+# API Gateway only decodes a base64 body when the first media type of Accept is binary, so a client opts in to
+# compressed bodies by sending it first. Request bodies never use it and reach the handlers as text.
+BINARY_MEDIA_TYPE = "application/vnd.mtg+json"
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def get_header(event, name):
+    # API Gateway passes the header names the way the client sent them
+    for header_name, value in (event.get("headers") or {}).items():
+        if header_name.lower() == name.lower():
+            return value
+    return None
+
+
+def accepts_binary(event):
+    accept = get_header(event, "Accept") or ""
+    return accept.split(",")[0].split(";")[0].strip().lower() == BINARY_MEDIA_TYPE
+
+
+def get_accepted_encoding(event):
+    """The best encoding of Accept-Encoding that can be produced, None when the body is sent as it is."""
+    qualities = {}
+    for part in (get_header(event, "Accept-Encoding") or "").split(","):
+        coding, _, parameters = part.partition(";")
+        quality = 1.0
+        parameter_name, _, parameter_value = parameters.strip().partition("=")
+        if parameter_name.strip().lower() == "q":
+            try:
+                quality = float(parameter_value)
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    if brotli is not None and qualities.get("br", 0) > 0:
+        return "br"
+    if qualities.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def get_content_encoding(event, body):
+    """The encoding compress_response gives the body for this request, None when the body is sent as it is."""
+    # Bodies below the threshold grow from the encoding overhead
+    if not body or len(body) < int(environ.get("COMPRESSION_MIN_BYTES", "1024")):
+        return None
+    return get_accepted_encoding(event) if accepts_binary(event) else None
+
+
+def get_encoded_etag(etag, encoding):
+    # A strong ETag belongs to one representation, the compressed body gets its own
+    return f'{etag[:-1]}-{encoding}"' if encoding is not None else etag
+
+
+def compress_response(event, response, body_key="body"):
+    """Compresses a body of at least COMPRESSION_MIN_BYTES with the encoding the client accepts.
+
+    API Gateway decodes the base64 body and sends the compressed bytes with the Content-Encoding header,
+    which it only does for clients that accept the binary media type.
+    """
+    body = response.get(body_key)
+    if not body or len(body) < int(environ.get("COMPRESSION_MIN_BYTES", "1024")):
+        return response
+
+    # Caches have to keep the encodings apart, also when this client gets the body as it is
+    headers = {**response.get("headers", {}), "Vary": "Accept, Accept-Encoding"}
+    encoding = get_content_encoding(event, body)
+    if encoding is None:
+        return {**response, "headers": headers}
+
+    data = body.encode("utf-8")
+    compressed = brotli.compress(data, quality=BROTLI_QUALITY) if encoding == "br" else gzip.compress(
+        data, compresslevel=GZIP_LEVEL
+    )
+    headers["Content-Encoding"] = encoding
+    if "ETag" in headers:
+        headers["ETag"] = get_encoded_etag(headers["ETag"], encoding)
+    return {
+        **response,
+        "headers": headers,
+        body_key: base64.b64encode(compressed).decode("ascii"),
+        "isBase64Encoded": True,
+    }
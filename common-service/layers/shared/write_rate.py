@@ -0,0 +1,119 @@
+import json
+import logging
+import math
+import random
+import threading
+import time
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+BATCH_WRITE_ITEM_LIMIT = 25
+# UnprocessedItems are retried with exponential backoff and full jitter
+MAX_BATCH_RETRIES = 8
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_MAX_SECONDS = 2.0
+# Writes are paced by an AIMD controller per table, a budget caps it in write units per second
+WRITE_RATE_INITIAL = 500
+WRITE_RATE_MIN = 25
+WRITE_RATE_MAX = 40_000
+WRITE_RATE_INCREASE = 5
+WRITE_RATE_DECREASE = 0.5
+THROTTLING_ERROR_CODES = {"ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded"}
+
+
+class WriteRateController:
+    """Paces the writes to a table with a token bucket of write units, its rate follows AIMD.
+
+    Every batch that is written completely raises the rate by WRITE_RATE_INCREASE write units per second,
+    a throttled request or unprocessed items multiply it by WRITE_RATE_DECREASE. The rate stays within
+    the budget of write units per second when there is one. The latencies of the requests are kept in ms.
+    """
+
+    def __init__(self, client, table_name, budget=None):
+        self.client = client
+        self.table_name = table_name
+        self.max_rate = budget or WRITE_RATE_MAX
+        self.rate = min(WRITE_RATE_INITIAL, self.max_rate)
+        self.tokens = self.rate
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.stats = {
+            "Items": 0, "WriteUnits": 0, "Batches": 0, "Throttles": 0, "Retries": 0, "WaitedSeconds": 0.0,
+            "LowestRate": self.rate, "HighestRate": self.rate
+        }
+
+    def acquire(self, write_units):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                # A request larger than the bucket only waits for a full bucket, the tokens go negative after it
+                if self.tokens >= min(write_units, self.rate):
+                    self.tokens -= write_units
+                    self.stats["WriteUnits"] += write_units
+                    return
+                wait = (min(write_units, self.rate) - self.tokens) / self.rate
+                self.stats["WaitedSeconds"] += wait
+            time.sleep(wait)
+
+    def add_latency(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds * 1000)
+
+    def on_success(self, item_count):
+        with self.lock:
+            self.stats["Items"] += item_count
+            self.stats["Batches"] += 1
+            self.rate = min(self.max_rate, self.rate + WRITE_RATE_INCREASE)
+            self.stats["HighestRate"] = max(self.stats["HighestRate"], self.rate)
+
+    def on_throttle(self):
+        with self.lock:
+            self.stats["Throttles"] += 1
+            self.rate = max(WRITE_RATE_MIN, self.rate * WRITE_RATE_DECREASE)
+            self.tokens = min(self.tokens, 0)
+            self.stats["LowestRate"] = min(self.stats["LowestRate"], self.rate)
+
+    def log_summary(self):
+        logger.info(
+            f"Wrote {self.stats['WriteUnits']} write units in {self.stats['Batches']} batches to {self.table_name}, "
+            f"{self.stats['Throttles']} throttles, {self.stats['Retries']} retries, waited {self.stats['WaitedSeconds']:.1f} s "
+            f"for capacity, the rate went from {self.stats['LowestRate']:.0f} to {self.stats['HighestRate']:.0f} WCU/s"
+        )
+
+
+def estimate_write_units(item):
+    # A put costs a write unit per started KB of the item, the json size is close to the DynamoDB item size
+    return math.ceil(len(json.dumps(item, default=str).encode("utf-8")) / 1024)
+
+
+def write_batch(controller, items):
+    """BatchWriteItem of at most 25 items, throttled requests and unprocessed items are retried with jittered backoff."""
+    put_requests = [{"PutRequest": {"Item": item}} for item in items]
+    for attempt in range(MAX_BATCH_RETRIES + 1):
+        controller.acquire(sum(estimate_write_units(request["PutRequest"]["Item"]) for request in put_requests))
+        started_at = time.perf_counter()
+        try:
+            response = controller.client.batch_write_item(RequestItems={controller.table_name: put_requests})
+            put_requests = response.get("UnprocessedItems", {}).get(controller.table_name)
+        except ClientError as error:
+            if error.response["Error"]["Code"] not in THROTTLING_ERROR_CODES:
+                raise
+        finally:
+            controller.add_latency(time.perf_counter() - started_at)
+        if not put_requests:
+            controller.on_success(len(items))
+            return
+
+        controller.on_throttle()
+        if attempt < MAX_BATCH_RETRIES:
+            with controller.lock:
+                controller.stats["Retries"] += 1
+            time.sleep(random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)))
+
+    raise RuntimeError(
+        f"{len(put_requests)} items of {controller.table_name} were still unprocessed after {MAX_BATCH_RETRIES} retries"
+    )
@@ -8,7 +8,6 @@ from aws_xray_sdk.core import patch_all
 import logging
 from typing import Optional, Tuple
 import requests
-from datetime import datetime
 
 if 'DISABLE_XRAY' not in environ:
     patch_all()
@@ -120,10 +119,12 @@ def parse_body(unparsed_body: str) -> Tuple[Optional[dict], Optional[dict]]:
 
 def get_card(bearer_token: str, oracle_id: str, print_id: Optional[str] = None) -> Optional[dict]:
     url = f"{CARD_GATEWAY}/api/cards/{oracle_id}/{print_id}/" if print_id is not None else f"{CARD_GATEWAY}/api/cards/{oracle_id}/"
+    # Without a print the card service picks the most recent print of the oracle
+    params = { "select": "latest" } if print_id is None else None
 
-    LOGGER.info(f"Fetching card(s) from '{url}'")
+    LOGGER.info(f"Fetching card from '{url}'")
 
-    response = requests.get(url, headers={
+    response = requests.get(url, params=params, headers={
         "Authorization": bearer_token,
     })
 
@@ -146,15 +147,9 @@ def get_card(bearer_token: str, oracle_id: str, print_id: Optional[str] = None)
 
         return response_body
 
-    sorted_items = sorted(
-        response_body["Items"],
-        key=lambda item: datetime.strptime( item["ReleasedAt"], "%Y-%m-%d" ).timestamp(),
-        reverse=True,
-    )
-
     LOGGER.info(f"Found card with oracle id '{oracle_id}'")
 
-    return next( iter(sorted_items), None )
+    return next( iter(response_body["Items"]), None )
 
 def lambda_handler(event, context):
     LOGGER.info("Starting add card to deck lambda")
@@ -8,7 +8,7 @@ import time
 from jose import jwt
 import unittest
 import responses
-from typing import List
+from responses import matchers
 
 # Card oracles {{{
 CARD_ORACLE_1 = lambda oracle_id: {
@@ -153,19 +153,6 @@ CARD_ORACLE_5 = lambda oracle_id: {
 }
 # }}}
 
-def get_mock_card_oracles_response(oracle_id: str) -> List[dict]:
-    return { # {{{
-        "Items": [
-            # Sort in random order
-            CARD_ORACLE_3(oracle_id),
-            CARD_ORACLE_2(oracle_id),
-            CARD_ORACLE_5(oracle_id),
-            CARD_ORACLE_4(oracle_id),
-            CARD_ORACLE_1(oracle_id),
-        ]
-    }
-    # }}}
-
 @mock_dynamodb
 @mock_ssm
 class TestCreateDeck(unittest.TestCase):
@@ -279,11 +266,13 @@ class TestCreateDeck(unittest.TestCase):
         deck_id = "some-deck-id"
         card_location = self.sut.AVAILABLE_DECK_LOCATIONS[0]
 
+        # The card service picks the most recent print of the oracle
         get_cards_by_oracle_request = responses.add(
             responses.GET,
             f"{self.CARD_ENDPOINT}/api/cards/{oracle_id}/",
             status=200,
-            json=get_mock_card_oracles_response(oracle_id),
+            json={"Items": [CARD_ORACLE_5(oracle_id)]},
+            match=[matchers.query_param_matcher({"select": "latest"})],
         )
 
         mock_event = {